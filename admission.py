@@ -0,0 +1,98 @@
+"""上流（Supabase Auth）呼び出しの同時実行数制限と負荷遮断。
+
+上流が遅くなったときに全スレッドが _verify_token で詰まり、gunicorn のバックログで
+見えないまま待たされるのを防ぐ。枠が空くまで短時間だけ待ち、それでも取れなければ
+UpstreamOverloaded を投げて 503 + Retry-After で即座に返す。
+上流を呼ばないリクエスト（公開パス・検証済み Cookie）はこの制限を通らない。
+
+PostgREST（データ）の問い合わせは POSTGREST の別枠で制限する。並列取得・同期・プリフェッチが
+枠を使い切っても、認証（UPSTREAM）の呼び出しは待たされない。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from metrics import Counter, Gauge, Histogram
+
+MAX_CONCURRENCY = int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "8"))
+MAX_WAITING = int(os.environ.get("UPSTREAM_MAX_WAITING", str(MAX_CONCURRENCY * 2)))
+QUEUE_WAIT_SECONDS = float(os.environ.get("UPSTREAM_QUEUE_WAIT_MS", "250")) / 1000.0
+RETRY_AFTER_SECONDS = int(os.environ.get("UPSTREAM_RETRY_AFTER", "2"))
+POSTGREST_MAX_CONCURRENCY = int(os.environ.get("POSTGREST_MAX_CONCURRENCY", "16"))
+POSTGREST_MAX_WAITING = int(os.environ.get("POSTGREST_MAX_WAITING", str(POSTGREST_MAX_CONCURRENCY * 4)))
+POSTGREST_QUEUE_WAIT_SECONDS = float(os.environ.get("POSTGREST_QUEUE_WAIT_MS", "1000")) / 1000.0
+
+REJECTIONS = Counter(
+    "upstream_admission_rejections_total",
+    "Upstream calls rejected by admission control (queue_full, timeout)",
+    ("call", "reason"),
+)
+QUEUE_WAIT = Histogram(
+    "upstream_admission_wait_seconds",
+    "Time spent waiting for an upstream slot",
+    ("call",),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+class UpstreamOverloaded(Exception):
+    """上流の同時実行枠が取れなかった（503 を返す）。"""
+
+    def __init__(self, call: str, reason: str):
+        super().__init__(f"upstream overloaded: call={call} reason={reason}")
+        self.call = call
+        self.reason = reason
+        self.retry_after = RETRY_AFTER_SECONDS
+
+
+class AdmissionLimiter:
+    def __init__(self, name: str, max_concurrency: int, max_waiting: int, wait_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.wait_seconds = wait_seconds
+        self._sem = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        Gauge(f"{name}_in_flight", "Upstream calls in progress", func=lambda: self.in_flight)
+        Gauge(f"{name}_waiting", "Requests waiting for an upstream slot", func=lambda: self.waiting)
+
+    def _acquire(self, call: str) -> None:
+        if self._sem.acquire(blocking=False):
+            QUEUE_WAIT.observe(0.0, call=call)
+            return
+        with self._lock:
+            if self.waiting >= self.max_waiting:
+                REJECTIONS.inc(call=call, reason="queue_full")
+                raise UpstreamOverloaded(call, "queue_full")
+            self.waiting += 1
+        started = time.perf_counter()
+        try:
+            acquired = self._sem.acquire(timeout=self.wait_seconds)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        QUEUE_WAIT.observe(time.perf_counter() - started, call=call)
+        if not acquired:
+            REJECTIONS.inc(call=call, reason="timeout")
+            raise UpstreamOverloaded(call, "timeout")
+
+    @contextmanager
+    def slot(self, call: str) -> Iterator[None]:
+        self._acquire(call)
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._sem.release()
+
+
+UPSTREAM = AdmissionLimiter("upstream", MAX_CONCURRENCY, MAX_WAITING, QUEUE_WAIT_SECONDS)
+POSTGREST = AdmissionLimiter(
+    "postgrest", POSTGREST_MAX_CONCURRENCY, POSTGREST_MAX_WAITING, POSTGREST_QUEUE_WAIT_SECONDS
+)
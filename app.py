@@ -3,12 +3,16 @@ import secrets
 import urllib.parse
 import hashlib
 import base64
+import json
+import math
+import threading
+import time
 from typing import Optional
 
 import requests
-from dotenv import load_dotenv
 from flask import (
     Flask,
+    Response,
     g,
     make_response,
     redirect,
@@ -17,43 +21,69 @@ from flask import (
 )
 from dash import Dash, html
 
-# ローカル起動時に .env を読み込む（Render等の環境変数は上書きしない）
-PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
-DOTENV_PATH = os.path.join(PROJECT_ROOT, ".env")
-load_dotenv(dotenv_path=DOTENV_PATH, override=False)
-
+# .env は settings の import 時に読み込む。各モジュールは import 時に環境変数を読むので最初に置く
+import settings
+
+import admission
+import authz
+import background_callbacks
+import callback_coalescer
+import callback_profiler
+import callback_scheduler
+import debug_profiler
+import event_bus
+import health
+import metrics
+import prefetch
+import rate_limit
+import server_timing
+import task_queue
+import traffic_recorder
+import verified_cookie
+from worker_state import on_post_fork
+
+# 設定（.env の読み込みと検証）は settings.py。SIGHUP で settings.SETTINGS が差し替わるため、
+# モジュール変数にコピーせず毎回 settings.SETTINGS から読む
 app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "change-me")
-
-# 環境変数
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_KEY = os.environ.get("SUPABASE_ANON_KEY") or os.environ.get("SUPABASE_KEY", "")
-APP_BASE_URL = (os.environ.get("APP_BASE_URL") or "http://127.0.0.1:8000").rstrip("/")
-
-COOKIE_SECURE = os.environ.get("COOKIE_SECURE", "false").lower() == "true"
-COOKIE_SAMESITE = os.environ.get("COOKIE_SAMESITE", "Lax")
-COOKIE_DOMAIN = os.environ.get("COOKIE_DOMAIN") or None
+app.secret_key = os.environ.get("SECRET_KEY") or settings.DEFAULT_SECRET_KEY
 
 AUTH_COOKIE = "sb-access-token"
 REFRESH_COOKIE = "sb-refresh-token"
 STATE_COOKIE = "sb-oauth-state"
 CODE_VERIFIER_COOKIE = "sb-pkce-verifier"
 APP_STATE_COOKIE = "app-oauth-state"
+VERIFIED_COOKIE = "sb-verified"
 
+AUTH_VERIFICATIONS = metrics.Counter(
+    "auth_verifications_total",
+    "Access token checks by result (cookie, upstream, failed)",
+    ("result",),
+)
 
-def _auth_debug_enabled() -> bool:
-    return os.environ.get("AUTH_DEBUG", "").strip().lower() in {"1", "true", "yes"}
 
+# Supabase への HTTP 接続はプロセス単位で使い回す（fork 後はワーカーごとに作り直す）
+_http_lock = threading.Lock()
+_http: Optional[requests.Session] = None
 
-def _cookie_kwargs(http_only: bool = True, max_age: Optional[int] = None) -> dict:
-    return {
-        "httponly": http_only,
-        "secure": COOKIE_SECURE,
-        "samesite": COOKIE_SAMESITE,
-        "domain": COOKIE_DOMAIN,
-        "path": "/",
-        **({"max_age": max_age} if max_age is not None else {}),
-    }
+
+def _http_session() -> requests.Session:
+    global _http
+    if _http is None:
+        with _http_lock:
+            if _http is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http = session
+    return _http
+
+
+@on_post_fork
+def _reset_http_session() -> None:
+    # master から引き継いだソケットをワーカー間で共有しないよう破棄する
+    global _http
+    _http = None
 
 
 def _pkce_verifier() -> str:
@@ -99,45 +129,131 @@ def _build_authorize_url(base_url: str, code_challenge: str, app_state: str) ->
         "code_challenge": code_challenge,
         "code_challenge_method": "S256",
     }
-    return f"{SUPABASE_URL}/auth/v1/authorize?{urllib.parse.urlencode(params)}"
+    query = urllib.parse.urlencode(params)
+    return f"{settings.SETTINGS.supabase_url}/auth/v1/authorize?{query}"
 
 
 def _supabase_auth_post(path: str, payload: dict) -> requests.Response:
     """Supabase Auth REST API 呼び出し（POST）。"""
-    url = f"{SUPABASE_URL}{path}"
+    cfg = settings.SETTINGS
+    url = f"{cfg.supabase_url}{path}"
     headers = {
-        "apikey": SUPABASE_KEY,
+        "apikey": cfg.supabase_key,
         "Content-Type": "application/json",
     }
-    resp = requests.post(url, json=payload, headers=headers, timeout=10)
+    with server_timing.span("upstream"):
+        resp = _http_session().post(url, json=payload, headers=headers, timeout=10)
     return resp
 
 
+def _supabase_logout(access_token: str) -> requests.Response:
+    """Supabase Auth のセッション（リフレッシュトークン）を失効させる。"""
+    cfg = settings.SETTINGS
+    headers = {
+        "apikey": cfg.supabase_key,
+        "Authorization": f"Bearer {access_token}",
+    }
+    with server_timing.span("upstream"):
+        return _http_session().post(
+            f"{cfg.supabase_url}/auth/v1/logout?scope=local", headers=headers, timeout=10
+        )
+
+
+def _revoke_session(access_token: str, refresh_token: Optional[str]) -> None:
+    """バックグラウンドで実行する。上流の 5xx / 通信エラーは再試行させる。"""
+    try:
+        resp = _supabase_logout(access_token)
+        if resp.status_code in (401, 403) and refresh_token:
+            # アクセストークンが期限切れなら refresh してから失効させる
+            refreshed = _supabase_auth_post(
+                "/auth/v1/token?grant_type=refresh_token", {"refresh_token": refresh_token}
+            )
+            if refreshed.status_code >= 500:
+                raise task_queue.RetryableError(f"refresh status={refreshed.status_code}")
+            if refreshed.status_code >= 400:
+                return  # refresh token も無効（失効済み）
+            resp = _supabase_logout(refreshed.json().get("access_token", ""))
+    except requests.RequestException as exc:
+        raise task_queue.RetryableError(str(exc)) from exc
+    if resp.status_code >= 500:
+        raise task_queue.RetryableError(f"logout status={resp.status_code}")
+    if resp.status_code >= 400 and settings.SETTINGS.auth_debug:
+        print(f"[AUTH_DEBUG] revoke_session status={resp.status_code}")
+
+
+def _write_audit_event(entry: dict, access_token: str) -> None:
+    cfg = settings.SETTINGS
+    headers = {
+        "apikey": cfg.supabase_key,
+        "Authorization": f"Bearer {access_token}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal",
+    }
+    try:
+        resp = _http_session().post(
+            f"{cfg.supabase_url}/rest/v1/{cfg.audit_table}", json=entry, headers=headers, timeout=10
+        )
+    except requests.RequestException as exc:
+        raise task_queue.RetryableError(str(exc)) from exc
+    if resp.status_code >= 500:
+        raise task_queue.RetryableError(f"audit status={resp.status_code}")
+    if resp.status_code >= 400:
+        print(f"[AUDIT] insert failed status={resp.status_code}")
+
+
+def _audit(event: str, user: Optional[dict], access_token: Optional[str] = None, **fields) -> None:
+    """監査イベントをログに出し、AUDIT_TABLE があればバックグラウンドで書き込む。"""
+    entry = {
+        "event": event,
+        "user_id": (user or {}).get("id"),
+        "ts": time.time(),
+        **fields,
+    }
+    print(f"[AUDIT] {json.dumps(entry, ensure_ascii=False)}")
+    if settings.SETTINGS.audit_table and access_token:
+        task_queue.submit(_write_audit_event, entry, access_token, task_name="audit")
+
+
 def _set_session_cookies(
     resp, access_token: str, refresh_token: Optional[str], expires_in: Optional[int]
 ) -> None:
-    resp.set_cookie(
-        AUTH_COOKIE, access_token, **_cookie_kwargs(http_only=True, max_age=expires_in)
-    )
+    cookie = settings.SETTINGS.http_only_cookie
+    resp.set_cookie(AUTH_COOKIE, access_token, max_age=expires_in, **cookie)
     if refresh_token:
-        resp.set_cookie(REFRESH_COOKIE, refresh_token, **_cookie_kwargs(http_only=True))
+        resp.set_cookie(REFRESH_COOKIE, refresh_token, **cookie)
 
 
 def _clear_session_cookies(resp) -> None:
-    resp.set_cookie(AUTH_COOKIE, "", **_cookie_kwargs(http_only=True, max_age=0))
-    resp.set_cookie(REFRESH_COOKIE, "", **_cookie_kwargs(http_only=True, max_age=0))
+    cookie = settings.SETTINGS.http_only_cookie
+    resp.set_cookie(AUTH_COOKIE, "", max_age=0, **cookie)
+    resp.set_cookie(REFRESH_COOKIE, "", max_age=0, **cookie)
+    resp.set_cookie(VERIFIED_COOKIE, "", max_age=0, **cookie)
+
+
+def _set_verified_cookie(resp, access_token: str, user: dict) -> None:
+    cfg = settings.SETTINGS
+    if cfg.auth_verified_ttl <= 0 or not settings.secret_key_configured(app.secret_key):
+        return
+    value = verified_cookie.sign(app.secret_key, access_token, user, cfg.auth_verified_ttl)
+    resp.set_cookie(
+        VERIFIED_COOKIE, value, max_age=cfg.auth_verified_ttl, **cfg.http_only_cookie
+    )
 
 
 def _verify_token(access_token: str):
     """Supabase Auth で検証し、ユーザー情報を返す。失敗時は None."""
+    cfg = settings.SETTINGS
     try:
         headers = {
-            "apikey": SUPABASE_KEY,
+            "apikey": cfg.supabase_key,
             "Authorization": f"Bearer {access_token}",
         }
-        resp = requests.get(f"{SUPABASE_URL}/auth/v1/user", headers=headers, timeout=10)
+        with admission.UPSTREAM.slot("verify_token"), server_timing.span("upstream"):
+            resp = _http_session().get(
+                f"{cfg.supabase_url}/auth/v1/user", headers=headers, timeout=10
+            )
         if resp.status_code >= 400:
-            if _auth_debug_enabled():
+            if cfg.auth_debug:
                 body = resp.text
                 trimmed = body[:200] + ("..." if len(body) > 200 else "")
                 print(
@@ -145,12 +261,32 @@ def _verify_token(access_token: str):
                 )
             return None
         return resp.json()  # /auth/v1/user はトップレベルが user オブジェクト
+    except admission.UpstreamOverloaded:
+        # 混雑は「未ログイン」ではないので、ログイン画面に飛ばさず 503 にする
+        raise
     except Exception as exc:
-        if _auth_debug_enabled():
+        if settings.SETTINGS.auth_debug:
             print(f"[AUTH_DEBUG] verify_token exception: {exc}")
         return None
 
 
+def _is_admin(user) -> bool:
+    """ADMIN_EMAILS に含まれるか、app_metadata.role(s) に admin を持つユーザー。"""
+    return "admin" in authz.roles_for(user)
+
+
+# /healthz・/readyz は WSGI の入口で返し、認証・リクエストフック・Dash を通さない
+health.init_app(app)
+# 認証・上流 HTTP・コールバック・シリアライズの内訳を Server-Timing ヘッダで返す
+server_timing.init_app(app, _is_admin)
+# PKCE 生成・トークン交換の前に IP ごと／全体のトークンバケットで制限する（超過は 429）
+rate_limit.init_app(app, ["/auth/login", "/auth/callback"])
+# TRAFFIC_RECORD_PATH を設定すると匿名化したリクエストのメタデータを JSONL に記録する
+traffic_recorder.init_app(app)
+# ログイン直後に登録済みのウォームアップ（データセットの同期等）をバックグラウンドで流す
+prefetch.init_app(app)
+
+
 def _is_public_path(path: str) -> bool:
     return path.startswith(
         (
@@ -171,7 +307,7 @@ def _is_public_path(path: str) -> bool:
 @app.before_request
 def _require_auth():
     # Debug出力（シークレットは出さない）
-    if _auth_debug_enabled() and request.path in {
+    if settings.SETTINGS.auth_debug and request.path in {
         "/",
         "/auth/callback",
         "/logout",
@@ -196,20 +332,57 @@ def _require_auth():
     if _is_public_path(request.path):
         return None
 
+    # Prometheus 等のスクレイパーは METRICS_TOKEN で通す（ログイン済みユーザーも閲覧可）
+    if request.path == "/metrics" and metrics.token_ok(request.headers.get("Authorization")):
+        return None
+
     access_token = request.cookies.get(AUTH_COOKIE)
     if not access_token:
         return redirect("/login")
 
-    user = _verify_token(access_token)
+    with server_timing.span("auth"):
+        # 検証済み Cookie がこのトークンに対して有効なら上流に問い合わせない
+        user = None
+        if settings.SETTINGS.auth_verified_ttl > 0:
+            user = verified_cookie.verify(
+                app.secret_key, request.cookies.get(VERIFIED_COOKIE), access_token
+            )
+        if user:
+            AUTH_VERIFICATIONS.inc(result="cookie")
+        else:
+            user = _verify_token(access_token)
+            if user:
+                AUTH_VERIFICATIONS.inc(result="upstream")
+                g.issue_verified_cookie = True
     if not user:
+        AUTH_VERIFICATIONS.inc(result="failed")
         resp = make_response(redirect("/login"))
         _clear_session_cookies(resp)
         return resp
 
     g.user = user
+    # postgrest.py 等がユーザーの権限（RLS）で Supabase を呼ぶときに使う
+    g.access_token = access_token
+    # パス／ロールのポリシー（authz.py）で認可する。JWT クレームのみで判定し上流は呼ばない
+    if not authz.POLICY.allows(request.path, request.method, authz.current_roles()):
+        return "Forbidden", 403
     return None
 
 
+@app.after_request
+def _issue_verified_cookie(resp):
+    if g.get("issue_verified_cookie") and g.get("user"):
+        _set_verified_cookie(resp, request.cookies.get(AUTH_COOKIE, ""), g.user)
+    return resp
+
+
+@app.errorhandler(admission.UpstreamOverloaded)
+def _upstream_overloaded(exc: admission.UpstreamOverloaded):
+    resp = make_response("Service busy. Please retry shortly.", 503)
+    resp.headers["Retry-After"] = str(exc.retry_after)
+    return resp
+
+
 @app.route("/login")
 def login_page():
     # シンプルなログインページ
@@ -235,12 +408,11 @@ def login_page():
 
 @app.route("/auth/login")
 def auth_login():
-    if not SUPABASE_URL or not SUPABASE_KEY:
+    cfg = settings.SETTINGS
+    if not cfg.supabase_url or not cfg.supabase_key:
         return "SUPABASE_URL / SUPABASE_KEY (ANON) が未設定です", 500
-    try:
-        base_url = APP_BASE_URL
-    except Exception as exc:
-        return f"APP_BASE_URL invalid: {exc}", 400
+    # APP_BASE_URL の形式は起動時に settings.py で検証済み
+    base_url = cfg.app_base_url
 
     app_state = secrets.token_urlsafe(32)
     verifier = _pkce_verifier()
@@ -252,16 +424,10 @@ def auth_login():
 
     resp = make_response(redirect(url))
     # app_state / redirect は JS から見えても機密でないため HttpOnly=False
-    resp.set_cookie(
-        APP_STATE_COOKIE, app_state, **_cookie_kwargs(http_only=False, max_age=600)
-    )
-    resp.set_cookie(
-        "redirect_to", redirect_to, **_cookie_kwargs(http_only=False, max_age=600)
-    )
+    resp.set_cookie(APP_STATE_COOKIE, app_state, max_age=600, **cfg.script_cookie)
+    resp.set_cookie("redirect_to", redirect_to, max_age=600, **cfg.script_cookie)
     # code_verifier は秘密なので HttpOnly
-    resp.set_cookie(
-        CODE_VERIFIER_COOKIE, verifier, **_cookie_kwargs(http_only=True, max_age=600)
-    )
+    resp.set_cookie(CODE_VERIFIER_COOKIE, verifier, max_age=600, **cfg.http_only_cookie)
     return resp
 
 
@@ -286,15 +452,21 @@ def auth_callback():
         return "app_state mismatch. Please retry login.", 400
 
     # code を token に交換
-    token_url = f"{SUPABASE_URL}/auth/v1/token?grant_type=pkce"
+    cfg = settings.SETTINGS
+    token_url = f"{cfg.supabase_url}/auth/v1/token?grant_type=pkce"
     headers = {
-        "apikey": SUPABASE_KEY,
+        "apikey": cfg.supabase_key,
         "Content-Type": "application/json",
     }
     payload = {"auth_code": code, "code_verifier": verifier}
 
     try:
-        resp_token = requests.post(token_url, json=payload, headers=headers, timeout=10)
+        with admission.UPSTREAM.slot("token_exchange"), server_timing.span("upstream"):
+            resp_token = _http_session().post(
+                token_url, json=payload, headers=headers, timeout=10
+            )
+    except admission.UpstreamOverloaded:
+        raise
     except Exception as exc:
         return f"Failed to exchange code: {exc}", 400
 
@@ -308,32 +480,209 @@ def auth_callback():
     if not access_token:
         return f"No access_token in session response: {session}", 400
 
-    redirect_to = _safe_redirect_target(APP_BASE_URL, redirect_to_cookie)
+    redirect_to = _safe_redirect_target(cfg.app_base_url, redirect_to_cookie)
+
+    user = session.get("user")
+    _audit("login", user, access_token)
 
     resp = make_response(redirect(redirect_to))
     _set_session_cookies(resp, access_token, refresh_token, expires_in)
+    if user:
+        # トークン交換の応答に含まれるユーザーで検証済み Cookie を出しておき、
+        # 最初のページで /auth/v1/user を待たないようにする
+        _set_verified_cookie(resp, access_token, user)
+        # ブラウザがリダイレクト先を読み込む間にユーザーのデータをキャッシュに読み込む
+        prefetch.start(resp, access_token, user)
     # app_state / verifier を破棄
-    resp.set_cookie(APP_STATE_COOKIE, "", **_cookie_kwargs(http_only=False, max_age=0))
-    resp.set_cookie(
-        CODE_VERIFIER_COOKIE, "", **_cookie_kwargs(http_only=True, max_age=0)
-    )
-    resp.set_cookie("redirect_to", "", **_cookie_kwargs(http_only=False, max_age=0))
+    resp.set_cookie(APP_STATE_COOKIE, "", max_age=0, **cfg.script_cookie)
+    resp.set_cookie(CODE_VERIFIER_COOKIE, "", max_age=0, **cfg.http_only_cookie)
+    resp.set_cookie("redirect_to", "", max_age=0, **cfg.script_cookie)
     return resp
 
 
 @app.route("/logout")
 def logout():
+    access_token = request.cookies.get(AUTH_COOKIE)
+    refresh_token = request.cookies.get(REFRESH_COOKIE)
+    if access_token:
+        user = verified_cookie.verify(
+            app.secret_key, request.cookies.get(VERIFIED_COOKIE), access_token
+        )
+        if user is None:
+            # 検証済み Cookie が無い（SECRET_KEY 未設定の既定構成など）ときは、失効させる前に上流で本人を確かめる
+            try:
+                user = _verify_token(access_token)
+            except admission.UpstreamOverloaded:
+                user = None  # 混雑時もログアウト自体は止めない（監査の user_id は null になる）
+        _audit("logout", user, access_token)
+        prefetch.cancel((user or {}).get("id"))
+        # Supabase 側のセッション失効はレスポンスを待たせないようバックグラウンドで行う
+        task_queue.submit(_revoke_session, access_token, refresh_token, task_name="revoke_session")
+
     resp = make_response(redirect("/login"))
     _clear_session_cookies(resp)
     return resp
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    resp = make_response(metrics.REGISTRY.render())
+    resp.mimetype = "text/plain; version=0.0.4"
+    return resp
+
+
+@app.route("/events")
+def events_stream():
+    """ログイン中ユーザー向けの Server-Sent Events（assets/sse.js が購読する）。
+
+    broadcast と本人宛て（user:<id>）は常に購読し、?topics=a,b で追加する。
+    追加トピックは authz のポリシーで /events/<topic> として認可する。
+    """
+    topics = {event_bus.BROADCAST, event_bus.user_topic(str(g.user.get("id")))}
+    for topic in request.args.get("topics", "").split(","):
+        topic = topic.strip()
+        if topic and event_bus.valid_topic(topic) and authz.is_allowed(f"/events/{topic}"):
+            topics.add(topic)
+    sub = event_bus.BUS.subscribe(topics)
+    if sub is None:
+        resp = make_response("Too many open event streams.", 503)
+        resp.headers["Retry-After"] = str(event_bus.RETRY_MS // 1000)
+        return resp
+    resp = Response(event_bus.stream(sub), mimetype="text/event-stream")
+    resp.call_on_close(lambda: event_bus.BUS.unsubscribe(sub))
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@app.route("/_diagnostics/callbacks")
+def callback_diagnostics():
+    if not _is_admin(g.get("user")):
+        return "Forbidden", 403
+    return render_template_string(
+        """
+        <!doctype html>
+        <html lang="ja">
+          <head><meta charset="utf-8"><title>Callback diagnostics</title></head>
+          <body style="font-family:sans-serif; margin:24px;">
+            <h2>Dash コールバック計測（pid {{ pid }}）</h2>
+            <p>遅いコールバックのしきい値: {{ slow_ms }} ms（ログに [CALLBACK_SLOW] で出力）</p>
+            <table border="1" cellpadding="4" style="border-collapse:collapse; font-size:13px;">
+              <tr>
+                <th>callback</th><th>calls</th><th>errors</th>
+                <th>p50 ms</th><th>p95 ms</th><th>mean ms</th>
+                <th>auth ms</th><th>body ms</th><th>serialize ms</th>
+                <th>bytes in</th><th>bytes out</th>
+              </tr>
+              {% for r in rows %}
+              <tr>
+                <td><code>{{ r.callback }}</code></td>
+                <td>{{ r.get("calls", 0) }}</td>
+                <td>{{ r.errors }}</td>
+                <td>{{ "%.1f"|format(r.get("p50_ms", 0)) }}</td>
+                <td>{{ "%.1f"|format(r.get("p95_ms", 0)) }}</td>
+                <td>{{ "%.1f"|format(r.get("total_mean_ms", 0)) }}</td>
+                <td>{{ "%.1f"|format(r.get("auth_mean_ms", 0)) }}</td>
+                <td>{{ "%.1f"|format(r.get("body_mean_ms", 0)) }}</td>
+                <td>{{ "%.1f"|format(r.get("serialize_mean_ms", 0)) }}</td>
+                <td>{{ "%.0f"|format(r.get("bytes_in_mean", 0)) }}</td>
+                <td>{{ "%.0f"|format(r.get("bytes_out_mean", 0)) }}</td>
+              </tr>
+              {% endfor %}
+            </table>
+          </body>
+        </html>
+        """,
+        rows=callback_profiler.summary(),
+        pid=os.getpid(),
+        slow_ms=callback_profiler.SLOW_CALLBACK_MS,
+    )
+
+
+if debug_profiler.ENABLED:
+
+    def _debug_guard():
+        if not _is_admin(g.get("user")):
+            return "Forbidden", 403
+        retry_after = debug_profiler.acquire_slot()
+        if retry_after is not None:
+            resp = make_response("Profiler busy or cooling down", 429)
+            resp.headers["Retry-After"] = str(int(retry_after + 0.999))
+            return resp
+        return None
+
+    def _number_arg(name: str, default: str, convert, low: float, high: float):
+        """クエリのパラメータを数値にする。数値でない・範囲外なら None（呼び出し側で 400）。"""
+        try:
+            value = convert(request.args.get(name, default))
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(value) or not low <= value <= high:
+            return None
+        return value
+
+    def _bad_arg(name: str, low: float, high: float):
+        return f"{name} must be a number between {low:g} and {high:g}", 400
+
+    @app.route("/debug/profile")
+    def debug_profile():
+        seconds = _number_arg("seconds", "5", float, 0.1, debug_profiler.MAX_PROFILE_SECONDS)
+        if seconds is None:
+            return _bad_arg("seconds", 0.1, debug_profiler.MAX_PROFILE_SECONDS)
+        interval_ms = _number_arg("interval_ms", "10", float, 1, 1000)
+        if interval_ms is None:
+            return _bad_arg("interval_ms", 1, 1000)
+        denied = _debug_guard()
+        if denied is not None:
+            return denied
+        try:
+            body = debug_profiler.sample_stacks(seconds, interval_ms / 1000.0)
+        finally:
+            debug_profiler.release_slot()
+        resp = make_response(body)
+        resp.mimetype = "text/plain"
+        return resp
+
+    @app.route("/debug/heap")
+    def debug_heap():
+        action = request.args.get("action", "snapshot")
+        if action in {"start", "stop"}:
+            if not _is_admin(g.get("user")):
+                return "Forbidden", 403
+            if action == "start":
+                frames = _number_arg("frames", "10", int, 1, 100)
+                if frames is None:
+                    return _bad_arg("frames", 1, 100)
+                body = debug_profiler.heap_start(frames)
+            else:
+                body = debug_profiler.heap_stop()
+        else:
+            limit = _number_arg("limit", "30", int, 1, 1000)
+            if limit is None:
+                return _bad_arg("limit", 1, 1000)
+            group = request.args.get("group", "lineno")
+            if group not in {"lineno", "filename", "traceback"}:
+                return "group must be lineno, filename or traceback", 400
+            denied = _debug_guard()
+            if denied is not None:
+                return denied
+            try:
+                body = debug_profiler.heap_diff(limit, group)
+            finally:
+                debug_profiler.release_slot()
+        resp = make_response(body)
+        resp.mimetype = "text/plain"
+        return resp
+
+
 # --- Dash を Flask にマウント（最小ページ） ---
 dash_app = Dash(
     __name__,
     server=app,  # type: ignore[arg-type]
     url_base_pathname="/",
     suppress_callback_exceptions=True,
+    # background=True のコールバックは別プロセスで実行し、結果を diskcache に保存する
+    background_callback_manager=background_callbacks.MANAGER,
 )
 
 dash_app.layout = html.Div(
@@ -344,7 +693,27 @@ dash_app.layout = html.Div(
     ]
 )
 
+# 全コールバックの遅延・ペイロードサイズ・エラー数を記録する（/_diagnostics/callbacks）
+callback_profiler.install(dash_app)
+# バックグラウンドコールバックのポーリングを記録し、画面を離れたジョブを止める
+background_callbacks.install(dash_app)
+# ユーザーごとの同時実行数を制限し、操作によるコールバックを定期実行より優先する
+callback_scheduler.install(dash_app)
+# 同じユーザーの同一内容の要求（ダブルクリック・複数タブ）は実行中の結果を共有する
+callback_coalescer.install(dash_app)
+
+
+def preload_dash() -> None:
+    """初回リクエスト時に行われる Dash のサーバ初期化を前倒しする（gunicorn preload 用）。
+
+    master で済ませておくと、生成された HTML/スクリプト情報やコールバック表を
+    fork 後のワーカーが CoW で共有できる。
+    """
+    with app.test_request_context("/"):
+        dash_app._setup_server()
+
 
 if __name__ == "__main__":
+    settings.install_sighup_handler()
     port = int(os.environ.get("PORT", 8000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,87 @@
+// /events（Server-Sent Events）で届いたプロパティ更新を Dash のコンポーネントに反映する。
+//
+// レイアウトに data-sse-topics 属性を持つ要素があるときだけ接続する（無ければ何も通信しない）。
+//   html.Div(**{"data-sse-topics": "orders,alerts"})
+// イベントの data は {"updates": [{"id": "<component id>", "props": {...}}]}。
+// タブが長く非表示のときは接続を閉じ、表示に戻ったら繋ぎ直す（サーバの接続枠を空ける）。
+(function () {
+    "use strict";
+
+    var HIDDEN_CLOSE_MS = 60000;
+    var source = null;
+    var topics = null;
+    var hiddenTimer = null;
+
+    function apply(event) {
+        var data;
+        try {
+            data = JSON.parse(event.data);
+        } catch (e) {
+            return;
+        }
+        var setProps = window.dash_clientside && window.dash_clientside.set_props;
+        if (!setProps || !data.updates) {
+            return;
+        }
+        data.updates.forEach(function (update) {
+            if (document.getElementById(update.id)) {
+                setProps(update.id, update.props);
+            }
+        });
+    }
+
+    function open() {
+        if (source || topics === null) {
+            return;
+        }
+        var url = "/events" + (topics ? "?topics=" + encodeURIComponent(topics) : "");
+        source = new EventSource(url, { withCredentials: true });
+        source.onmessage = apply;
+    }
+
+    function close() {
+        if (source) {
+            source.close();
+            source = null;
+        }
+    }
+
+    function sync() {
+        var el = document.querySelector("[data-sse-topics]");
+        var next = el ? el.getAttribute("data-sse-topics") : null;
+        if (next === topics) {
+            return;
+        }
+        close();
+        topics = next;
+        if (!document.hidden) {
+            open();
+        }
+    }
+
+    document.addEventListener("visibilitychange", function () {
+        clearTimeout(hiddenTimer);
+        if (document.hidden) {
+            hiddenTimer = setTimeout(close, HIDDEN_CLOSE_MS);
+        } else {
+            open();
+        }
+    });
+
+    function start() {
+        sync();
+        // Dash はレイアウトを後から描画・差し替えるので、要素の出入りを監視する
+        new MutationObserver(sync).observe(document.body, {
+            childList: true,
+            subtree: true,
+            attributes: true,
+            attributeFilter: ["data-sse-topics"],
+        });
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", start);
+    } else {
+        start();
+    }
+})();
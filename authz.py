@@ -0,0 +1,148 @@
+"""パス／ロール単位の認可ポリシー。
+
+宣言的なポリシー表を起動時にパスのセグメント単位のトライへコンパイルし、
+g.user の JWT クレーム（role, app_metadata）だけで判定する（上流への問い合わせなし）。
+
+ポリシー表は AUTHZ_POLICY_FILE（JSON）で差し替えられる:
+
+    [
+      {"path": "/", "roles": ["*"]},
+      {"path": "/reports", "roles": ["analyst", "admin"]},
+      {"path": "/reports/upload", "methods": ["POST"], "roles": ["admin"]}
+    ]
+
+最も長く一致した path のルールが適用される。"*" はログイン済みなら誰でも可。
+"""
+import functools
+import json
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+import flask
+from werkzeug.exceptions import Forbidden
+
+import settings
+
+ANY_ROLE = "*"
+
+DEFAULT_POLICY: List[dict] = [
+    {"path": "/", "roles": [ANY_ROLE]},
+    {"path": "/_diagnostics", "roles": ["admin"]},
+    {"path": "/debug", "roles": ["admin"]},
+]
+
+
+class _Node:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # メソッド（"*" は全メソッド）→ 許可ロール
+        self.rules: Optional[Dict[str, FrozenSet[str]]] = None
+
+
+def _segments(path: str) -> List[str]:
+    return [s for s in path.split("/") if s]
+
+
+class Policy:
+    def __init__(self, rules: Iterable[dict]):
+        self.root = _Node()
+        for rule in rules:
+            node = self.root
+            for seg in _segments(rule["path"]):
+                node = node.children.setdefault(seg, _Node())
+            if node.rules is None:
+                node.rules = {}
+            roles = frozenset(rule.get("roles") or [])
+            for method in rule.get("methods") or [ANY_ROLE]:
+                node.rules[method.upper()] = roles
+
+    def roles_for_path(self, path: str, method: str = "GET") -> FrozenSet[str]:
+        """path に最も長く一致するルールの許可ロール（該当なしは空 = 拒否）。
+
+        メソッド指定のルールは、そのメソッド以外では上位のルールに委ねる。
+        """
+        method = method.upper()
+        node = self.root
+        matched = self._match(node, method, frozenset())
+        for seg in _segments(path):
+            node = node.children.get(seg)
+            if node is None:
+                break
+            matched = self._match(node, method, matched)
+        return matched
+
+    @staticmethod
+    def _match(node: _Node, method: str, default: FrozenSet[str]) -> FrozenSet[str]:
+        if node.rules is None:
+            return default
+        if method in node.rules:
+            return node.rules[method]
+        return node.rules.get(ANY_ROLE, default)
+
+    def allows(self, path: str, method: str, roles: FrozenSet[str]) -> bool:
+        allowed = self.roles_for_path(path, method)
+        return ANY_ROLE in allowed or not allowed.isdisjoint(roles)
+
+
+def load_policy(path: str = "") -> Policy:
+    if not path:
+        return Policy(DEFAULT_POLICY)
+    with open(path, encoding="utf-8") as fh:
+        return Policy(json.load(fh))
+
+
+# ポリシー表は起動時にコンパイルする（AUTHZ_POLICY_FILE の変更は再起動で反映）
+POLICY = load_policy(settings.SETTINGS.authz_policy_file)
+
+
+def roles_for(user) -> FrozenSet[str]:
+    """JWT クレームからロール集合を作る（role, app_metadata.role / roles, ADMIN_EMAILS）。
+
+    ADMIN_EMAILS（診断ページ等を閲覧できる管理者のメールアドレス）は SIGHUP で読み直される。
+    """
+    if not user:
+        return frozenset()
+    roles = set()
+    if user.get("role"):
+        roles.add(user["role"])
+    meta = user.get("app_metadata") or {}
+    if meta.get("role"):
+        roles.add(meta["role"])
+    roles.update(meta.get("roles") or [])
+    if (user.get("email") or "").lower() in settings.SETTINGS.admin_emails:
+        roles.add("admin")
+    return frozenset(roles)
+
+
+def current_roles() -> FrozenSet[str]:
+    """現在のリクエストのユーザーのロール（リクエスト内でキャッシュ）。"""
+    roles = flask.g.get("roles")
+    if roles is None:
+        roles = flask.g.roles = roles_for(flask.g.get("user"))
+    return roles
+
+
+def is_allowed(resource: str, method: str = "GET") -> bool:
+    """Dash コールバック等から、パス形式のリソースに対する権限を確認する。"""
+    return POLICY.allows(resource, method, current_roles())
+
+
+def requires(resource: str, method: str = "GET"):
+    """コールバック用デコレータ。権限が無ければ 403 にする。
+
+        @dash_app.callback(Output("report", "children"), Input("run", "n_clicks"))
+        @authz.requires("/reports")
+        def run_report(n): ...
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_allowed(resource, method):
+                raise Forbidden()
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,225 @@
+"""Dash のバックグラウンドコールバック（別プロセスで実行・diskcache に結果を保存）。
+
+重いレポート・集計のコールバックを `background=True` で登録すると、本体は
+DiskcacheManager が起動する子プロセスで動き、ブラウザは結果が出るまでポーリングする。
+gunicorn のスレッドは即座に解放されるので、認証や操作系のコールバックを塞がず、
+60 秒の --timeout でワーカーごと殺されることもない。Redis / Celery は不要。
+
+    @dash_app.callback(
+        Output("report", "children"),
+        Input("run", "n_clicks"),
+        background=True,
+        progress=[Output("report-progress", "value")],
+        cancel=[Input("cancel", "n_clicks")],
+        running=[(Output("run", "disabled"), True, False)],
+    )
+    def run_report(set_progress, n): ...
+
+このモジュールが DiskcacheManager に足すもの:
+- ワーカーあたりの同時実行ジョブ数の上限（超えたら 503）と、終わった子プロセスの回収
+- 結果キャッシュのキーに g.user の id を含める（同じ入力でも他のユーザーの結果は返さない）
+- ブラウザがポーリングしなくなった（画面を離れた・タブを閉じた）ジョブを止める
+"""
+import os
+import threading
+import time
+from typing import List, Optional
+
+import diskcache
+import flask
+import psutil
+from dash import DiskcacheManager
+from werkzeug.exceptions import ServiceUnavailable
+
+from metrics import Counter, Gauge
+from worker_state import on_post_fork
+
+CACHE_DIR = os.environ.get("BACKGROUND_CALLBACK_CACHE_DIR", "/tmp/dash-background")
+CACHE_SIZE_LIMIT = int(os.environ.get("BACKGROUND_CALLBACK_CACHE_BYTES", str(256 * 1024 * 1024)))
+# 完了した結果を使い回す秒数（最後に参照されてから）
+RESULT_EXPIRE = int(os.environ.get("BACKGROUND_CALLBACK_EXPIRE", "600"))
+MAX_JOBS = int(os.environ.get("BACKGROUND_CALLBACK_MAX_JOBS", "2"))
+# この秒数ポーリングが来なければ、ブラウザが離れたとみなしてジョブを止める
+ORPHAN_SECONDS = float(os.environ.get("BACKGROUND_CALLBACK_ORPHAN_SECONDS", "15"))
+RETRY_AFTER_SECONDS = int(os.environ.get("BACKGROUND_CALLBACK_RETRY_AFTER", "5"))
+
+JOBS = Counter(
+    "background_callback_jobs_total",
+    "Background callback jobs by result (started, rejected, orphaned)",
+    ("result",),
+)
+
+
+class TooManyJobs(ServiceUnavailable):
+    description = "Too many background jobs are running. Please retry shortly."
+
+    def __init__(self):
+        super().__init__(retry_after=RETRY_AFTER_SECONDS)
+
+
+def _cache_scope() -> str:
+    """結果キャッシュのキーに混ぜる値（ユーザーごとに別の結果にする）。"""
+    if not flask.has_request_context():
+        return ""
+    user = flask.g.get("user") or {}
+    return str(user.get("id") or "")
+
+
+class LocalJobManager(DiskcacheManager):
+    """同時実行数に上限を付けた DiskcacheManager（ジョブは 1 件 1 プロセス）。"""
+
+    def __init__(self, cache, max_jobs: int, expire: Optional[int]):
+        super().__init__(cache, cache_by=[_cache_scope], expire=expire)
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._procs: List = []
+
+    def reset(self) -> None:
+        """fork 後に呼ぶ。親の起動した子プロセスはこのワーカーの子ではない。"""
+        self._procs = []
+
+    def running_jobs(self) -> int:
+        with self._lock:
+            # is_alive() が終了した子を wait するので、ゾンビが溜まらない。
+            # terminate_job（psutil）で回収済みの子は is_alive() が True のままになるため pid も見る
+            self._procs = [p for p in self._procs if p.is_alive() and self.job_running(p.pid)]
+            return len(self._procs)
+
+    def owns(self, pid: int) -> bool:
+        """このワーカーが起動し、まだ動いているジョブか。"""
+        with self._lock:
+            return any(p.pid == pid for p in self._procs)
+
+    def call_job_fn(self, key, job_fn, args, context):
+        from multiprocess import Process
+
+        if self.running_jobs() >= self.max_jobs:
+            JOBS.inc(result="rejected")
+            raise TooManyJobs()
+        proc = Process(target=job_fn, args=(key, self._make_progress_key(key), args, context))
+        proc.start()
+        with self._lock:
+            self._procs.append(proc)
+        JOBS.inc(result="started")
+        return proc.pid
+
+
+MANAGER = LocalJobManager(
+    diskcache.Cache(os.path.join(CACHE_DIR, "results"), size_limit=CACHE_SIZE_LIMIT),
+    MAX_JOBS,
+    RESULT_EXPIRE,
+)
+Gauge("background_callback_jobs_running", "Background jobs started by this worker", func=MANAGER.running_jobs)
+
+
+class OrphanReaper:
+    """ポーリングの途絶えたジョブを止める。ハートビートは全ワーカーで共有する。"""
+
+    def __init__(self, manager: LocalJobManager, path: str):
+        self.manager = manager
+        self.heartbeats = diskcache.Cache(path)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def reset(self) -> None:
+        self._thread = None
+
+    def ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="background-reaper", daemon=True)
+            self._thread.start()
+
+    def register(self, job: int, owner: str) -> bool:
+        """このワーカーが起動したジョブを登録する。登録されたジョブだけがハートビート・停止の対象になる。"""
+        if not self.manager.owns(job):
+            return False
+        # pid の再利用で無関係なプロセスを止めないよう、起動時刻も覚えておく
+        try:
+            created = psutil.Process(job).create_time()
+        except psutil.Error:
+            return False
+        self.heartbeats.set(job, (time.time(), created, owner), expire=ORPHAN_SECONDS * 4)
+        self.ensure_started()
+        return True
+
+    def beat(self, job: str, owner: str) -> bool:
+        """ポーリング（?job=<pid>）を記録する。数字でない・未登録・他のユーザーのジョブは無視する。"""
+        if not job.isdigit():
+            return False
+        entry = self.heartbeats.get(int(job))
+        if entry is None or len(entry) < 3 or entry[2] != owner:
+            return False
+        self.heartbeats.set(int(job), (time.time(), entry[1], owner), expire=ORPHAN_SECONDS * 4)
+        self.ensure_started()
+        return True
+
+    def reap(self) -> int:
+        reaped = 0
+        now = time.time()
+        for job in list(self.heartbeats.iterkeys()):
+            entry = self.heartbeats.get(job)
+            if entry is None:
+                continue
+            seen, created = entry[0], entry[1]
+            try:
+                alive = psutil.Process(job).create_time() == created and self.manager.job_running(job)
+            except psutil.Error:
+                alive = False
+            if not alive:
+                self.heartbeats.delete(job)
+            elif now - seen > ORPHAN_SECONDS:
+                self.manager.terminate_job(job)
+                self.heartbeats.delete(job)
+                JOBS.inc(result="orphaned")
+                reaped += 1
+        return reaped
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(ORPHAN_SECONDS / 3)
+            try:
+                self.reap()
+            except Exception as exc:
+                print(f"[BACKGROUND] reap failed: {exc}")
+
+
+REAPER = OrphanReaper(MANAGER, os.path.join(CACHE_DIR, "heartbeats"))
+
+
+@on_post_fork
+def _reset_background_jobs() -> None:
+    MANAGER.reset()
+    REAPER.reset()
+    # master で開いた SQLite 接続を子で使わないよう閉じる（次の参照で開き直される）
+    MANAGER.handle.close()
+    REAPER.heartbeats.close()
+
+
+def install(dash_app) -> None:
+    """ジョブの開始時に登録し、ポーリングのたびにハートビートを記録する。
+
+    クライアントが送る ?job=<pid> は、このマネージャが起動して登録したジョブで、
+    同じユーザーのものだけを受け付ける（任意の pid を止めさせない）。
+    """
+    server = dash_app.server
+    endpoint = dash_app.config.routes_pathname_prefix + "_dash-update-component"
+    dispatch = server.view_functions[endpoint]
+
+    def heartbeat_dispatch(*args, **kwargs):
+        resp = dispatch(*args, **kwargs)
+        job = flask.request.args.get("job")
+        if job is not None:
+            REAPER.beat(job, _cache_scope())
+        elif isinstance(resp, flask.Response) and b'"job"' in resp.get_data():
+            # 開始直後の応答（{"cacheKey": ..., "job": pid}）。pid はこのワーカーの call_job_fn が返したもの
+            started = resp.get_json(silent=True)
+            pid = started.get("job") if isinstance(started, dict) else None
+            if isinstance(pid, int):
+                REAPER.register(pid, _cache_scope())
+        return resp
+
+    server.view_functions[endpoint] = heartbeat_dispatch
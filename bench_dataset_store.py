@@ -0,0 +1,91 @@
+"""データセットを各ワーカーで JSON からパースする場合と、dataset_store の mmap を開く場合の比較。
+
+gunicorn のワーカーと同じく fork した子プロセスを --workers 個起動し、それぞれで
+「データを用意して最初の figure（downsample 済み）を作るまでの時間」と、その間に増えた
+ワーカー固有のメモリ（USS）を計測する。上流からの取得時間は含めない（JSON は手元で作る）。
+
+    python bench_dataset_store.py --rows 1000000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import psutil
+
+import dataset_store
+import downsample
+
+DTYPES = {"ts": "datetime64[ms]"}
+
+
+def _payload(rows: int) -> bytes:
+    start = np.datetime64("2024-01-01T00:00:00", "ms")
+    ts = (start + np.arange(rows).astype("timedelta64[s]")).astype(str)
+    values = np.cumsum(np.random.default_rng(0).standard_normal(rows)).round(4)
+    return json.dumps([{"ts": t + "Z", "value": float(v)} for t, v in zip(ts, values)]).encode()
+
+
+def _first_figure(columns) -> dict:
+    return downsample.resampled_figure([{"x": columns["ts"], "y": columns["value"]}])
+
+
+def _worker(mode: str, payload: bytes, store_root: str, results) -> None:
+    proc = psutil.Process()
+    before = proc.memory_full_info().uss
+    started = time.perf_counter()
+    if mode == "parse":
+        columns = dataset_store.from_records(json.loads(payload), dtypes=DTYPES)
+    else:
+        store = dataset_store.DatasetStore(store_root)
+        columns = store.get("bench", lambda: dataset_store.from_records(json.loads(payload), dtypes=DTYPES))
+    _first_figure(columns)
+    elapsed = time.perf_counter() - started
+    results.put((elapsed, proc.memory_full_info().uss - before))
+
+
+def _run(mode: str, payload: bytes, store_root: str, workers: int):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_worker, args=(mode, payload, store_root, results)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    rows = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    payload = _payload(args.rows)
+    store_root = tempfile.mkdtemp(prefix="bench-datasets-")
+    try:
+        # 1 回目（作成）と、作成済みの版を開くだけの 2 回目を分けて計測する
+        build = dataset_store.DatasetStore(store_root)
+        started = time.perf_counter()
+        build.get("bench", lambda: dataset_store.from_records(json.loads(payload), dtypes=DTYPES))
+        build_s = time.perf_counter() - started
+
+        print(f"rows={args.rows} workers={args.workers} payload={len(payload) / 2**20:.1f}MiB build={build_s * 1000:.0f}ms")
+        print(f"{'mode':<10}{'first figure ms':>18}{'USS MiB/worker':>18}")
+        for mode in ("parse", "mmap"):
+            rows = _run(mode, payload, store_root, args.workers)
+            print(
+                f"{mode:<10}{statistics.median(r[0] for r in rows) * 1000:>18.1f}"
+                f"{statistics.median(r[1] for r in rows) / 2**20:>18.1f}"
+            )
+    finally:
+        shutil.rmtree(store_root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
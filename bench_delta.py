@@ -0,0 +1,125 @@
+"""delta.send（差分送信）と全体送信の、1 回の更新あたりの転送量と遅延を比べるベンチマーク。
+
+単独の Dash アプリに「n 点の系列に毎回 k 点足す」グラフのコールバックを 2 通り
+（全体を返す / delta.send で差分を返す）登録し、/_dash-update-component を直接叩く。
+遅延はサーバ側（コールバック実行 + JSON 化）と、応答 JSON のパース（ブラウザ側の負担の目安）。
+
+    python bench_delta.py --points 100000 --append 100 --updates 30
+"""
+import argparse
+import json
+import statistics
+import time
+
+from dash import Dash, Input, Output, State, dcc, html
+
+import delta
+
+
+def _figure(points: int, start: int, window: bool) -> dict:
+    first = start if window else 0
+    xs = list(range(first, start + points))
+    return {
+        "data": [{"type": "scattergl", "mode": "lines", "x": xs, "y": [float((i * 7919) % 1000) for i in xs]}],
+        "layout": {"title": {"text": f"{len(xs)} points"}, "uirevision": "keep"},
+    }
+
+
+def _make_app(args) -> Dash:
+    app = Dash(__name__)
+    app.layout = html.Div(
+        [
+            dcc.Interval(id="tick"),
+            dcc.Graph(id="full"),
+            dcc.Graph(id="patched"),
+            dcc.Store(id="patched-delta"),
+        ]
+    )
+
+    @app.callback(Output("full", "figure"), Input("tick", "n_intervals"))
+    def full(n):
+        return _figure(args.points, n * args.append, args.window)
+
+    @app.callback(
+        Output("patched", "figure"),
+        Output("patched-delta", "data"),
+        Input("tick", "n_intervals"),
+        State("patched-delta", "data"),
+    )
+    def patched(n, token):
+        return delta.send("bench.figure", _figure(args.points, n * args.append, args.window), token)
+
+    return app
+
+
+def _body(output: str, outputs, n: int, state=None) -> dict:
+    body = {
+        "output": output,
+        "outputs": outputs,
+        "inputs": [{"id": "tick", "property": "n_intervals", "value": n}],
+        "changedPropIds": ["tick.n_intervals"],
+    }
+    if state is not None:
+        body["state"] = [state]
+    return body
+
+
+def _measure(client, body: dict):
+    started = time.perf_counter()
+    resp = client.post("/_dash-update-component", json=body)
+    server = time.perf_counter() - started
+    data = resp.get_data()
+    started = time.perf_counter()
+    parsed = json.loads(data)
+    parse = time.perf_counter() - started
+    return len(data), server, parse, parsed
+
+
+def _summary(name: str, rows) -> None:
+    sizes = [r[0] for r in rows]
+    server = sorted(r[1] for r in rows)
+    parse = [r[2] for r in rows]
+    print(
+        f"{name:<10}{statistics.median(sizes) / 1024:>12.1f}"
+        f"{statistics.median(server) * 1000:>12.1f}{server[int(len(server) * 0.95) - 1] * 1000:>12.1f}"
+        f"{statistics.median(parse) * 1000:>12.2f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--points", type=int, default=100_000, help="系列の点数")
+    parser.add_argument("--append", type=int, default=100, help="1 回の更新で足す点数")
+    parser.add_argument("--updates", type=int, default=30)
+    parser.add_argument("--window", action="store_true", help="点数を固定し、足した分だけ先頭を捨てる")
+    args = parser.parse_args()
+
+    client = _make_app(args).server.test_client()
+    full_rows, patched_rows = [], []
+    token = None
+    for n in range(args.updates + 1):
+        full = _measure(client, _body("full.figure", {"id": "full", "property": "figure"}, n))
+        patched = _measure(
+            client,
+            _body(
+                "..patched.figure...patched-delta.data..",
+                [{"id": "patched", "property": "figure"}, {"id": "patched-delta", "property": "data"}],
+                n,
+                {"id": "patched-delta", "property": "data", "value": token},
+            ),
+        )
+        token = patched[3]["response"]["patched-delta"]["data"]
+        if n == 0:
+            continue  # 初回はどちらも全体を送る
+        full_rows.append(full[:3])
+        patched_rows.append(patched[:3])
+
+    mode = "window" if args.window else "append"
+    print(f"points={args.points} append={args.append} updates={args.updates} mode={mode}")
+    print(f"{'':<10}{'KiB/update':>12}{'p50 ms':>12}{'p95 ms':>12}{'parse ms':>12}")
+    _summary("full", full_rows)
+    _summary("delta", patched_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""downsample.py の間引きにかかる時間と、figure の JSON サイズを点数ごとに比べるベンチマーク。
+
+ランダムウォークの系列（x は日時）を 10^4〜10^7 点で作り、そのまま JSON 化した場合と、
+minmax / lttb で全体・表示範囲 10% を間引いた場合を計測する。1 点あたりの ns がほぼ一定なら O(n)。
+
+    python bench_downsample.py --max-points 10000000 --points-out 2000
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+import plotly.io
+
+import downsample
+
+
+def _timed(fn, repeat: int):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), result
+
+
+def _json_size(figure: dict) -> int:
+    return len(plotly.io.to_json(figure, validate=False))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-points", type=int, default=10_000_000)
+    parser.add_argument("--points-out", type=int, default=downsample.POINTS)
+    parser.add_argument("--max-raw", type=int, default=1_000_000, help="これより多い点数は生の JSON 化を計測しない")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'points':>10}{'raw ms':>10}{'raw MiB':>10}"
+        f"{'method':>8}{'full ms':>10}{'ns/pt':>8}{'zoom10% ms':>12}{'out KiB':>10}"
+    )
+    n = 10_000
+    while n <= args.max_points:
+        x = np.datetime64("2024-01-01T00:00:00") + np.arange(n).astype("timedelta64[s]")
+        y = np.cumsum(rng.standard_normal(n))
+        series = [{"x": x, "y": y, "name": "sensor"}]
+        raw = "-", "-"
+        if n <= args.max_raw:
+            figure = {"data": [{"type": "scattergl", "x": x, "y": y}]}
+            raw_s, size = _timed(lambda: _json_size(figure), 1)
+            raw = f"{raw_s * 1000:.0f}", f"{size / 2**20:.1f}"
+        zoom = {"xaxis.range[0]": str(x[int(n * 0.45)]), "xaxis.range[1]": str(x[int(n * 0.55)])}
+        for method in ("minmax", "lttb"):
+            full_s, figure = _timed(
+                lambda: downsample.resampled_figure(series, None, args.points_out, method), args.repeat
+            )
+            zoom_s, _ = _timed(
+                lambda: downsample.resampled_figure(series, zoom, args.points_out, method), args.repeat
+            )
+            print(
+                f"{n:>10}{raw[0]:>10}{raw[1]:>10}{method:>8}{full_s * 1000:>10.1f}"
+                f"{full_s / n * 1e9:>8.1f}{zoom_s * 1000:>12.1f}{_json_size(figure) / 1024:>10.1f}"
+            )
+        n *= 10
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""gunicorn のワーカー数・スレッド数・ワーカークラスを比較するベンチマーク。
+
+fake_supabase.py を上流として起動し（認証 API に遅延を入れる）、構成ごとに gunicorn を
+立ち上げて認証付きページへ同時アクセスし、スループットと遅延を計測する。
+
+    python bench_gunicorn.py --latency-ms 80 --duration 10 --clients 32
+"""
+import argparse
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_supabase import serve
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (worker_class, workers, threads)
+DEFAULT_CONFIGS = [
+    ("gthread", 1, 4),
+    ("gthread", 2, 4),
+    ("gthread", 2, 8),
+    ("gthread", 2, 16),
+    ("gthread", 2, 32),
+    ("gthread", 3, 8),
+    ("gevent", 2, 1),
+]
+
+
+def _wait_until_up(url: str, deadline: float) -> None:
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"server did not start: {url}")
+
+
+def _run_load(url: str, clients: int, duration: float):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+
+    def client(i: int) -> None:
+        nonlocal errors
+        session = requests.Session()
+        session.cookies.set("sb-access-token", f"fake-bench-{i}")
+        local = []
+        local_errors = 0
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            try:
+                resp = session.get(url, timeout=30, allow_redirects=False)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            errors += local_errors
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    return latencies, errors
+
+
+def bench(config, args, upstream_url: str):
+    worker_class, workers, threads = config
+    env = {
+        **os.environ,
+        "PORT": str(args.port),
+        "SUPABASE_URL": upstream_url,
+        "SUPABASE_ANON_KEY": "bench",
+        "GUNICORN_WORKER_CLASS": worker_class,
+        "WEB_CONCURRENCY": str(workers),
+        "GUNICORN_THREADS": str(threads),
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        _wait_until_up(f"{base}/login", time.monotonic() + 30)
+        _run_load(f"{base}{args.path}", args.clients, 1.0)  # ウォームアップ
+        latencies, errors = _run_load(f"{base}{args.path}", args.clients, args.duration)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "config": f"{worker_class} w={workers} t={threads}",
+        "rps": count / args.duration,
+        "p50_ms": statistics.median(latencies) * 1000 if count else 0.0,
+        "p95_ms": latencies[int(count * 0.95) - 1] * 1000 if count else 0.0,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="上流認証 API の遅延")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--upstream-port", type=int, default=54321)
+    parser.add_argument("--path", default="/", help="計測するパス（認証が必要なページ）")
+    args = parser.parse_args()
+
+    upstream = serve(port=args.upstream_port, latency_ms=args.latency_ms)
+    threading.Thread(target=upstream.serve_forever, daemon=True).start()
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+
+    print(f"{'config':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for config in DEFAULT_CONFIGS:
+        try:
+            r = bench(config, args, upstream_url)
+        except Exception as exc:
+            print(f"{config!s:<24} failed: {exc}")
+            continue
+        print(
+            f"{r['config']:<24}{r['rps']:>10.1f}{r['p50_ms']:>10.1f}"
+            f"{r['p95_ms']:>10.1f}{r['errors']:>8}"
+        )
+    upstream.shutdown()
+
+
+if __name__ == "__main__":
+    main()
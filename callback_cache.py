@@ -0,0 +1,249 @@
+"""Dash コールバック結果のメモ化（ユーザー単位のキー・LRU/TTL・バイト数の予算）。
+
+    @dash_app.callback(Output("report", "children"), Input("period", "value"))
+    @callback_cache.memoize(ttl=300)
+    def report(period): ...
+
+キーは (g.user の id, コールバック関数, 引数) なので、結果がユーザー間で漏れることはない。
+callback_context（どの入力が変わったか）に依存せず、引数とユーザーだけで結果が決まる
+コールバックに使う。例外（PreventUpdate 含む）はキャッシュしない。
+
+バックエンドは CALLBACK_CACHE_BACKEND で選ぶ。
+- memory（既定）: ワーカーごとのプロセス内 LRU
+- disk: 同一ホストの全ワーカーで共有する SQLite ファイル（CALLBACK_CACHE_PATH）
+どちらも値を pickle したバイト数の合計が CALLBACK_CACHE_MAX_BYTES を超えたら古い順に捨てる。
+"""
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import flask
+
+from metrics import Counter, Gauge
+from worker_state import on_post_fork
+
+BACKEND = os.environ.get("CALLBACK_CACHE_BACKEND", "memory").strip().lower()
+CACHE_PATH = os.environ.get("CALLBACK_CACHE_PATH", "/tmp/callback-cache.sqlite3")
+MAX_BYTES = int(os.environ.get("CALLBACK_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+DEFAULT_TTL = float(os.environ.get("CALLBACK_CACHE_TTL", "300"))
+# 1 件で予算の大半を占める値はキャッシュしない（他の全エントリを追い出してしまうため）
+MAX_ENTRY_FRACTION = 0.25
+
+REQUESTS = Counter(
+    "dash_callback_cache_requests_total",
+    "Memoized callback lookups by result (hit, miss, skipped)",
+    ("callback", "result"),
+)
+EVICTIONS = Counter(
+    "dash_callback_cache_evictions_total",
+    "Cache entries removed to stay within the byte budget",
+)
+ERRORS = Counter(
+    "dash_callback_cache_errors_total",
+    "Cache backend errors treated as a miss or a skipped write (get, set, stats)",
+    ("op",),
+)
+
+
+class MemoryBackend:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (expires, value)
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self.total_bytes = 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is None:
+                return None
+            expires, value = hit
+            if expires < time.time():
+                del self._entries[key]
+                self.total_bytes -= len(value)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= len(old[1])
+            self._entries[key] = (time.time() + ttl, value)
+            self.total_bytes += len(value)
+            while self.total_bytes > self.max_bytes and self._entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                EVICTIONS.inc()
+
+    def stats(self) -> Dict[str, float]:
+        return {"bytes": self.total_bytes, "entries": len(self._entries)}
+
+
+class DiskBackend:
+    """SQLite ファイルに保存する（同一ホストのワーカー間で共有）。
+
+    ロック待ちのタイムアウト（database is locked）等の SQLite のエラーは、
+    get ならミス、set なら書き込みを諦めるだけにする（キャッシュの失敗でコールバックを落とさない）。
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, expires REAL, used REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self._get(key)
+        except sqlite3.Error as exc:
+            ERRORS.inc(op="get")
+            print(f"[CALLBACK_CACHE] get failed, treating as a miss: {exc}")
+            return None
+
+    def _get(self, key: str) -> Optional[bytes]:
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE entries SET used = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        try:
+            self._set(key, value, ttl)
+        except sqlite3.Error as exc:
+            ERRORS.inc(op="set")
+            print(f"[CALLBACK_CACHE] set failed, skipping the write: {exc}")
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires, used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now),
+            )
+            conn.execute("DELETE FROM entries WHERE expires < ?", (now,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                # 最近使われていない順に、予算に収まるまで消す
+                evicted = 0
+                for old_key, size in conn.execute(
+                    "SELECT key, size FROM entries ORDER BY used"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    total -= size
+                    evicted += 1
+                EVICTIONS.inc(evicted)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+    def stats(self) -> Dict[str, float]:
+        try:
+            size, count = self._conn().execute(
+                "SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries"
+            ).fetchone()
+        except sqlite3.Error:
+            ERRORS.inc(op="stats")
+            return {"bytes": 0, "entries": 0}
+        return {"bytes": size, "entries": count}
+
+
+def _make_backend():
+    if BACKEND == "disk":
+        return DiskBackend(CACHE_PATH, MAX_BYTES)
+    return MemoryBackend(MAX_BYTES)
+
+
+CACHE = _make_backend()
+Gauge("dash_callback_cache_bytes", "Bytes held by the callback cache", func=lambda: CACHE.stats()["bytes"])
+Gauge("dash_callback_cache_entries", "Entries in the callback cache", func=lambda: CACHE.stats()["entries"])
+
+
+@on_post_fork
+def _reset_cache() -> None:
+    # SQLite の接続はプロセス間で共有できないため、fork 後に張り直す
+    CACHE.reset()
+
+
+def cache_key(user_id: str, name: str, args: tuple, kwargs: dict) -> Optional[str]:
+    """引数を pickle できなければ None（キャッシュしない）。"""
+    try:
+        payload = pickle.dumps((user_id, name, args, sorted(kwargs.items())), protocol=4)
+    except Exception:
+        return None
+    return hashlib.sha256(payload).hexdigest()
+
+
+def memoize(ttl: Optional[float] = None):
+    """Dash コールバックの結果をユーザーごとにキャッシュするデコレータ（@dash_app.callback の下に置く）。"""
+    ttl = DEFAULT_TTL if ttl is None else ttl
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            user = flask.g.get("user") if flask.has_request_context() else None
+            key = cache_key(str(user["id"]), name, args, kwargs) if user and user.get("id") else None
+            if key is None:
+                REQUESTS.inc(callback=func.__name__, result="skipped")
+                return func(*args, **kwargs)
+            cached = CACHE.get(key)
+            if cached is not None:
+                REQUESTS.inc(callback=func.__name__, result="hit")
+                return pickle.loads(cached)
+            REQUESTS.inc(callback=func.__name__, result="miss")
+            result = func(*args, **kwargs)
+            try:
+                value = pickle.dumps(result, protocol=4)
+            except Exception:
+                return result
+            if len(value) <= MAX_BYTES * MAX_ENTRY_FRACTION:
+                CACHE.set(key, value, ttl)
+            return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,179 @@
+"""同一内容の Dash コールバック要求の合流（in-flight 重複排除）と短期メモ。
+
+ダブルクリック・同じ画面の複数タブ・再描画で、同じユーザーから同じ
+/_dash-update-component が同時に届くことがある。(ユーザー, コールバック ID,
+正規化した入力) をキーに、実行中の同じ要求があればそれを待って結果（レスポンス本体）を
+共有し、コールバックは 1 回だけ実行する。
+
+CALLBACK_MEMO_SECONDS を設定すると、成功した結果をその秒数だけ覚えておき、
+直後に届いた同じ要求にも再実行せずに返す（既定 0 = 実行中の合流のみ）。
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import flask
+
+import callback_profiler
+import server_timing
+from callback_scheduler import current_user_key
+from metrics import Counter
+
+ENABLED = os.environ.get("CALLBACK_COALESCE", "true").lower() == "true"
+MEMO_SECONDS = float(os.environ.get("CALLBACK_MEMO_SECONDS", "0"))
+MEMO_MAX_ENTRIES = int(os.environ.get("CALLBACK_MEMO_MAX_ENTRIES", "256"))
+# 先行する実行がこれ以上終わらなければ、待つのをやめて自分で実行する
+WAIT_SECONDS = float(os.environ.get("CALLBACK_COALESCE_WAIT", "30"))
+
+COALESCED = Counter(
+    "dash_callback_coalesced_total",
+    "Callback requests by how they were served (executed, joined, memo, error)",
+    ("callback", "result"),
+)
+
+# 共有するのはビュー関数の戻り値（after_request 前）なので、Set-Cookie 等は要求ごとに付く
+_Result = Tuple[int, list, bytes]
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[_Result] = None
+        self.error: Optional[BaseException] = None
+
+
+def _raise_shared(error: BaseException):
+    """先行実行の例外を、合流した要求ごとに別のオブジェクトとして投げる（元の例外を __cause__ に残す）。
+
+    同じ例外オブジェクトを複数スレッドで投げると __traceback__ や __context__ を書き換え合うので、
+    型と引数が同じ複製を投げる（PreventUpdate や abort の HTTPException は型で処理されるため）。
+    """
+    try:
+        clone = copy.copy(error)
+    except Exception:
+        clone = RuntimeError(f"coalesced callback failed: {error!r}")
+    raise clone from error
+
+
+def request_key(user: str, body: dict, query: bytes = b"") -> str:
+    """(ユーザー, コールバック ID, 入力・State・変化したプロパティ) の正規化ハッシュ。
+
+    バックグラウンドコールバックのポーリングはジョブ ID 等をクエリに載せるので、クエリも含める。
+    """
+    normalized = json.dumps(
+        [
+            user,
+            query.decode("latin-1"),
+            body.get("output"),
+            body.get("inputs"),
+            body.get("state"),
+            sorted(body.get("changedPropIds") or []),
+        ],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class Coalescer:
+    def __init__(self, memo_seconds: float = MEMO_SECONDS, memo_max_entries: int = MEMO_MAX_ENTRIES):
+        self.memo_seconds = memo_seconds
+        self.memo_max_entries = memo_max_entries
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+        self._memo: "OrderedDict[str, Tuple[float, _Result]]" = OrderedDict()
+
+    def _memo_get(self, key: str) -> Optional[_Result]:
+        hit = self._memo.get(key)
+        if hit is None:
+            return None
+        expires, result = hit
+        if expires < time.monotonic():
+            del self._memo[key]
+            return None
+        self._memo.move_to_end(key)
+        return result
+
+    def _memo_put(self, key: str, result: _Result) -> None:
+        self._memo[key] = (time.monotonic() + self.memo_seconds, result)
+        self._memo.move_to_end(key)
+        while len(self._memo) > self.memo_max_entries:
+            self._memo.popitem(last=False)
+
+    def run(self, key: str, execute) -> Tuple[str, _Result]:
+        """key が同じ実行中の要求があれば合流し、無ければ execute() する。
+
+        (合流の種類, (status, headers, body)) を返す。先行実行の例外は、合流した側では複製して投げる。
+        """
+        with self._lock:
+            if self.memo_seconds > 0:
+                memo = self._memo_get(key)
+                if memo is not None:
+                    return "memo", memo
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            if flight.done.wait(WAIT_SECONDS):
+                if flight.error is not None:
+                    _raise_shared(flight.error)
+                return "joined", flight.result
+            return "executed", execute()
+
+        try:
+            flight.result = execute()
+            return "executed", flight.result
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if self.memo_seconds > 0 and flight.result is not None and flight.result[0] == 200:
+                    self._memo_put(key, flight.result)
+            flight.done.set()
+
+
+COALESCER = Coalescer()
+
+
+def _capture(resp) -> _Result:
+    resp = flask.make_response(resp)
+    return resp.status_code, list(resp.headers.items()), resp.get_data()
+
+
+def install(dash_app, coalescer: Coalescer = COALESCER) -> None:
+    """dash_app のコールバック要求を合流させる（スケジューラより外側に入れ、待つ側が枠を使わないようにする）。"""
+    if not ENABLED:
+        return
+    server = dash_app.server
+    endpoint = dash_app.config.routes_pathname_prefix + "_dash-update-component"
+    dispatch = server.view_functions[endpoint]
+
+    def coalesced_dispatch(*args, **kwargs):
+        body = flask.request.get_json(silent=True) or {}
+        started = time.perf_counter()
+        # 実行・合流のどちらでも、例外（PreventUpdate / abort / コールバックの失敗）は error として数える
+        how = "error"
+        try:
+            how, (status, headers, data) = coalescer.run(
+                request_key(current_user_key(), body, flask.request.query_string),
+                lambda: _capture(dispatch(*args, **kwargs)),
+            )
+        finally:
+            COALESCED.inc(callback=callback_profiler.callback_label(dash_app, str(body.get("output"))), result=how)
+        if how != "executed":
+            server_timing.add("coalesced", time.perf_counter() - started)
+        return flask.Response(data, status=status, headers=headers)
+
+    server.view_functions[endpoint] = coalesced_dispatch
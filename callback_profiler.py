@@ -0,0 +1,177 @@
+"""Dash コールバックの計測（コールバック ID ごとの遅延・ペイロードサイズ・エラー数）。
+
+/_dash-update-component のビューと callback_map の各エントリを包み、
+認証（_require_auth）・コールバック本体・JSON シリアライズに分けて記録する。
+"""
+import os
+import time
+from typing import Dict, List, Optional
+
+import flask
+from dash import _callback as dash_callback
+from dash.exceptions import PreventUpdate
+
+import server_timing
+from metrics import Counter, Histogram
+
+SLOW_CALLBACK_MS = float(os.environ.get("CALLBACK_SLOW_MS", "500"))
+
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CALLBACK_SECONDS = Histogram(
+    "dash_callback_seconds",
+    "Dash callback latency by stage (auth, body, serialize, total)",
+    ("callback", "stage"),
+)
+CALLBACK_REQUEST_BYTES = Histogram(
+    "dash_callback_request_bytes", "Dash callback request payload size", ("callback",), BYTE_BUCKETS
+)
+CALLBACK_RESPONSE_BYTES = Histogram(
+    "dash_callback_response_bytes", "Dash callback response payload size", ("callback",), BYTE_BUCKETS
+)
+CALLBACK_ERRORS = Counter("dash_callback_errors_total", "Dash callback failures", ("callback",))
+CALLBACK_PREVENTED = Counter(
+    "dash_callback_prevented_total", "Dash callbacks that raised PreventUpdate", ("callback",)
+)
+
+STAGES = ("auth", "body", "serialize", "total")
+
+_original_to_json = dash_callback.to_json
+
+
+def _add_stage(stage: str, seconds: float) -> None:
+    # バックグラウンドコールバック（別プロセス）ではリクエストコンテキストが無い
+    if not flask.has_request_context():
+        return
+    stages = flask.g.setdefault("callback_stages", {})
+    stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+def _timed_to_json(obj):
+    started = time.perf_counter()
+    try:
+        return _original_to_json(obj)
+    finally:
+        _add_stage("serialize", time.perf_counter() - started)
+
+
+def _wrap_callback(func):
+    if getattr(func, "_profiled", False):
+        return func
+
+    def profiled(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            # callback_map の関数は本体＋to_json なので、後でシリアライズ分を差し引く
+            _add_stage("callback", time.perf_counter() - started)
+
+    profiled._profiled = True  # type: ignore[attr-defined]
+    profiled.__wrapped__ = func  # type: ignore[attr-defined]
+    return profiled
+
+
+def callback_id() -> str:
+    """現在の /_dash-update-component リクエストのコールバック ID（output 文字列）。"""
+    body = flask.request.get_json(silent=True) or {}
+    return str(body.get("output", "unknown"))
+
+
+def callback_label(dash_app, cb_id: Optional[str] = None) -> str:
+    """メトリクスのラベルに使う ID。登録済みのコールバックでなければ "unknown"。
+
+    output はクライアントが送る文字列なので、そのままラベルにするとラベルの組が際限なく増える。
+    """
+    cb_id = callback_id() if cb_id is None else cb_id
+    return cb_id if cb_id in dash_app.callback_map else "unknown"
+
+
+def redact_inputs(body: dict) -> List[str]:
+    """ログ用に入力値を伏せ、id.property と値の型・サイズだけを残す。"""
+    out = []
+    for item in (body.get("inputs") or []) + (body.get("state") or []):
+        for entry in item if isinstance(item, list) else [item]:
+            if not isinstance(entry, dict):
+                continue
+            value = entry.get("value")
+            size = len(value) if isinstance(value, (str, list, dict)) else None
+            kind = type(value).__name__ + (f"[{size}]" if size is not None else "")
+            out.append(f"{entry.get('id')}.{entry.get('property')}=<{kind}>")
+    return out
+
+
+def _record(cb_id: str, total: float, response_bytes: Optional[int], failed: bool) -> None:
+    stages: Dict[str, float] = flask.g.get("callback_stages", {})
+    serialize = stages.get("serialize", 0.0)
+    body = max(stages.get("callback", 0.0) - serialize, 0.0)
+    auth = server_timing.elapsed("auth")
+    server_timing.add("callback", body)
+    server_timing.add("serialize", serialize)
+    for stage, seconds in (("auth", auth), ("body", body), ("serialize", serialize), ("total", total)):
+        CALLBACK_SECONDS.observe(seconds, callback=cb_id, stage=stage)
+    CALLBACK_REQUEST_BYTES.observe(flask.request.content_length or 0, callback=cb_id)
+    if response_bytes is not None:
+        CALLBACK_RESPONSE_BYTES.observe(response_bytes, callback=cb_id)
+    if failed:
+        CALLBACK_ERRORS.inc(callback=cb_id)
+
+    if total * 1000 >= SLOW_CALLBACK_MS:
+        inputs = redact_inputs(flask.request.get_json(silent=True) or {})
+        print(
+            f"[CALLBACK_SLOW] id={cb_id} total_ms={total * 1000:.1f} "
+            f"auth_ms={auth * 1000:.1f} body_ms={body * 1000:.1f} "
+            f"serialize_ms={serialize * 1000:.1f} inputs={inputs}"
+        )
+
+
+def install(dash_app) -> None:
+    """dash_app の全コールバックを計測対象にする（後から登録されたものも初回実行時に包む）。"""
+    dash_callback.to_json = _timed_to_json
+    server = dash_app.server
+    endpoint = dash_app.config.routes_pathname_prefix + "_dash-update-component"
+    dispatch = server.view_functions[endpoint]
+
+    def profiled_dispatch(*args, **kwargs):
+        cb_id = callback_id()
+        entry = dash_app.callback_map.get(cb_id)
+        if entry is not None:
+            entry["callback"] = _wrap_callback(entry["callback"])
+        else:
+            cb_id = "unknown"
+
+        started = time.perf_counter()
+        try:
+            resp = dispatch(*args, **kwargs)
+        except PreventUpdate:
+            CALLBACK_PREVENTED.inc(callback=cb_id)
+            _record(cb_id, time.perf_counter() - started, None, failed=False)
+            raise
+        except Exception:
+            _record(cb_id, time.perf_counter() - started, None, failed=True)
+            raise
+        size = resp.content_length if isinstance(resp, flask.Response) else None
+        failed = isinstance(resp, flask.Response) and resp.status_code >= 400
+        _record(cb_id, time.perf_counter() - started, size, failed)
+        return resp
+
+    server.view_functions[endpoint] = profiled_dispatch
+
+
+def summary() -> List[dict]:
+    """診断ページ用にコールバックごとの集計を返す（遅い順）。"""
+    by_callback: Dict[str, dict] = {}
+    for (cb_id, stage), (counts, total, count) in CALLBACK_SECONDS.snapshot().items():
+        row = by_callback.setdefault(cb_id, {"callback": cb_id})
+        row[f"{stage}_mean_ms"] = total / count * 1000 if count else 0.0
+        if stage == "total":
+            row["calls"] = count
+            row["p50_ms"] = CALLBACK_SECONDS.quantile(0.5, counts) * 1000
+            row["p95_ms"] = CALLBACK_SECONDS.quantile(0.95, counts) * 1000
+    for metric, field in ((CALLBACK_REQUEST_BYTES, "in"), (CALLBACK_RESPONSE_BYTES, "out")):
+        for (cb_id,), (_counts, total, count) in metric.snapshot().items():
+            if cb_id in by_callback and count:
+                by_callback[cb_id][f"bytes_{field}_mean"] = total / count
+    for row in by_callback.values():
+        row["errors"] = int(CALLBACK_ERRORS.value(callback=row["callback"]))
+    return sorted(by_callback.values(), key=lambda r: r.get("total_mean_ms", 0.0), reverse=True)
@@ -0,0 +1,214 @@
+"""Dash コールバックのユーザー単位フェアシェア・スケジューラ。
+
+1 人のユーザーが重いコールバックを連打して gunicorn の全スレッドを占有すると、
+他のユーザーのダッシュボードや認証リダイレクトまで止まる。そこで
+/_dash-update-component の実行前に枠を取らせる。
+
+- ワーカー全体の同時実行数（CALLBACK_MAX_CONCURRENCY）はスレッド数より少なくし、
+  認証・静的ファイル等のリクエスト用にスレッドを残す
+- ユーザー（g.user の id）ごとの同時実行数を CALLBACK_MAX_PER_USER に制限する
+- 枠が無ければ待ち行列に入る。空いた枠は「操作による（interactive）コールバック」→
+  「dcc.Interval 等の定期（background）コールバック」の順に、同じ優先度なら
+  実行中の少ないユーザー、最後に枠を渡してから長いユーザー、到着順に割り当てる
+  （1 人が多数並べても、後から来たユーザーが全部の後ろに回らない）
+- 待ちは CALLBACK_QUEUE_WAIT_MS まで。超えるか待ち行列が満杯なら 503 + Retry-After
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import flask
+
+import server_timing
+from metrics import Counter, Gauge, Histogram
+
+MAX_CONCURRENCY = int(os.environ.get("CALLBACK_MAX_CONCURRENCY", "12"))
+MAX_PER_USER = int(os.environ.get("CALLBACK_MAX_PER_USER", "2"))
+MAX_QUEUED = int(os.environ.get("CALLBACK_MAX_QUEUED", "64"))
+MAX_QUEUED_PER_USER = int(os.environ.get("CALLBACK_MAX_QUEUED_PER_USER", "8"))
+QUEUE_WAIT_SECONDS = float(os.environ.get("CALLBACK_QUEUE_WAIT_MS", "2000")) / 1000.0
+RETRY_AFTER_SECONDS = int(os.environ.get("CALLBACK_RETRY_AFTER", "1"))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# これらのプロパティの変化だけで起動したコールバックは定期実行とみなす
+BACKGROUND_PROPS = ("n_intervals",)
+
+QUEUE_WAIT = Histogram(
+    "dash_callback_queue_wait_seconds",
+    "Time a callback waited for a scheduler slot",
+    ("priority",),
+    (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0),
+)
+REJECTIONS = Counter(
+    "dash_callback_rejections_total",
+    "Callbacks rejected by the scheduler (queue_full, user_queue_full, timeout)",
+    ("priority", "reason"),
+)
+
+
+class _Waiter:
+    __slots__ = ("user", "priority", "seq", "event", "granted")
+
+    def __init__(self, user: str, priority: int, seq: int):
+        self.user = user
+        self.priority = priority
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+
+
+class CallbackRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"callback rejected: {reason}")
+        self.reason = reason
+        self.retry_after = RETRY_AFTER_SECONDS
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        max_per_user: int = MAX_PER_USER,
+        max_queued: int = MAX_QUEUED,
+        max_queued_per_user: int = MAX_QUEUED_PER_USER,
+        wait_seconds: float = QUEUE_WAIT_SECONDS,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.max_queued_per_user = max_queued_per_user
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._grants = itertools.count()
+        # ユーザー → 最後に枠を渡した順番（実行中・待機中のユーザーだけ保持する）
+        self._last_grant: Dict[str, int] = {}
+        self._running: Dict[str, int] = {}
+        self._queued: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self.total_running = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _grant(self, user: str) -> None:
+        self._running[user] = self._running.get(user, 0) + 1
+        self._last_grant[user] = next(self._grants)
+        self.total_running += 1
+
+    def _forget_if_idle(self, user: str) -> None:
+        if user not in self._running and user not in self._queued:
+            self._last_grant.pop(user, None)
+
+    def _dispatch(self) -> None:
+        """空いている枠を、優先度 → ユーザーの実行中の数 → 最後に枠を渡した順 → 到着順で待機者に割り当てる。"""
+        while self.total_running < self.max_concurrency and self._waiters:
+            best: Optional[_Waiter] = None
+            best_key = None
+            for w in self._waiters:
+                running = self._running.get(w.user, 0)
+                if running >= self.max_per_user:
+                    continue
+                key = (w.priority, running, self._last_grant.get(w.user, -1), w.seq)
+                if best_key is None or key < best_key:
+                    best, best_key = w, key
+            if best is None:
+                return
+            self._waiters.remove(best)
+            self._leave_queue(best.user)
+            self._grant(best.user)
+            best.granted = True
+            best.event.set()
+
+    def _leave_queue(self, user: str) -> None:
+        left = self._queued[user] - 1
+        if left:
+            self._queued[user] = left
+        else:
+            del self._queued[user]
+
+    def acquire(self, user: str, priority: int = INTERACTIVE) -> float:
+        """枠を取るまで待ち、待った秒数を返す。取れなければ CallbackRejected。"""
+        with self._lock:
+            if self.total_running < self.max_concurrency and self._running.get(user, 0) < self.max_per_user:
+                self._grant(user)
+                return 0.0
+            if len(self._waiters) >= self.max_queued:
+                raise CallbackRejected("queue_full")
+            if self._queued.get(user, 0) >= self.max_queued_per_user:
+                raise CallbackRejected("user_queue_full")
+            waiter = _Waiter(user, priority, next(self._seq))
+            self._waiters.append(waiter)
+            self._queued[user] = self._queued.get(user, 0) + 1
+        started = time.perf_counter()
+        waiter.event.wait(self.wait_seconds)
+        waited = time.perf_counter() - started
+        with self._lock:
+            if waiter.granted:
+                return waited
+            self._waiters.remove(waiter)
+            self._leave_queue(user)
+            self._forget_if_idle(user)
+        raise CallbackRejected("timeout")
+
+    def release(self, user: str) -> None:
+        with self._lock:
+            left = self._running[user] - 1
+            if left:
+                self._running[user] = left
+            else:
+                del self._running[user]
+                self._forget_if_idle(user)
+            self.total_running -= 1
+            self._dispatch()
+
+
+SCHEDULER = FairScheduler()
+Gauge("dash_callbacks_running", "Callbacks holding a scheduler slot", func=lambda: SCHEDULER.total_running)
+Gauge("dash_callbacks_queued", "Callbacks waiting for a scheduler slot", func=lambda: SCHEDULER.queued)
+
+
+def current_user_key() -> str:
+    user = flask.g.get("user") or {}
+    return str(user.get("id") or f"anon:{flask.request.remote_addr}")
+
+
+def classify(body: dict) -> int:
+    """changedPropIds が全て n_intervals 等なら BACKGROUND、それ以外（初回呼び出し含む）は INTERACTIVE。"""
+    changed = body.get("changedPropIds") or []
+    if changed and all(str(p).rpartition(".")[2] in BACKGROUND_PROPS for p in changed):
+        return BACKGROUND
+    return INTERACTIVE
+
+
+def install(dash_app, scheduler: FairScheduler = SCHEDULER) -> None:
+    """dash_app のコールバック実行の前にフェアシェアの枠取りを挟む。"""
+    server = dash_app.server
+    endpoint = dash_app.config.routes_pathname_prefix + "_dash-update-component"
+    dispatch = server.view_functions[endpoint]
+
+    def scheduled_dispatch(*args, **kwargs):
+        user = current_user_key()
+        priority = classify(flask.request.get_json(silent=True) or {})
+        name = PRIORITY_NAMES[priority]
+        try:
+            waited = scheduler.acquire(user, priority)
+        except CallbackRejected as exc:
+            REJECTIONS.inc(priority=name, reason=exc.reason)
+            resp = flask.make_response("Too many callbacks in progress. Please retry shortly.", 503)
+            resp.headers["Retry-After"] = str(exc.retry_after)
+            return resp
+        QUEUE_WAIT.observe(waited, priority=name)
+        server_timing.add("queue", waited)
+        try:
+            return dispatch(*args, **kwargs)
+        finally:
+            scheduler.release(user)
+
+    server.view_functions[endpoint] = scheduled_dispatch
@@ -0,0 +1,428 @@
+"""ダッシュボード用データセットの列指向キャッシュ（NumPy .npy を全ワーカーで mmap 共有）。
+
+Supabase から取ったクエリ結果を、ワーカーごとに JSON → Python オブジェクトにすると、
+同じデータがワーカー数ぶんメモリに載り、ワーカーの起動直後は毎回取得・パースを待つ。
+ここでは結果を一度だけ列ごとの .npy ファイルに書き出し、各ワーカーは読み取り専用で
+mmap する（コピーしない。ページはページキャッシュとして全ワーカーで共有される）。
+
+    ds = dataset_store.get(
+        "sensor-readings",
+        lambda: dataset_store.from_records(fetch_rows(token)),
+        user_id=g.user["id"],   # None なら全ユーザー共通
+        max_age=300,
+    )
+    ds["ts"], ds["value"]      # numpy.ndarray（読み取り専用）
+
+ディレクトリ構成（DATASET_DIR 以下）:
+
+    <キー>/CURRENT            今の版の名前（書き換えは os.replace で原子的に行う）
+    <キー>/<版>/meta.json     列名・dtype・行数・作成時刻
+    <キー>/<版>/<n>.npy       列ごとのデータ
+
+作り直しはキーごとのファイルロック（flock）で 1 ワーカーだけが行い、他は待ってから読む。
+古い版は切り替えた後に消す（開いている mmap は POSIX ではそのまま読める）。
+全体が DATASET_MAX_BYTES を超えたら、最後に使われたのが古いキーから消す。
+"""
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from werkzeug.exceptions import ServiceUnavailable
+
+from metrics import Counter, Gauge, Histogram
+
+ROOT = os.environ.get("DATASET_DIR", "/tmp/dash-datasets")
+MAX_BYTES = int(os.environ.get("DATASET_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 他のワーカーが作っている最中のデータセットを待つ上限
+BUILD_WAIT_SECONDS = float(os.environ.get("DATASET_BUILD_WAIT", "30"))
+RETRY_AFTER_SECONDS = int(os.environ.get("DATASET_RETRY_AFTER", "5"))
+# 最終使用時刻（LRU 用）の更新間隔。読むたびにファイルを書かないようにする
+TOUCH_INTERVAL = 60.0
+# 作りかけのまま残った一時ディレクトリを消すまでの秒数
+STALE_TMP_SECONDS = 3600.0
+
+REQUESTS = Counter(
+    "dataset_store_requests_total",
+    "Dataset lookups by result (hit, opened, built)",
+    ("dataset", "result"),
+)
+EVICTIONS = Counter("dataset_store_evictions_total", "Datasets removed to stay within the disk budget")
+BUILD_SECONDS = Histogram(
+    "dataset_store_build_seconds",
+    "Time to fetch and materialize a dataset",
+    ("dataset",),
+    (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+class DatasetBusy(ServiceUnavailable):
+    description = "The dataset is being prepared. Please retry shortly."
+
+    def __init__(self):
+        super().__init__(retry_after=RETRY_AFTER_SECONDS)
+
+
+class Dataset:
+    """開いている版の列（読み取り専用の numpy 配列）。"""
+
+    def __init__(self, key: str, version: str, meta: dict, columns: Dict[str, np.ndarray]):
+        self.key = key
+        self.version = version
+        self.created = meta["created"]
+        self.rows = meta["rows"]
+        self.nbytes = meta["bytes"]
+        # 書き出した側が版と一緒に残した情報（dataset_sync の同期位置など）
+        self.extra = meta.get("extra", {})
+        self.columns = columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.columns
+
+    def age(self) -> float:
+        return time.time() - self.created
+
+
+def from_records(
+    rows: Iterable[Mapping[str, Any]],
+    columns: Optional[List[str]] = None,
+    dtypes: Optional[Mapping[str, str]] = None,
+) -> Dict[str, np.ndarray]:
+    """PostgREST の JSON（行の dict のリスト）を列ごとの配列にする。
+
+    dtypes で列の型を指定できる（例: {"ts": "datetime64[ms]"}。時刻は UTC の ISO 8601 文字列を想定）。
+    指定の無い列は、数値と None だけなら float（None は NaN）、それ以外は文字列（None は ""）にする。
+    """
+    rows = list(rows)
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    dtypes = dtypes or {}
+    return {name: _convert([row.get(name) for row in rows], dtypes.get(name)) for name in columns}
+
+
+def _convert(values: List[Any], dtype: Optional[str]) -> np.ndarray:
+    if dtype is not None:
+        if np.issubdtype(np.dtype(dtype), np.datetime64):
+            # numpy はタイムゾーン付きの文字列を受け付けないので、UTC の表記を落とす
+            values = [_strip_utc(v) for v in values]
+        return np.asarray(values, dtype=dtype)
+    arr = np.asarray(values)
+    if arr.dtype != object:
+        return arr
+    if all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return np.array(["" if v is None else str(v) for v in values])
+
+
+def _strip_utc(value: Any) -> Any:
+    if isinstance(value, str):
+        if value.endswith("Z"):
+            return value[:-1]
+        if value.endswith("+00:00"):
+            return value[:-6]
+    return value
+
+
+def _column(values: Any) -> np.ndarray:
+    """mmap できる dtype にする（object は文字列の固定長に。pickle は使わない）。"""
+    arr = np.asarray(values)
+    if arr.dtype == object:
+        arr = arr.astype(str)
+    if arr.ndim != 1:
+        raise ValueError("dataset columns must be one-dimensional")
+    return np.ascontiguousarray(arr)
+
+
+def dataset_key(name: str, user_id: Optional[str], params: Optional[Mapping[str, Any]]) -> str:
+    payload = json.dumps([name, user_id, params or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class DatasetStore:
+    def __init__(self, root: str = ROOT, max_bytes: int = MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # このワーカーで開いている版（同じ版なら mmap を使い回す）
+        self._open: Dict[str, Dataset] = {}
+        self._touched: Dict[str, float] = {}
+        self.disk_bytes = 0
+
+    def _dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _current(self, key: str) -> Optional[str]:
+        try:
+            with open(os.path.join(self._dir(key), "CURRENT"), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _load(self, key: str, version: str) -> Dataset:
+        path = os.path.join(self._dir(key), version)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = {}
+        for i, name in enumerate(meta["columns"]):
+            # 0 行の配列は mmap できない
+            mode = "r" if meta["rows"] else None
+            columns[name] = np.load(os.path.join(path, f"{i}.npy"), mmap_mode=mode, allow_pickle=False)
+        return Dataset(key, version, meta, columns)
+
+    def _open_current(self, key: str) -> Optional[Dataset]:
+        """今の版を開く（開いている版と同じならそれを返す）。無ければ None。"""
+        for _ in range(3):
+            version = self._current(key)
+            if version is None:
+                return None
+            with self._lock:
+                cached = self._open.get(key)
+            if cached is not None and cached.version == version:
+                return cached
+            try:
+                ds = self._load(key, version)
+            except FileNotFoundError:
+                continue  # 読む間に別のワーカーが版を切り替えて古い版を消した
+            with self._lock:
+                self._open[key] = ds
+            return ds
+        return None
+
+    def _touch(self, key: str) -> None:
+        now = time.time()
+        if now - self._touched.get(key, 0.0) < TOUCH_INTERVAL:
+            return
+        self._touched[key] = now
+        try:
+            os.utime(os.path.join(self._dir(key), "CURRENT"))
+        except OSError:
+            pass
+
+    def get(
+        self,
+        name: str,
+        build: Callable[[], Mapping[str, Any]],
+        user_id: Optional[str] = None,
+        params: Optional[Mapping[str, Any]] = None,
+        max_age: Optional[float] = None,
+    ) -> Dataset:
+        """有効な版があれば開いて返し、無いか max_age 秒より古ければ build() で作り直す。"""
+        key = dataset_key(name, user_id, params)
+        ds = self._open_current(key)
+        if ds is not None and (max_age is None or ds.age() <= max_age):
+            self._touch(key)
+            REQUESTS.inc(dataset=name, result="hit")
+            return ds
+        return self._rebuild(name, key, build, max_age)
+
+    def current(
+        self, name: str, user_id: Optional[str] = None, params: Optional[Mapping[str, Any]] = None
+    ) -> Optional[Dataset]:
+        """今の版を開いて返す（作り直さない・ロックを取らない）。無ければ None。"""
+        key = dataset_key(name, user_id, params)
+        ds = self._open_current(key)
+        if ds is not None:
+            self._touch(key)
+        return ds
+
+    def refresh(
+        self,
+        name: str,
+        build: Callable[[], Mapping[str, Any]],
+        user_id: Optional[str] = None,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> Dataset:
+        """今の版の新しさに関係なく作り直す。"""
+        return self._rebuild(name, dataset_key(name, user_id, params), build, max_age=None, force=True)
+
+    @contextmanager
+    def _locked(self, key: str) -> Iterator[None]:
+        """キーの作り直しを 1 プロセス・1 スレッドに限る（待ちすぎたら DatasetBusy）。"""
+        os.makedirs(self._dir(key), exist_ok=True)
+        started = time.monotonic()
+        with open(os.path.join(self._dir(key), ".lock"), "a") as lock:
+            while True:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() - started > BUILD_WAIT_SECONDS:
+                        raise DatasetBusy()
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _rebuild(self, name: str, key: str, build, max_age: Optional[float], force: bool = False) -> Dataset:
+        requested = time.time()
+        with self._locked(key):
+            # 待っている間に他のワーカーが作り直していれば、それを使う
+            ds = self._open_current(key)
+            if ds is not None and (ds.created >= requested if force else max_age is None or ds.age() <= max_age):
+                REQUESTS.inc(dataset=name, result="opened")
+                return ds
+            ds = self._write(name, key, build())
+        REQUESTS.inc(dataset=name, result="built")
+        self.evict(keep=key)
+        return ds
+
+    def update(
+        self,
+        name: str,
+        fn: Callable[[Optional[Dataset]], Optional[Tuple[Mapping[str, Any], dict]]],
+        user_id: Optional[str] = None,
+        params: Optional[Mapping[str, Any]] = None,
+    ) -> Optional[Dataset]:
+        """キーのロック内で fn(今の版か None) を呼び、(列, extra) が返れば新しい版として書き出す。
+
+        fn が None を返したら今の版のまま（版が無ければ None を返す）。
+        """
+        key = dataset_key(name, user_id, params)
+        with self._locked(key):
+            result = fn(self._open_current(key))
+            if result is None:
+                return self._open_current(key)
+            columns, extra = result
+            ds = self._write(name, key, columns, extra)
+        REQUESTS.inc(dataset=name, result="built")
+        self.evict(keep=key)
+        return ds
+
+    def _write(self, name: str, key: str, columns: Mapping[str, Any], extra: Optional[dict] = None) -> Dataset:
+        started = time.perf_counter()
+        columns = {col: _column(values) for col, values in columns.items()}
+        rows = {len(c) for c in columns.values()}
+        if len(rows) > 1:
+            raise ValueError(f"dataset {name!r} has columns of different lengths")
+        version = f"{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}"
+        base = self._dir(key)
+        tmp = os.path.join(base, f".tmp-{version}")
+        os.makedirs(tmp)
+        try:
+            total = 0
+            for i, arr in enumerate(columns.values()):
+                path = os.path.join(tmp, f"{i}.npy")
+                np.save(path, arr, allow_pickle=False)
+                total += os.path.getsize(path)
+            meta = {
+                "name": name,
+                "columns": list(columns),
+                "dtypes": [str(arr.dtype) for arr in columns.values()],
+                "rows": rows.pop() if rows else 0,
+                "bytes": total,
+                "created": time.time(),
+                "extra": extra or {},
+            }
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.rename(tmp, os.path.join(base, version))
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        # 版の切り替え（読む側は CURRENT を読んだ時点の版を開く）
+        pointer = os.path.join(base, f".CURRENT-{version}")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(pointer, os.path.join(base, "CURRENT"))
+        for entry in os.listdir(base):
+            if entry != version and not entry.startswith(".") and entry != "CURRENT":
+                shutil.rmtree(os.path.join(base, entry), ignore_errors=True)
+        BUILD_SECONDS.observe(time.perf_counter() - started, dataset=name)
+        print(f"[DATASET] built name={name} key={key} version={version} rows={meta['rows']} bytes={total}")
+        ds = self._load(key, version)
+        with self._lock:
+            self._open[key] = ds
+        return ds
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """ディスク使用量が予算を超えていれば、最終使用が古いキーから消す。消した数を返す。"""
+        if not os.path.isdir(self.root):
+            return 0
+        now = time.time()
+        entries = []
+        total = 0
+        for key in os.listdir(self.root):
+            base = self._dir(key)
+            size = 0
+            for entry in os.listdir(base) if os.path.isdir(base) else ():
+                path = os.path.join(base, entry)
+                if entry.startswith(".tmp-") and now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                if os.path.isdir(path):
+                    size += sum(f.stat().st_size for f in os.scandir(path))
+            try:
+                used = os.path.getmtime(os.path.join(base, "CURRENT"))
+            except OSError:
+                used = 0.0
+            entries.append((used, key, size))
+            total += size
+        evicted = 0
+        for used, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            if self._remove(key):
+                total -= size
+                evicted += 1
+        self.disk_bytes = total
+        if evicted:
+            EVICTIONS.inc(evicted)
+        return evicted
+
+    def _remove(self, key: str) -> bool:
+        """作り直し中（ロック中）のキーは消さない。"""
+        base = self._dir(key)
+        try:
+            lock = open(os.path.join(base, ".lock"), "a")
+        except OSError:
+            return False
+        with lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # CURRENT を先に消し、読む側には「無い」と見せてからディレクトリを消す
+            try:
+                os.unlink(os.path.join(base, "CURRENT"))
+            except FileNotFoundError:
+                pass
+            shutil.rmtree(base, ignore_errors=True)
+        with self._lock:
+            self._open.pop(key, None)
+        return True
+
+
+STORE = DatasetStore()
+Gauge("dataset_store_disk_bytes", "Bytes of materialized datasets on disk (as of the last build)", func=lambda: STORE.disk_bytes)
+
+
+def get(
+    name: str,
+    build: Callable[[], Mapping[str, Any]],
+    user_id: Optional[str] = None,
+    params: Optional[Mapping[str, Any]] = None,
+    max_age: Optional[float] = None,
+) -> Dataset:
+    return STORE.get(name, build, user_id=user_id, params=params, max_age=max_age)
+
+
+def refresh(
+    name: str,
+    build: Callable[[], Mapping[str, Any]],
+    user_id: Optional[str] = None,
+    params: Optional[Mapping[str, Any]] = None,
+) -> Dataset:
+    return STORE.refresh(name, build, user_id=user_id, params=params)
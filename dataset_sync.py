@@ -0,0 +1,204 @@
+"""dataset_store のデータセットを Supabase（PostgREST）のテーブルから差分同期する。
+
+ダッシュボードを更新するたびにテーブル全体を取り直すと、新しい行が数件でも
+全行の転送・JSON パースがかかる。ここでは同期位置（カーソル列とキーの最大値）を
+データセットの版と一緒に覚えておき、それより新しい行だけを取ってキーで上書き・追加する。
+
+    READINGS = dataset_sync.TableSync(
+        "sensor-readings", "readings",
+        columns=["id", "ts", "value"], key="id", cursor="updated_at", order="ts",
+        dtypes={"ts": "datetime64[ms]"},
+    )
+
+    ds = READINGS.get(g.access_token, user_id=g.user["id"])   # RLS が効くのでユーザーごと
+    ds["ts"], ds["value"]
+
+- 差分の取得は (cursor, key) のキーセット（`or=(cursor.gt.X,and(cursor.eq.X,key.gt.Y))`）で
+  ページングするので、同じ更新時刻の行が大量にあっても取りこぼさない
+- 削除された行・同期位置より古い時刻で書き込まれた行は差分では分からないので、
+  DATASET_SYNC_FULL_INTERVAL ごとに全件を取り直して置き換える
+- 取り込みは新しい版への書き出し（読み取り中の mmap は変わらない）。上流とのやり取りは
+  変更行数に比例し、手元のマージは NumPy で列をコピーするだけ
+"""
+import os
+import time
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+import dataset_store
+import postgrest
+from metrics import Counter, Histogram
+
+# 差分を問い合わせる最短間隔（ワーカーごと。これより短い間隔の get は手元の版をそのまま返す）
+SYNC_INTERVAL = float(os.environ.get("DATASET_SYNC_INTERVAL", "30"))
+# 全件を取り直して削除を反映する間隔
+FULL_INTERVAL = float(os.environ.get("DATASET_SYNC_FULL_INTERVAL", "3600"))
+PAGE_SIZE = int(os.environ.get("DATASET_SYNC_PAGE_SIZE", "1000"))
+
+ROWS = Counter(
+    "dataset_sync_rows_total",
+    "Rows fetched from PostgREST by sync kind (full, incremental)",
+    ("dataset", "kind"),
+)
+SYNC_SECONDS = Histogram(
+    "dataset_sync_seconds",
+    "Time to sync a dataset from PostgREST",
+    ("dataset", "kind"),
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+
+def _quote(value: Any) -> str:
+    """PostgREST の or=(...) に入れる値（. や , や : を含む時刻があるので常に引用符で囲む）。"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def merge(
+    old: Mapping[str, np.ndarray], new: Mapping[str, np.ndarray], key: str, order: Optional[str] = None
+) -> Dict[str, np.ndarray]:
+    """new の行を key で old に上書き・追加した列を返す。old が order 列の昇順なら結果もそう保つ。"""
+    order = order or key
+    # 同じキーが何度も来たら最後（新しい方）を使う
+    keys = np.asarray(new[key])
+    _, last = np.unique(keys[::-1], return_index=True)
+    pick = np.sort(len(keys) - 1 - last)
+    pick = pick[np.argsort(np.asarray(new[order])[pick], kind="stable")]
+    new = {c: np.asarray(v)[pick] for c, v in new.items()}
+    # 更新された行は元の位置から外し、order の位置に入れ直す
+    keep = ~np.isin(old[key], new[key])
+    base = {c: np.asarray(v)[keep] for c, v in old.items()}
+    pos = np.searchsorted(base[order], new[order], side="right")
+    merged = {}
+    for c, values in base.items():
+        dtype = np.promote_types(values.dtype, new[c].dtype)
+        merged[c] = np.insert(values.astype(dtype, copy=False), pos, new[c].astype(dtype, copy=False))
+    return merged
+
+
+class TableSync:
+    def __init__(
+        self,
+        name: str,
+        table: str,
+        columns: Sequence[str],
+        key: str = "id",
+        cursor: str = "updated_at",
+        order: Optional[str] = None,
+        dtypes: Optional[Mapping[str, str]] = None,
+        filters: Optional[Mapping[str, str]] = None,
+        interval: float = SYNC_INTERVAL,
+        full_interval: float = FULL_INTERVAL,
+        page_size: int = PAGE_SIZE,
+        store: Optional[dataset_store.DatasetStore] = None,
+    ):
+        """filters は PostgREST のクエリ（例: {"device_id": "eq.3"}）。order は保存する行の並び順の列。"""
+        self.name = name
+        self.table = table
+        self.columns = list(columns)
+        self.key = key
+        self.cursor = cursor
+        self.order = order or key
+        if self.key not in self.columns or self.order not in self.columns:
+            raise ValueError("columns must include the key and order columns")
+        self.dtypes = dict(dtypes or {})
+        self.filters = dict(filters or {})
+        self.interval = interval
+        self.full_interval = full_interval
+        self.page_size = page_size
+        self.store = store or dataset_store.STORE
+        # データセットのキーにテーブルと条件を含める（同じ name でも条件が違えば別物）
+        self.params = {"table": table, "filters": self.filters, "columns": self.columns}
+        self._checked: Dict[Optional[str], float] = {}
+
+    def get(self, access_token: str, user_id: Optional[str] = None) -> dataset_store.Dataset:
+        """手元の版を返す。前回の問い合わせから interval 秒以上経っていれば差分を取り込んでから返す。"""
+        ds = self.store.current(self.name, user_id, self.params)
+        checked = self._checked.get(user_id)
+        if ds is not None and checked is not None and time.monotonic() - checked < self.interval:
+            return ds
+        return self.sync(access_token, user_id)
+
+    def sync(self, access_token: str, user_id: Optional[str] = None, full: bool = False) -> dataset_store.Dataset:
+        """差分を取り込む（full=True、版が無い、前回の全件取得から full_interval 経過なら全件）。"""
+        def apply(current: Optional[dataset_store.Dataset]):
+            extra = current.extra if current is not None else {}
+            if (
+                full
+                or current is None
+                or "cursor" not in extra
+                or set(current.columns) != set(self.columns)
+                or time.time() - extra.get("full_at", 0.0) > self.full_interval
+            ):
+                return self._full(access_token)
+            try:
+                return self._incremental(current, access_token)
+            except (TypeError, ValueError) as exc:
+                # 列の型が変わった等でマージできなければ、全件で作り直す
+                print(f"[DATASET] incremental merge failed name={self.name}: {exc}; running a full sync")
+                return self._full(access_token)
+
+        ds = self.store.update(self.name, apply, user_id, self.params)
+        self._checked[user_id] = time.monotonic()
+        return ds
+
+    def _fetch(self, access_token: str, params: Dict[str, str]) -> List[dict]:
+        return postgrest.fetch(self.table, {**self.filters, **params}, access_token)
+
+    def _select(self) -> str:
+        return ",".join(dict.fromkeys([*self.columns, self.cursor]))
+
+    def _full(self, access_token: str):
+        started = time.perf_counter()
+        # 同期位置は全件取得の前に決める（取得中に更新された行は次の差分でもう一度取る）
+        top = self._fetch(
+            access_token,
+            {"select": f"{self.cursor},{self.key}", "order": f"{self.cursor}.desc,{self.key}.desc", "limit": "1"},
+        )
+        rows: List[dict] = []
+        last = None
+        while True:
+            params = {"select": self._select(), "order": f"{self.key}.asc", "limit": str(self.page_size)}
+            if last is not None:
+                params[self.key] = f"gt.{last}"
+            page = self._fetch(access_token, params)
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+            last = page[-1][self.key]
+        columns = dataset_store.from_records(rows, self.columns, self.dtypes)
+        if self.order != self.key and rows:
+            idx = np.argsort(columns[self.order], kind="stable")
+            columns = {c: v[idx] for c, v in columns.items()}
+        now = time.time()
+        cursor = [top[0][self.cursor], top[0][self.key]] if top else None
+        ROWS.inc(len(rows), dataset=self.name, kind="full")
+        SYNC_SECONDS.observe(time.perf_counter() - started, dataset=self.name, kind="full")
+        return columns, {"cursor": cursor, "full_at": now, "synced_at": now}
+
+    def _incremental(self, current: dataset_store.Dataset, access_token: str):
+        started = time.perf_counter()
+        cursor = current.extra["cursor"]
+        rows: List[dict] = []
+        while True:
+            params = {
+                "select": self._select(),
+                "order": f"{self.cursor}.asc,{self.key}.asc",
+                "limit": str(self.page_size),
+            }
+            if cursor is not None:
+                c, k = cursor
+                params["or"] = f"({self.cursor}.gt.{_quote(c)},and({self.cursor}.eq.{_quote(c)},{self.key}.gt.{_quote(k)}))"
+            page = self._fetch(access_token, params)
+            rows.extend(page)
+            if page:
+                cursor = [page[-1][self.cursor], page[-1][self.key]]
+            if len(page) < self.page_size:
+                break
+        ROWS.inc(len(rows), dataset=self.name, kind="incremental")
+        SYNC_SECONDS.observe(time.perf_counter() - started, dataset=self.name, kind="incremental")
+        if not rows:
+            return None
+        new = dataset_store.from_records(rows, self.columns, self.dtypes)
+        merged = merge(current.columns, new, self.key, self.order)
+        return merged, {**current.extra, "cursor": cursor, "synced_at": time.time()}
@@ -0,0 +1,120 @@
+"""稼働中ワーカーの CPU / メモリ調査（/debug/profile, /debug/heap）。
+
+DEBUG_PROFILING=true のときだけルートを登録する（起動時に決まる。SIGHUP では切り替わらない）。
+無効時はスレッドも tracemalloc も動かさないため、待機中のオーバーヘッドは無い。
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import List, Optional
+
+import settings
+
+ENABLED = settings.SETTINGS.debug_profiling
+COOLDOWN_SECONDS = float(os.environ.get("DEBUG_PROFILING_COOLDOWN", "30"))
+MAX_PROFILE_SECONDS = 30.0
+
+_lock = threading.Lock()
+_busy = False
+_last_run = 0.0
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def acquire_slot() -> Optional[float]:
+    """同時実行 1 件・クールダウン付きで実行枠を取る。取れなければ待つべき秒数を返す。"""
+    global _busy, _last_run
+    with _lock:
+        wait = _last_run + COOLDOWN_SECONDS - time.monotonic()
+        if _busy or wait > 0:
+            return max(wait, 1.0)
+        _busy = True
+        _last_run = time.monotonic()
+        return None
+
+
+def release_slot() -> None:
+    global _busy
+    with _lock:
+        _busy = False
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> str:
+    """全スレッドのスタックを一定間隔で採取し、flamegraph.pl / speedscope 互換の
+    collapsed 形式（`thread;frame;frame... count`）で返す。"""
+    seconds = min(max(seconds, 0.1), MAX_PROFILE_SECONDS)
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            labels: List[str] = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(labels))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def heap_start(frames: int = 10) -> str:
+    global _previous_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _previous_snapshot = _take_snapshot()
+    return f"tracemalloc started (frames={tracemalloc.get_traceback_limit()})\n"
+
+
+def heap_stop() -> str:
+    global _previous_snapshot
+    _previous_snapshot = None
+    tracemalloc.stop()
+    return "tracemalloc stopped\n"
+
+
+def _take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        )
+    )
+
+
+def heap_diff(limit: int = 30, key_type: str = "lineno") -> str:
+    """前回のスナップショットとの差分（増加量の大きい順）を返し、今回分を次の基準にする。"""
+    global _previous_snapshot
+    if not tracemalloc.is_tracing():
+        return "tracemalloc is not running; call ?action=start first\n"
+    if key_type not in {"lineno", "filename", "traceback"}:
+        key_type = "lineno"
+    current = _take_snapshot()
+    previous, _previous_snapshot = _previous_snapshot, current
+    traced, peak = tracemalloc.get_traced_memory()
+    lines = [f"# traced={traced} peak={peak} bytes"]
+    if previous is None:
+        stats = current.statistics(key_type)
+        lines.append(f"# no previous snapshot; top {limit} allocations")
+        lines.extend(str(stat) for stat in stats[:limit])
+    else:
+        stats = current.compare_to(previous, key_type)
+        lines.append(f"# top {limit} differences since previous snapshot")
+        lines.extend(str(stat) for stat in stats[:limit])
+    if key_type == "traceback":
+        # traceback 単位では最上位フレーム以外も出す
+        for stat in stats[:limit]:
+            lines.append("")
+            lines.extend(stat.traceback.format())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,239 @@
+"""Dash コールバック出力の差分送信（dash.Patch）。
+
+ライブ更新のグラフに点を足す・テーブルに行を足すたびに figure / data の全体を返すと、
+10^5 点の系列なら更新ごとに数 MB の JSON を送り直すことになる。前回ブラウザに送った値を
+サーバ側に覚えておき、新しい値との差分だけを Patch にして返す。
+
+    @dash_app.callback(
+        Output("graph", "figure"),
+        Output("graph-delta", "data"),          # dcc.Store（初期値 None）
+        Input("tick", "n_intervals"),
+        State("graph-delta", "data"),
+    )
+    def update(n, token):
+        return delta.send("graph.figure", build_figure(), token)
+
+トークン（{"session", "version"}）でブラウザが持っている版を確認し、覚えている版と
+一致したときだけ差分を送る。初回・再読み込み・別タブ・別ワーカー・応答の取りこぼしで
+一致しなければ全体を送り直すので、差分が古い値に当たることはない。版は送るたびに
+ランダムに振るので、ワーカーや同時要求をまたいで同じ版が別の値を指すこともない。
+差分にするのは次の形の変化で、それ以外はその部分を丸ごと置き換える。
+- 辞書のキーの追加・削除・値の変更（再帰的に）
+- リストの末尾への追加（extend）、先頭を捨てて末尾に追加（表示点数を固定した系列）
+- 同じ長さのリストの要素ごとの変更
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from dash import Patch, no_update
+
+from callback_scheduler import current_user_key
+from metrics import Counter, Gauge
+
+MAX_BYTES = int(os.environ.get("DELTA_MAX_BYTES", str(64 * 1024 * 1024)))
+TTL_SECONDS = float(os.environ.get("DELTA_TTL", "1800"))
+# 差分の操作数がこれを超えたら全体を送る（細かい変更が多いと全体より大きく・適用も遅くなる）
+MAX_OPERATIONS = int(os.environ.get("DELTA_MAX_OPERATIONS", "500"))
+
+UPDATES = Counter(
+    "dash_delta_updates_total",
+    "Delta-tracked outputs by how they were sent (patch, full, unchanged)",
+    ("key", "result"),
+)
+
+# 覚えておく値のおおよそのメモリ量（要素 1 個あたり）
+_BYTES_PER_ITEM = 32
+_SCALARS = frozenset((str, int, float, bool, type(None)))
+_SessionKey = Tuple[str, str, str]
+
+
+class _TooManyOperations(Exception):
+    pass
+
+
+def _plain(value: Any, size: List[int]) -> Any:
+    """Figure / numpy 配列 / タプルを dict と list だけの新しい値に直す（比較・保存用のコピー）。"""
+    if hasattr(value, "to_plotly_json"):
+        value = value.to_plotly_json()
+    elif hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, dict):
+        size[0] += len(value)
+        return {k: v if type(v) in _SCALARS else _plain(v, size) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        size[0] += len(value)
+        if _SCALARS.issuperset(map(type, value)):
+            return list(value)  # 数値だけの系列（大半）は要素ごとの判定をしない
+        return [v if type(v) in _SCALARS else _plain(v, size) for v in value]
+    return value
+
+
+class _Differ:
+    def __init__(self, max_operations: int):
+        self.max_operations = max_operations
+        self.operations = 0
+
+    def _count(self, n: int = 1) -> None:
+        self.operations += n
+        if self.operations > self.max_operations:
+            raise _TooManyOperations()
+
+    def diff(self, old: Any, new: Any, parent: Patch, key: Any) -> None:
+        """parent[key] を old から new にする操作を parent に積む。"""
+        if isinstance(old, dict) and isinstance(new, dict):
+            target = parent[key]
+            for k in old:
+                if k not in new:
+                    self._count()
+                    del target[k]
+            for k, v in new.items():
+                if k not in old:
+                    self._count()
+                    target[k] = v
+                else:
+                    self.diff(old[k], v, target, k)
+        elif isinstance(old, list) and isinstance(new, list):
+            self._diff_list(old, new, parent, key)
+        elif type(old) is not type(new) or old != new:
+            self._count()
+            parent[key] = new
+
+    def _diff_list(self, old: list, new: list, parent: Patch, key: Any) -> None:
+        n = len(old)
+        if len(new) >= n and new[:n] == old:
+            if len(new) > n:
+                self._count()
+                parent[key].extend(new[n:])
+            return
+        shift = self._shift(old, new)
+        if shift:
+            target = parent[key]
+            self._count(shift + 1)
+            for _ in range(shift):
+                del target[0]
+            target.extend(new[n - shift:])
+            return
+        if len(new) == n:
+            target = parent[key]
+            for i, (a, b) in enumerate(zip(old, new)):
+                self.diff(a, b, target, i)
+            return
+        self._count()
+        parent[key] = new
+
+    def _shift(self, old: list, new: list) -> int:
+        """new が old の先頭 d 個を捨てて末尾に d 個足したものなら d（操作数の上限まで探す）。"""
+        n = len(old)
+        if n == 0 or len(new) != n:
+            return 0
+        limit = min(n - 1, self.max_operations - self.operations - 1)
+        first = new[0]
+        for d in range(1, limit + 1):
+            if old[d] == first and old[d:] == new[: n - d]:
+                return d
+        return 0
+
+
+def diff(old: Any, new: Any, max_operations: int = MAX_OPERATIONS) -> Optional[Patch]:
+    """old を new にする Patch。変化が無ければ操作の無い Patch、全体の置き換えになるか多すぎれば None。"""
+    # ルート自体は Patch で置き換えられないので、一段上に仮の親を置いて差分を取る
+    holder = Patch()
+    try:
+        _Differ(max_operations).diff(old, new, holder, 0)
+    except _TooManyOperations:
+        return None
+    root = Patch()
+    for op in holder._operations:
+        if op["location"] == [0] and op["operation"] == "Assign":
+            return None
+        op["location"] = op["location"][1:]
+        root._operations.append(op)
+    return root
+
+
+class DeltaStore:
+    """(ユーザー, セッション, 出力) ごとに、最後に送った版と値を LRU で覚える。"""
+
+    def __init__(self, max_bytes: int = MAX_BYTES, ttl: float = TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (expires, version, value, size)
+        self._entries: "OrderedDict[_SessionKey, Tuple[float, str, Any, int]]" = OrderedDict()
+        self.total_bytes = 0
+
+    def get(self, key: _SessionKey) -> Optional[Tuple[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: _SessionKey, version: str, value: Any, size: int, base: Optional[str] = None) -> bool:
+        """base を指定したときは、覚えている版が base のままの場合だけ保存する（同時更新の検出）。"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if base is not None and (entry is None or entry[1] != base):
+                return False
+            if entry is not None:
+                self._drop(key)
+            if size > self.max_bytes:
+                return True
+            self._entries[key] = (time.monotonic() + self.ttl, version, value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+            return True
+
+    def _drop(self, key: _SessionKey) -> None:
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry[3]
+
+    def stats(self) -> Dict[str, int]:
+        return {"bytes": self.total_bytes, "entries": len(self._entries)}
+
+
+STORE = DeltaStore()
+Gauge("dash_delta_store_bytes", "Approximate bytes of last-sent outputs kept for deltas", func=lambda: STORE.stats()["bytes"])
+Gauge("dash_delta_store_entries", "Sessions with a last-sent output kept for deltas", func=lambda: STORE.stats()["entries"])
+
+
+def send(key: str, value: Any, token: Optional[dict], store: DeltaStore = STORE) -> Tuple[Any, Any]:
+    """value（出力の新しい値）を、ブラウザが持っている値との差分にして返す。
+
+    戻り値は (出力する値, 新しいトークン)。値は Patch か全体、変化が無ければ no_update。
+    トークンは dcc.Store に出力し、次回のコールバックに State で渡す。
+    """
+    size = [0]
+    new = _plain(value, size)
+    nbytes = size[0] * _BYTES_PER_ITEM
+    session = token.get("session") if isinstance(token, dict) else None
+    version = token.get("version") if isinstance(token, dict) else None
+
+    if not isinstance(session, str):
+        session = uuid.uuid4().hex
+    skey = (current_user_key(), session, key)
+    next_version = uuid.uuid4().hex[:16]
+
+    known = store.get(skey) if isinstance(version, str) else None
+    if known is not None and known[0] == version:
+        patch = diff(known[1], new)
+        if patch is not None and not patch._operations:
+            UPDATES.inc(key=key, result="unchanged")
+            return no_update, no_update
+        if patch is not None and store.put(skey, next_version, new, nbytes, base=version):
+            UPDATES.inc(key=key, result="patch")
+            return patch, {"session": session, "version": next_version}
+
+    # 版が合わない・差分が大きすぎる・同時に別の更新が入った: 全体を送る
+    store.put(skey, next_version, new, nbytes)
+    UPDATES.inc(key=key, result="full")
+    return new, {"session": session, "version": next_version}
@@ -0,0 +1,236 @@
+"""大きな時系列グラフのサーバ側ダウンサンプリング（NumPy でベクトル化）。
+
+数百万点をそのまま figure に入れると、JSON 化・転送に時間がかかり、ブラウザも固まる。
+表示幅（ピクセル）に見合う点数まで間引いてから送り、ズーム（relayoutData）のたびに
+表示範囲だけを間引き直すので、拡大した範囲では元の解像度の点が見える。
+
+    dash_app.layout = html.Div([
+        downsample.register(dash_app, "sensor-graph", load_series),
+    ])
+
+    def load_series():
+        # [{"x": 時刻の配列（昇順）, "y": 値の配列, "name": ...}, ...]（trace の他の属性もそのまま渡る）
+        ...
+
+方式は DOWNSAMPLE_METHOD で選ぶ。
+- minmax（既定）: x の範囲をバケツ（2 点で 1 ピクセル）に分け、各バケツの最小・最大の点を残す。
+  スパイクを落とさない
+- lttb: minmax で候補を絞ってから Largest-Triangle-Three-Buckets で選ぶ。線の形が自然
+
+どちらも 1 リクエストあたり O(n)（表示範囲の点数）で、Python のループは出力点数ぶんだけ。
+"""
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dash import Input, Output, dcc
+from dash.exceptions import PreventUpdate
+
+import server_timing
+from metrics import Histogram
+
+POINTS = int(os.environ.get("DOWNSAMPLE_POINTS", "2000"))
+METHOD = os.environ.get("DOWNSAMPLE_METHOD", "minmax").strip().lower()
+# lttb の前に minmax で残す候補の倍率（出力点数に対して）
+LTTB_PRESELECT = 4
+# 1 バケツあたりの平均点数がこれ以上なら、バケツごとに argmin / argmax する
+LOOP_BUCKET_SIZE = 1024
+
+DOWNSAMPLE_SECONDS = Histogram(
+    "downsample_seconds",
+    "Time spent downsampling series for a figure",
+    ("method",),
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+_Range = Tuple[Any, Any]
+
+
+def _numeric(x: np.ndarray) -> np.ndarray:
+    """バケツ分けに使う数値の x（日時は整数に）。"""
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.view("int64")
+    return x
+
+
+def _bound(value: Any, x: np.ndarray):
+    """relayoutData の範囲（数値か "2024-01-01 12:00:00.5" 形式の文字列）を x と同じ単位にする。"""
+    if np.issubdtype(x.dtype, np.datetime64):
+        return np.datetime64(str(value).replace(" ", "T")).astype(x.dtype).view("int64")
+    return float(value)
+
+
+def _check_sorted(xn: np.ndarray) -> None:
+    if len(xn) > 1 and (xn[1:] < xn[:-1]).any():
+        raise ValueError("x must be sorted in ascending order")
+
+
+def _first_match(y: np.ndarray, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """各バケツ [start, end) で y == value となる最初の位置（無ければ start。NaN だけのバケツなど）。"""
+    hits = np.flatnonzero(y == np.repeat(values, ends - starts))
+    if len(hits) == 0:
+        return starts
+    found = hits[np.minimum(np.searchsorted(hits, starts), len(hits) - 1)]
+    return np.where((found >= starts) & (found < ends), found, starts)
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """x の範囲を n_out / 2 個のバケツに等分し、各バケツの最小・最大の位置を返す（昇順）。
+
+    NaN（欠損）は無視する。全て NaN のバケツはその先頭の点を残す（線が途切れる）。
+    """
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    xn = _numeric(x)
+    edges = np.linspace(float(xn[0]), float(xn[-1]), max(n_out // 2, 1) + 1)[1:-1]
+    # 点の無いバケツ（データの欠損区間）は詰める
+    starts = np.unique(np.concatenate(([0], np.searchsorted(xn, edges))))
+    starts = starts[starts < n]
+    ends = np.append(starts[1:], n)
+    if n >= len(starts) * LOOP_BUCKET_SIZE:
+        # バケツが大きいときは、n 個の一時配列を作るより区間ごとの argmin の方が速く省メモリ
+        lo, hi = _bucket_extremes(y, starts, ends)
+    else:
+        lo = _first_match(y, np.fmin.reduceat(y, starts), starts, ends)
+        hi = _first_match(y, np.fmax.reduceat(y, starts), starts, ends)
+    return np.unique(np.concatenate(([0], lo, hi, [n - 1])))
+
+
+def _bucket_extremes(y: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    lo = np.empty(len(starts), dtype=np.int64)
+    hi = np.empty(len(starts), dtype=np.int64)
+    for i, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        seg = y[s:e]
+        lo[i] = s + int(seg.argmin())
+        hi[i] = s + int(seg.argmax())
+        if np.isnan(y[lo[i]]) or np.isnan(y[hi[i]]):
+            # argmin / argmax は NaN を返すので、NaN を除いて選び直す
+            valid = np.flatnonzero(~np.isnan(seg))
+            if len(valid):
+                lo[i] = s + valid[int(seg[valid].argmin())]
+                hi[i] = s + valid[int(seg[valid].argmax())]
+    return lo, hi
+
+
+def _lttb_core(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(y)
+    # 先頭と末尾は固定し、間の点を n_out - 2 個のバケツに分ける
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = bounds[:-1], bounds[1:]
+    counts = ends - starts
+    # 次のバケツの平均（最後のバケツの次は末尾の点）
+    mean_x = np.append(np.add.reduceat(x[:-1], starts) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], starts) / counts, y[-1])
+    # minmax で絞った後のバケツは数点ずつなので、numpy の呼び出しより Python の float の方が速い
+    xs, ys = x.tolist(), y.tolist()
+    mxs, mys = mean_x.tolist(), mean_y.tolist()
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i, (s, e) in enumerate(zip(starts.tolist(), ends.tolist())):
+        ax, ay, cx, cy = xs[a], ys[a], mxs[i + 1], mys[i + 1]
+        best, best_area = s, -1.0
+        for j in range(s, e):
+            area = abs((ax - cx) * (ys[j] - ay) - (ax - xs[j]) * (cy - ay))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected[i + 1] = a
+    return selected
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """minmax で n_out * LTTB_PRESELECT 点に絞ってから LTTB で n_out 点を選ぶ（MinMaxLTTB）。"""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return minmax(x, y, n_out)
+    pre = minmax(x, y, n_out * LTTB_PRESELECT) if n > n_out * LTTB_PRESELECT else np.arange(n)
+    xs = _numeric(x)[pre].astype(np.float64)
+    ys = y[pre].astype(np.float64)
+    return pre[_lttb_core(xs, ys, n_out)]
+
+
+METHODS: Dict[str, Callable[[np.ndarray, np.ndarray, int], np.ndarray]] = {"minmax": minmax, "lttb": lttb}
+
+
+def downsample(x, y, n_out: int = POINTS, method: str = METHOD, x_range: Optional[_Range] = None):
+    """x（昇順）の x_range の範囲を n_out 点程度に間引いた (x, y) を返す。範囲の外側 1 点ずつも含める。"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    xn = _numeric(x)
+    _check_sorted(xn)
+    if x_range is not None:
+        lo, hi = sorted((_bound(x_range[0], x), _bound(x_range[1], x)))
+        i0 = max(int(np.searchsorted(xn, lo, side="left")) - 1, 0)
+        i1 = min(int(np.searchsorted(xn, hi, side="right")) + 1, len(xn))
+        x, y = x[i0:i1], y[i0:i1]
+    idx = METHODS[method](x, y, n_out)
+    return x[idx], y[idx]
+
+
+def visible_range(relayout: Optional[dict], axis: str = "xaxis") -> Optional[_Range]:
+    """relayoutData から表示範囲を取り出す。全体表示（autorange・初回）なら None。"""
+    if not relayout or relayout.get(f"{axis}.autorange"):
+        return None
+    rng = relayout.get(f"{axis}.range")
+    if rng is None and f"{axis}.range[0]" in relayout:
+        rng = (relayout[f"{axis}.range[0]"], relayout[f"{axis}.range[1]"])
+    return (rng[0], rng[1]) if rng else None
+
+
+def changes_range(relayout: Optional[dict], axis: str = "xaxis") -> bool:
+    """x の表示範囲が変わるイベントか（y だけのズーム・凡例の操作・autosize 等は False）。"""
+    if not relayout:
+        return True
+    return any(key == f"{axis}.autorange" or key.startswith(f"{axis}.range") for key in relayout)
+
+
+def resampled_figure(
+    series: Sequence[dict],
+    relayout: Optional[dict] = None,
+    n_out: int = POINTS,
+    method: str = METHOD,
+    layout: Optional[dict] = None,
+    uirevision: str = "downsample",
+) -> dict:
+    """series（{"x", "y", その他の trace 属性}）を表示範囲で間引いた figure。"""
+    x_range = visible_range(relayout)
+    started = time.perf_counter()
+    traces: List[dict] = []
+    for s in series:
+        x, y = downsample(s["x"], s["y"], n_out, method, x_range)
+        traces.append({"type": "scattergl", "mode": "lines", **s, "x": x, "y": y})
+    elapsed = time.perf_counter() - started
+    DOWNSAMPLE_SECONDS.observe(elapsed, method=method)
+    server_timing.add("downsample", elapsed)
+    # uirevision を固定すると、figure を差し替えてもユーザーのズーム・パンが保たれる
+    return {"data": traces, "layout": {"uirevision": uirevision, **(layout or {})}}
+
+
+def register(
+    dash_app,
+    graph_id: str,
+    load: Callable[[], Sequence[dict]],
+    n_out: Optional[int] = None,
+    method: Optional[str] = None,
+    layout: Optional[dict] = None,
+    **graph_kwargs,
+) -> dcc.Graph:
+    """ズームのたびに表示範囲を間引き直すグラフを登録し、レイアウトに置く dcc.Graph を返す。
+
+    load() はリクエストごとに呼ばれる（g.user を参照できる）。元データはキャッシュしておくこと。
+    """
+    n_out = n_out or POINTS
+    method = method or METHOD
+    if method not in METHODS:
+        raise ValueError(f"unknown downsample method: {method}")
+
+    @dash_app.callback(Output(graph_id, "figure"), Input(graph_id, "relayoutData"))
+    def _resample(relayout):
+        if not changes_range(relayout):
+            raise PreventUpdate
+        return resampled_figure(load(), relayout, n_out, method, layout, uirevision=graph_id)
+
+    return dcc.Graph(id=graph_id, **graph_kwargs)
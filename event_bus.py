@@ -0,0 +1,161 @@
+"""プロセス内の pub/sub と、それを流す Server-Sent Events（/events）。
+
+ライブ更新を dcc.Interval のポーリングで行うと、開いているタブごとに数秒おきに
+認証付きの /_dash-update-component が飛ぶ（変化が無くても）。代わりにサーバから
+コンポーネントのプロパティ更新を push し、ブラウザ側は assets/sse.js が
+dash_clientside.set_props で反映する。
+
+    event_bus.push("orders", "order-count", children=42)          # トピック購読者へ
+    event_bus.push(event_bus.user_topic(uid), "inbox", children=3)  # 特定ユーザーへ
+
+購読は接続ごとの上限付きキューで、溢れたら古いイベントから捨てる。
+バスはワーカープロセス内だけのもの（別ワーカーに接続しているタブには届かない）。
+1 接続が 1 スレッドを占有するため、ワーカーあたりの接続数は SSE_MAX_CONNECTIONS で制限する。
+"""
+import collections
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from metrics import Counter, Gauge
+
+MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", "4"))
+QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+KEEPALIVE_SECONDS = float(os.environ.get("SSE_KEEPALIVE_SECONDS", "20"))
+# 接続の寿命。切れるとブラウザが再接続し、そのとき認証し直す
+MAX_STREAM_SECONDS = float(os.environ.get("SSE_MAX_SECONDS", "300"))
+RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "5000"))
+
+BROADCAST = "broadcast"
+_TOPIC_RE = re.compile(r"^[A-Za-z0-9_.-]{1,64}$")
+
+PUBLISHED = Counter("sse_events_published_total", "Events published on the in-process bus", ("topic",))
+DROPPED = Counter("sse_events_dropped_total", "Events dropped because a subscriber queue was full")
+REJECTED = Counter("sse_connections_rejected_total", "SSE connections rejected at the per-worker limit")
+
+_Event = Tuple[int, str]
+
+
+def user_topic(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+def valid_topic(topic: str) -> bool:
+    """ブラウザが ?topics= で指定できるトピック（user: は本人分を自動で購読する）。"""
+    return bool(_TOPIC_RE.match(topic))
+
+
+class Subscription:
+    def __init__(self, topics: Iterable[str], maxlen: int):
+        self.topics = frozenset(topics)
+        self._events: Deque[_Event] = collections.deque(maxlen=maxlen)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.unsubscribed = False
+
+    def put(self, event: _Event) -> None:
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                DROPPED.inc()
+            self._events.append(event)
+            self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+    def get(self, timeout: float) -> List[_Event]:
+        """届いているイベントを全部返す。timeout まで何も無ければ空リスト。"""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class EventBus:
+    def __init__(self, max_connections: int = MAX_CONNECTIONS, queue_size: int = QUEUE_SIZE):
+        self.max_connections = max_connections
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self._seq = itertools.count(1)
+        self.connections = 0
+
+    def subscribe(self, topics: Iterable[str]) -> Optional[Subscription]:
+        """接続数の上限に達していれば None。"""
+        with self._lock:
+            if self.connections >= self.max_connections:
+                REJECTED.inc()
+                return None
+            self.connections += 1
+            sub = Subscription(topics, self.queue_size)
+            for topic in sub.topics:
+                self._topics.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        """何度呼んでもよい（レスポンスの close 時に呼ぶ）。"""
+        with self._lock:
+            if sub.unsubscribed:
+                return
+            sub.unsubscribed = True
+            for topic in sub.topics:
+                subs = self._topics.get(topic)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._topics[topic]
+            self.connections -= 1
+        sub.close()
+
+    def publish(self, topic: str, data: dict) -> int:
+        """topic の購読者にイベントを積み、届けた接続数を返す。"""
+        payload = json.dumps(data, separators=(",", ":"), default=str)
+        with self._lock:
+            event = (next(self._seq), payload)
+            subs = list(self._topics.get(topic, ()))
+        for sub in subs:
+            sub.put(event)
+        PUBLISHED.inc(topic="user" if topic.startswith("user:") else topic)
+        return len(subs)
+
+    def close_all(self) -> None:
+        """ワーカー終了時に、待機中のストリームを起こして終わらせる。"""
+        with self._lock:
+            subs = {s for subs in self._topics.values() for s in subs}
+        for sub in subs:
+            sub.close()
+
+
+BUS = EventBus()
+Gauge("sse_connections", "Open SSE connections in this worker", func=lambda: BUS.connections)
+
+
+def push(topic: str, component_id: str, **props) -> int:
+    """component_id のプロパティを、topic を購読しているブラウザで set_props する。"""
+    return BUS.publish(topic, {"updates": [{"id": component_id, "props": props}]})
+
+
+def stream(sub: Subscription) -> Iterator[str]:
+    """text/event-stream の本文。無通信中はコメント行だけ送り、寿命が来たら終わる。
+
+    購読の解除はレスポンスの close 時に行う（本文を 1 度も読まずに切断された場合も含む）。
+    """
+    deadline = time.monotonic() + MAX_STREAM_SECONDS
+    yield f"retry: {RETRY_MS}\n\n"
+    while not sub.closed:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events = sub.get(min(KEEPALIVE_SECONDS, remaining))
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+        yield "".join(f"id: {seq}\ndata: {payload}\n\n" for seq, payload in events)
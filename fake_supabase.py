@@ -0,0 +1,198 @@
+"""ベンチマーク・負荷試験用の Supabase Auth 互換スタブ（本番では使わない）。
+
+    python fake_supabase.py --port 54321 --latency-ms 50
+
+アプリ側は SUPABASE_URL=http://127.0.0.1:54321 で起動し、Cookie
+`sb-access-token=fake-<任意のID>` を付ければ認証済みとして扱われる。
+
+/rest/v1/<table> の GET は serve(tables=...) で渡した行に対して、dataset_sync が使う
+PostgREST の一部（select / order / limit / eq・gt・gte・lt・lte / or=(...) と and(...)）を解釈する。
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+FAKE_TOKEN_PREFIX = "fake-"
+
+
+def _fake_user(user_id: str) -> dict:
+    return {
+        "id": user_id,
+        "aud": "authenticated",
+        "role": "authenticated",
+        "email": f"{user_id}@example.com",
+        "app_metadata": {"provider": "google"},
+        "user_metadata": {},
+    }
+
+
+_OPS: Dict[str, Callable] = {
+    "eq": lambda a, b: a == b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+
+def _coerce(value, literal: str):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(literal)
+    return literal
+
+
+def _split_top(text: str) -> List[str]:
+    """"a,and(b,c),d" をトップレベルのカンマで分ける（引用符と括弧の中は分けない）。"""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == '"' and (i == 0 or text[i - 1] != "\\"):
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and ch == ",":
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _condition(expr: str) -> Callable[[dict], bool]:
+    """PostgREST の論理式（col.op.value / and(...) / or(...)）を行の述語にする。"""
+    for name, combine in (("and(", all), ("or(", any)):
+        if expr.startswith(name):
+            subs = [_condition(e) for e in _split_top(expr[len(name):-1])]
+            return lambda row, subs=subs, combine=combine: combine(f(row) for f in subs)
+    column, op, literal = expr.split(".", 2)
+    if literal.startswith('"') and literal.endswith('"'):
+        literal = literal[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return lambda row: row.get(column) is not None and _OPS[op](row[column], _coerce(row[column], literal))
+
+
+def _query(rows: List[dict], query: List[tuple]) -> List[dict]:
+    select, order, limit = None, [], None
+    for name, value in query:
+        if name == "select":
+            select = value.split(",")
+        elif name == "order":
+            order = [part.split(".") for part in value.split(",")]
+        elif name == "limit":
+            limit = int(value)
+        elif name == "or":
+            rows = [r for r in rows if _condition(f"or{value}")(r)]
+        else:
+            rows = [r for r in rows if _condition(f"{name}.{value}")(r)]
+    for column, direction in reversed(order):
+        rows = sorted(rows, key=lambda r: r[column], reverse=direction == "desc")
+    if limit is not None:
+        rows = rows[:limit]
+    if select:
+        rows = [{c: r.get(c) for c in select} for r in rows]
+    return rows
+
+
+class FakeSupabaseHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    tables: Dict[str, List[dict]] = {}
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler のシグネチャ
+        return
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _bearer(self) -> str:
+        auth = self.headers.get("Authorization", "")
+        return auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path, _, qs = self.path.partition("?")
+        if path == "/auth/v1/health":
+            return self._send_json(200, {"name": "GoTrue", "version": "fake"})
+        if path == "/auth/v1/user":
+            token = self._bearer()
+            if not token.startswith(FAKE_TOKEN_PREFIX):
+                return self._send_json(401, {"msg": "invalid JWT"})
+            return self._send_json(200, _fake_user(token[len(FAKE_TOKEN_PREFIX):]))
+        if path.startswith("/rest/v1/"):
+            rows = self.tables.get(path[len("/rest/v1/"):], [])
+            return self._send_json(200, _query(rows, parse_qsl(qs)))
+        return self._send_json(404, {"msg": "not found"})
+
+    def do_POST(self):
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path.split("?", 1)[0]
+        payload = self._read_body()
+        if path == "/auth/v1/token":
+            user_id = str(payload.get("auth_code") or payload.get("refresh_token") or "user")
+            return self._send_json(
+                200,
+                {
+                    "access_token": f"{FAKE_TOKEN_PREFIX}{user_id}",
+                    "refresh_token": f"refresh-{user_id}",
+                    "expires_in": 3600,
+                    "token_type": "bearer",
+                    "user": _fake_user(user_id),
+                },
+            )
+        if path.startswith("/rest/v1/"):
+            self.send_response(201)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        if path == "/auth/v1/logout":
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return None
+        return self._send_json(404, {"msg": "not found"})
+
+
+def serve(
+    host: str = "127.0.0.1",
+    port: int = 54321,
+    latency_ms: float = 0.0,
+    tables: Optional[Dict[str, List[dict]]] = None,
+) -> ThreadingHTTPServer:
+    """tables は {テーブル名: 行のリスト}（呼び出し側で書き換えると次の GET から反映される）。"""
+    handler = type("Handler", (FakeSupabaseHandler,), {"latency": latency_ms / 1000.0, "tables": tables or {}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = serve(args.host, args.port, args.latency_ms)
+    print(f"fake supabase listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
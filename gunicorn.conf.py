@@ -0,0 +1,177 @@
+# gunicorn 設定（Dockerfile の CMD から `gunicorn -c gunicorn.conf.py app:app` で読み込む）
+#
+# ワーカー数・スレッド数は検出した CPU（cgroup のクォータ込み）とメモリ上限から決める。
+# 環境変数で明示すればそちらを優先する。既定値は bench_gunicorn.py の計測結果による。
+import math
+import os
+import signal
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # preload で app を import する前にパッチする（後からだと requests/ssl が未パッチで残る）
+    from gevent import monkey
+
+    monkey.patch_all()
+
+from worker_state import format_memory, freeze_for_fork, memory_usage, run_post_fork_hooks
+
+# 1 ワーカーあたりに見込む固有メモリ（memory_watchdog の USS 予算と揃える）と master の分（preload で共有するページを含む）
+WORKER_MEMORY_MB = int(os.environ.get("WORKER_MEMORY_LIMIT_MB") or "0") or 200
+MASTER_MEMORY_MB = int(os.environ.get("GUNICORN_MASTER_MEMORY_MB", "100"))
+# CPU 1 コアあたりのワーカー数 / ワーカーあたりのスレッド数（認証の上流待ちが主なので多め）
+WORKERS_PER_CPU = float(os.environ.get("GUNICORN_WORKERS_PER_CPU", "2"))
+THREADS_PER_WORKER = int(os.environ.get("GUNICORN_THREADS_PER_WORKER", "16"))
+
+
+def _read_first_line(path: str):
+    try:
+        with open(path, encoding="ascii") as fh:
+            return fh.readline().strip()
+    except OSError:
+        return None
+
+
+def detect_cpus() -> float:
+    """利用可能な CPU 数（cgroup v2/v1 のクォータがあればそれを優先）。"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = float(len(os.sched_getaffinity(0)))
+    else:
+        cpus = float(os.cpu_count() or 1)
+    quota = _read_first_line("/sys/fs/cgroup/cpu.max")
+    if quota:
+        limit, _, period = quota.partition(" ")
+        if limit != "max" and period:
+            cpus = min(cpus, int(limit) / int(period))
+    else:
+        limit = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read_first_line("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if limit and period and int(limit) > 0:
+            cpus = min(cpus, int(limit) / int(period))
+    return max(cpus, 0.1)
+
+
+def detect_memory_mb() -> int:
+    """コンテナのメモリ上限（cgroup）を MB で返す。無ければ物理メモリ。"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read_first_line(path)
+        # cgroup v1 の「無制限」は巨大な値になる
+        if value and value != "max" and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    meminfo = _read_first_line("/proc/meminfo")  # MemTotal:  123456 kB
+    if meminfo:
+        return int(meminfo.split()[1]) // 1024
+    return 512
+
+
+def auto_workers(cpus: float, memory_mb: int) -> int:
+    by_cpu = math.ceil(cpus * WORKERS_PER_CPU)
+    by_memory = (memory_mb - MASTER_MEMORY_MB) // WORKER_MEMORY_MB
+    return max(1, min(by_cpu, by_memory))
+
+
+CPUS = detect_cpus()
+MEMORY_MB = detect_memory_mb()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY") or auto_workers(CPUS, MEMORY_MB))
+threads = int(os.environ.get("GUNICORN_THREADS") or THREADS_PER_WORKER)
+# gevent では 1 ワーカーが同時に抱えるグリーンレット数
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "200"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "60"))
+
+# master で app / dash_app を構築してから fork し、ワーカー間でメモリを CoW 共有する
+preload_app = os.environ.get("GUNICORN_PRELOAD", "true").lower() == "true"
+
+
+def when_ready(server):
+    server.log.info(
+        "[CONFIG] cpus=%.2f memory=%dMB worker_class=%s workers=%d threads=%d",
+        CPUS,
+        MEMORY_MB,
+        worker_class,
+        workers,
+        threads,
+    )
+    if not preload_app:
+        return
+    import app as app_module
+
+    app_module.preload_dash()
+    freeze_for_fork()
+    server.log.info("[MEMORY] master preloaded %s", format_memory(memory_usage()))
+    _reload_settings_on_hup(server)
+
+
+def _reload_settings_on_hup(server):
+    """preload 時の SIGHUP をワーカー再起動ではなく設定の再読み込みにする。
+
+    preload ではコードは master に読み込み済みで、HUP でワーカーを作り直しても
+    コードは変わらない。master は自分の settings を読み直し（以後 fork するワーカー用）、
+    稼働中のワーカーには SIGHUP を転送して各自で読み直させる。
+    """
+    import settings
+
+    def handle_hup():
+        server.log.info("Hang up: reloading settings in master and %d workers", len(server.WORKERS))
+        settings.reload()
+        for pid in list(server.WORKERS):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    # Arbiter はシグナル名から handle_hup を都度引くので、インスタンス属性で差し替えられる
+    server.handle_hup = handle_hup
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        # 再起動で fork し直すまでに master で増えたオブジェクトも固定する
+        freeze_for_fork()
+
+
+def post_fork(server, worker):
+    # HTTP 接続プール・キャッシュ・乱数などプロセス単位の状態をワーカーごとに作り直す
+    run_post_fork_hooks()
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        "[MEMORY] worker pid=%s started %s", worker.pid, format_memory(memory_usage())
+    )
+    import threading
+
+    import event_bus
+    import memory_watchdog
+    import settings
+
+    # gunicorn はワーカーの SIGHUP を既定動作（終了）に戻すため、ここで設定の再読み込みに割り当てる
+    settings.install_sighup_handler()
+
+    # SSE のストリームは終わらないリクエストなので、終了時に閉じないと graceful_timeout まで待たされる
+    handle_exit = worker.handle_exit
+
+    def _handle_exit(sig, frame):
+        # シグナルハンドラ内でロックを取らないよう別スレッドで閉じる
+        threading.Thread(target=event_bus.BUS.close_all, daemon=True).start()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, _handle_exit)
+
+    def _recycle():
+        # alive=False で新規受付を止め、処理中のリクエストを終えてから終了する（master が補充）
+        worker.alive = False
+        event_bus.BUS.close_all()
+
+    memory_watchdog.start(_recycle, worker.log.warning)
+
+
+def worker_exit(server, worker):
+    import task_queue
+
+    # ログアウト時のセッション失効など、積まれている上流処理を終えてから抜ける
+    task_queue.BACKGROUND.shutdown(timeout=5.0)
+    server.log.info(
+        "[MEMORY] worker pid=%s exiting %s", worker.pid, format_memory(memory_usage())
+    )
@@ -0,0 +1,128 @@
+"""死活監視（/healthz）と準備完了（/readyz）のエンドポイント。
+
+どちらも WSGI の入口で返すので、認証・Flask のリクエストフック・Dash を通らない。
+
+- /healthz: プロセスが応答できれば 200（I/O なし・一定時間）
+- /readyz: Supabase Auth に届くかを返す。上流へはリクエストごとに問い合わせず、
+  バックグラウンドのプローブが HEALTH_PROBE_INTERVAL 秒ごとに更新した結果を読む
+"""
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+import requests
+
+import settings
+from metrics import Gauge
+from worker_state import on_post_fork
+
+HEALTH_PATH = "/healthz"
+READY_PATH = "/readyz"
+
+PROBE_INTERVAL = float(os.environ.get("HEALTH_PROBE_INTERVAL", "10"))
+PROBE_TIMEOUT = float(os.environ.get("HEALTH_PROBE_TIMEOUT", "2"))
+# プローブがこの回数分更新されていなければ（スレッドが止まった等）準備未完了とみなす
+STALE_AFTER = PROBE_INTERVAL * 3 + PROBE_TIMEOUT
+
+_JSON_HEADERS = [("Content-Type", "application/json"), ("Cache-Control", "no-store")]
+_HEALTH_BODY = b'{"status":"ok"}'
+
+
+class UpstreamProbe:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.ok = False
+        self.checked_at = 0.0
+        self.latency = 0.0
+        self.error = "not checked yet"
+        Gauge("supabase_up", "Whether the last Supabase Auth probe succeeded", func=lambda: float(self.ok))
+
+    def reset(self) -> None:
+        """fork 後に呼ぶ。親のスレッドは子に引き継がれないため、次の参照で起動し直す。"""
+        self._thread = None
+
+    def ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="health-probe", daemon=True)
+            self._thread.start()
+
+    def check(self) -> None:
+        started = time.perf_counter()
+        ok, error = False, ""
+        cfg = settings.SETTINGS
+        if not cfg.supabase_url:
+            error = "SUPABASE_URL is not set"
+        else:
+            try:
+                resp = requests.get(
+                    f"{cfg.supabase_url}/auth/v1/health",
+                    headers={"apikey": cfg.supabase_key},
+                    timeout=PROBE_TIMEOUT,
+                )
+                ok = resp.status_code == 200
+                if not ok:
+                    error = f"status {resp.status_code}"
+            except Exception as exc:
+                error = type(exc).__name__
+        self.ok, self.error = ok, error
+        self.latency = time.perf_counter() - started
+        self.checked_at = time.time()
+
+    def _run(self) -> None:
+        while True:
+            self.check()
+            time.sleep(PROBE_INTERVAL)
+
+    def status(self) -> dict:
+        age = time.time() - self.checked_at if self.checked_at else None
+        ready = self.ok and age is not None and age < STALE_AFTER
+        return {
+            "status": "ready" if ready else "unavailable",
+            "supabase": {
+                "ok": self.ok,
+                "age_seconds": round(age, 1) if age is not None else None,
+                "latency_ms": round(self.latency * 1000, 1),
+                "error": self.error or None,
+            },
+        }
+
+
+PROBE = UpstreamProbe()
+
+
+@on_post_fork
+def _reset_probe() -> None:
+    PROBE.reset()
+    PROBE.ensure_started()
+
+
+class HealthMiddleware:
+    """/healthz と /readyz だけを横取りし、それ以外は Flask にそのまま渡す。"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == HEALTH_PATH:
+            start_response("200 OK", _JSON_HEADERS + [("Content-Length", str(len(_HEALTH_BODY)))])
+            return [_HEALTH_BODY]
+        if path == READY_PATH:
+            PROBE.ensure_started()
+            status = PROBE.status()
+            body = json.dumps(status).encode("utf-8")
+            line = "200 OK" if status["status"] == "ready" else "503 Service Unavailable"
+            start_response(line, _JSON_HEADERS + [("Content-Length", str(len(body)))])
+            return [body]
+        return self.wsgi_app(environ, start_response)
+
+
+def init_app(app) -> None:
+    app.wsgi_app = HealthMiddleware(app.wsgi_app)
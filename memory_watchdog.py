@@ -0,0 +1,171 @@
+"""ワーカーのメモリ監視。予算を超えたワーカーだけを graceful に再起動させる。
+
+gunicorn.conf.py の post_worker_init から start() を呼び出す。再起動理由は
+ワーカーが入れ替わっても数えられるよう、全ワーカー共有の集計ファイル（理由ごとの回数）に
+flock 付きで加算する。詳細は JSONL に追記し、WORKER_RECYCLE_LOG_MAX_BYTES を超えたら
+1 世代だけ残してローテートする。/metrics は集計ファイルを（変わったときだけ）読む。
+"""
+import fcntl
+import gc
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from metrics import REGISTRY, Gauge
+from worker_state import format_memory, memory_usage
+
+MEMORY_LIMIT_MB = int(os.environ.get("WORKER_MEMORY_LIMIT_MB", "0"))  # 0 で無効
+PY_BLOCKS_LIMIT = int(os.environ.get("WORKER_PY_BLOCKS_LIMIT", "0"))  # 0 で無効
+CHECK_INTERVAL = float(os.environ.get("WORKER_MEMORY_CHECK_INTERVAL", "10"))
+# gc.get_objects() は追跡中の全オブジェクトのリストを作るので、計測間隔より粗く取る
+GC_OBJECTS_INTERVAL = float(os.environ.get("WORKER_GC_OBJECTS_INTERVAL", "60"))
+RECYCLE_JITTER = float(os.environ.get("WORKER_RECYCLE_JITTER", "30"))
+RECYCLE_LOG = os.environ.get("WORKER_RECYCLE_LOG", "/tmp/worker-recycles.jsonl")
+RECYCLE_LOG_MAX_BYTES = int(os.environ.get("WORKER_RECYCLE_LOG_MAX_BYTES", str(1024 * 1024)))
+RECYCLE_COUNTS = os.environ.get("WORKER_RECYCLE_COUNTS", "/tmp/worker-recycle-counts.json")
+
+WORKER_RSS = Gauge("worker_rss_bytes", "Resident set size of this worker")
+WORKER_USS = Gauge("worker_uss_bytes", "Unique (private) memory of this worker")
+WORKER_PY_BLOCKS = Gauge(
+    "worker_python_allocated_blocks", "sys.getallocatedblocks() of this worker"
+)
+WORKER_GC_OBJECTS = Gauge(
+    "worker_gc_tracked_objects", "Objects tracked by the cyclic GC in this worker"
+)
+
+_lock = threading.Lock()
+_watchdog: Optional["MemoryWatchdog"] = None
+_gc_objects_at = 0.0
+
+
+def _sample() -> Dict[str, int]:
+    global _gc_objects_at
+    usage = memory_usage()
+    blocks = sys.getallocatedblocks()
+    WORKER_RSS.set(usage.get("rss", 0))
+    WORKER_USS.set(usage.get("uss", 0))
+    WORKER_PY_BLOCKS.set(blocks)
+    now = time.monotonic()
+    if now - _gc_objects_at >= GC_OBJECTS_INTERVAL:
+        _gc_objects_at = now
+        WORKER_GC_OBJECTS.set(len(gc.get_objects()))
+    return {**usage, "py_blocks": blocks}
+
+
+def over_budget(sample: Dict[str, int]) -> Optional[str]:
+    """予算超過なら理由（uss / py_blocks）を返す。
+
+    preload 時の RSS の大半は master と共有している Copy-on-Write のページで、再起動しても
+    空かないので、予算はワーカー固有のメモリ（USS）と比べる。
+    """
+    if MEMORY_LIMIT_MB and sample.get("uss", 0) > MEMORY_LIMIT_MB * 1024 * 1024:
+        return "uss"
+    if PY_BLOCKS_LIMIT and sample["py_blocks"] > PY_BLOCKS_LIMIT:
+        return "py_blocks"
+    return None
+
+
+def _read_counts() -> Dict[str, int]:
+    try:
+        with open(RECYCLE_COUNTS, encoding="utf-8") as fh:
+            counts = json.load(fh)
+    except (OSError, ValueError):
+        return {}
+    return {str(k): int(v) for k, v in counts.items()} if isinstance(counts, dict) else {}
+
+
+def _record_recycle(reason: str, sample: Dict[str, int]) -> None:
+    entry = {"ts": time.time(), "pid": os.getpid(), "reason": reason, **sample}
+    try:
+        with open(RECYCLE_COUNTS + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                counts = _read_counts()
+                counts[reason] = counts.get(reason, 0) + 1
+                tmp = f"{RECYCLE_COUNTS}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump(counts, fh)
+                os.replace(tmp, RECYCLE_COUNTS)
+                if os.path.exists(RECYCLE_LOG) and os.path.getsize(RECYCLE_LOG) > RECYCLE_LOG_MAX_BYTES:
+                    os.replace(RECYCLE_LOG, RECYCLE_LOG + ".1")
+                with open(RECYCLE_LOG, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(entry) + "\n")
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    except OSError as exc:
+        print(f"[WATCHDOG] failed to record recycle: {exc}")
+
+
+_counts_cache: Tuple[Optional[Tuple[int, int]], Dict[str, int]] = (None, {})
+
+
+def recycle_counts() -> Dict[str, int]:
+    """理由ごとの再起動回数（集計ファイルが変わっていなければ前回の値を返す）。"""
+    global _counts_cache
+    try:
+        st = os.stat(RECYCLE_COUNTS)
+    except OSError:
+        return {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _counts_cache[0] != stamp:
+        _counts_cache = (stamp, _read_counts())
+    return dict(_counts_cache[1])
+
+
+def _collect_recycles():
+    samples = [("worker_recycles_total", {"reason": r}, n) for r, n in recycle_counts().items()]
+    yield (
+        "worker_recycles_total",
+        "counter",
+        "Graceful worker recycles triggered by the memory watchdog",
+        samples,
+    )
+
+
+REGISTRY.register_collector(_collect_recycles)
+
+
+class MemoryWatchdog(threading.Thread):
+    def __init__(self, recycle: Callable[[], None], log: Callable[[str], None] = print):
+        super().__init__(name="memory-watchdog", daemon=True)
+        self._recycle = recycle
+        self._log = log
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.wait(CHECK_INTERVAL):
+            sample = _sample()
+            reason = over_budget(sample)
+            if reason is None:
+                continue
+            # 全ワーカーが同時に超過しても一斉に抜けないよう、ずらしてから再確認する
+            if self._stopped.wait(random.uniform(0, RECYCLE_JITTER)):
+                return
+            sample = _sample()
+            reason = over_budget(sample)
+            if reason is None:
+                continue
+            _record_recycle(reason, sample)
+            self._log(
+                f"[WATCHDOG] recycling worker pid={os.getpid()} reason={reason} "
+                f"{format_memory(memory_usage())} py_blocks={sample['py_blocks']}"
+            )
+            self._recycle()
+            return
+
+
+def start(recycle: Callable[[], None], log: Callable[[str], None] = print) -> None:
+    """監視スレッドを起動する。予算が未設定なら計測用のサンプリングのみ行う。"""
+    global _watchdog
+    with _lock:
+        if _watchdog is not None and _watchdog.is_alive():
+            return
+        _watchdog = MemoryWatchdog(recycle, log)
+        _watchdog.start()
@@ -0,0 +1,191 @@
+"""PostgREST（Supabase の /rest/v1）への問い合わせと、独立した複数クエリの並列実行。
+
+1 つのコールバックで独立したテーブルを 5 つ読むと、順番に投げれば往復 5 回ぶん待つ。
+gather に並べると、ワーカー共有のスレッドプールで同時に投げ、遅延は最も遅いクエリ 1 本ぶんになる。
+
+    orders, customers = postgrest.gather(
+        postgrest.Query("orders", {"select": "id,total", "status": "eq.open"}),
+        postgrest.Query("customers", {"select": "id,name", "limit": "100"}),
+        deadline=2.0,
+    )
+    if orders.ok:
+        orders.data        # 行のリスト
+    else:
+        orders.error       # PostgrestError / QueryTimeout / UpstreamOverloaded など
+
+- 認証はリクエストしているユーザーのアクセストークン（g.access_token）で行うので、RLS がそのまま効く
+- 結果は渡した順に返る。1 本が失敗・時間切れでも他の結果は返る（例外は Result.error に入る）
+- deadline（秒）を過ぎたクエリは QueryTimeout にする。HTTP のタイムアウトも残り時間に合わせる
+- 接続は requests.Session（ワーカーごと・fork 後に作り直す）で使い回す
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, List, Mapping, Optional
+
+import flask
+import requests
+
+import admission
+import server_timing
+import settings
+from metrics import Counter, Histogram
+from worker_state import on_post_fork
+
+MAX_WORKERS = int(os.environ.get("POSTGREST_FANOUT_WORKERS", "8"))
+DEADLINE_SECONDS = float(os.environ.get("POSTGREST_DEADLINE", "5"))
+TIMEOUT_SECONDS = 30.0
+
+QUERY_SECONDS = Histogram(
+    "postgrest_query_seconds",
+    "PostgREST query latency",
+    ("table",),
+    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+FANOUT_RESULTS = Counter(
+    "postgrest_fanout_results_total",
+    "Fanned-out queries by result (ok, error, timeout)",
+    ("result",),
+)
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"PostgREST status={status}: {message}")
+        self.status = status
+
+
+class QueryTimeout(Exception):
+    pass
+
+
+class Query:
+    def __init__(self, table: str, params: Optional[Mapping[str, str]] = None):
+        self.table = table
+        self.params = dict(params or {})
+
+    def __repr__(self) -> str:
+        return f"Query({self.table!r}, {self.params!r})"
+
+
+class Result:
+    __slots__ = ("query", "data", "error", "elapsed")
+
+    def __init__(self, query: Query, data: Any = None, error: Optional[BaseException] = None, elapsed: float = 0.0):
+        self.query = query
+        self.data = data
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+_lock = threading.Lock()
+_http: Optional[requests.Session] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _http_session() -> requests.Session:
+    global _http
+    if _http is None:
+        with _lock:
+            if _http is None:
+                session = requests.Session()
+                # 並列に投げる本数ぶんの接続を保持する
+                adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=MAX_WORKERS * 2)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http = session
+    return _http
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="postgrest")
+    return _executor
+
+
+@on_post_fork
+def _reset_postgrest() -> None:
+    # master のソケットとスレッドはワーカーに引き継がない
+    global _http, _executor
+    _http = None
+    _executor = None
+
+
+def current_token() -> str:
+    token = flask.g.get("access_token") if flask.has_request_context() else None
+    if not token:
+        raise RuntimeError("no access token in the current request (pass access_token explicitly)")
+    return token
+
+
+def fetch(
+    table: str,
+    params: Optional[Mapping[str, str]] = None,
+    access_token: Optional[str] = None,
+    timeout: float = TIMEOUT_SECONDS,
+) -> Any:
+    """GET /rest/v1/<table>?<params> の JSON を返す。4xx/5xx は PostgrestError。"""
+    cfg = settings.SETTINGS
+    headers = {"apikey": cfg.supabase_key, "Authorization": f"Bearer {access_token or current_token()}"}
+    started = time.perf_counter()
+    # 認証用の UPSTREAM とは別枠（データの取得で認証が 503 にならないように）
+    with admission.POSTGREST.slot(table):
+        resp = _http_session().get(f"{cfg.supabase_url}/rest/v1/{table}", params=params, headers=headers, timeout=timeout)
+    QUERY_SECONDS.observe(time.perf_counter() - started, table=table)
+    if resp.status_code >= 400:
+        try:
+            message = resp.json().get("message", resp.text)
+        except ValueError:
+            message = resp.text
+        raise PostgrestError(resp.status_code, message[:200])
+    return resp.json()
+
+
+def _run(query: Query, token: str, deadline: float) -> Result:
+    started = time.perf_counter()
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return Result(query, error=QueryTimeout(f"{query.table}: deadline passed before start"))
+    try:
+        data = fetch(query.table, query.params, token, timeout=min(remaining, TIMEOUT_SECONDS))
+    except requests.Timeout:
+        return Result(query, error=QueryTimeout(f"{query.table}: timed out"), elapsed=time.perf_counter() - started)
+    except Exception as exc:
+        return Result(query, error=exc, elapsed=time.perf_counter() - started)
+    return Result(query, data=data, elapsed=time.perf_counter() - started)
+
+
+def gather(
+    *queries: Query,
+    deadline: float = DEADLINE_SECONDS,
+    access_token: Optional[str] = None,
+) -> List[Result]:
+    """queries を並列に実行し、同じ順に Result を返す（例外は投げない）。"""
+    token = access_token or current_token()
+    until = time.monotonic() + deadline
+    started = time.perf_counter()
+    futures: List[Future] = [_pool().submit(_run, q, token, until) for q in queries]
+    wait(futures, timeout=deadline)
+    results = []
+    for query, future in zip(queries, futures):
+        if future.done():
+            result = future.result()
+        else:
+            # 実行待ちなら取り消す。実行中のものは HTTP のタイムアウト（残り時間）で終わる
+            future.cancel()
+            result = Result(query, error=QueryTimeout(f"{query.table}: deadline of {deadline}s exceeded"))
+        if result.ok:
+            FANOUT_RESULTS.inc(result="ok")
+        else:
+            FANOUT_RESULTS.inc(result="timeout" if isinstance(result.error, QueryTimeout) else "error")
+        results.append(result)
+    server_timing.add("upstream", time.perf_counter() - started)
+    return results
@@ -0,0 +1,192 @@
+"""ログイン直後に、ユーザーのデータをバックグラウンドでキャッシュに読み込んでおく。
+
+auth_callback がトークン交換に成功してリダイレクトを返した時点では、最初の Dash の描画は
+まだ何も読み込んでいない。ブラウザがリダイレクト先を読み込んでいる間に、登録済みの
+ウォームアップ（dataset_sync の同期、callback_cache.memoize した関数の呼び出し等）を流しておく。
+
+    @prefetch.register("sensor-readings")
+    def _warm_readings():
+        READINGS.get(g.access_token, user_id=g.user["id"])
+
+- ウォームアップ関数は、ログインしたユーザーの g.user / g.access_token を置いた
+  リクエストコンテキストで呼ばれる（コールバックと同じコードでキャッシュが温まる）
+- 1 ユーザーのウォームアップは登録順に 1 つずつ実行し、同時に処理するユーザー数は
+  PREFETCH_WORKERS で上限を付ける。キューが溢れたら捨てる（ページ側で通常どおり読み込まれるだけ）
+- ユーザーの到着: auth_callback が付けた Cookie（ARRIVAL_COOKIE）を持つ最初の認証済みリクエストで
+  記録する（どのワーカーに届いてもよいよう、記録は PREFETCH_DIR の diskcache に置く）。
+  PREFETCH_ARRIVAL_SECONDS 秒経っても到着しなければ残りのウォームアップは実行しない。
+  実行中のものは中断しないが、長いループの中で cancelled() を見れば途中で止められる
+- PREFETCH_TIMEOUT 秒を過ぎたら到着していても残りは実行しない。ログアウトでも取り消す
+- 同じユーザーが PREFETCH_DEDUP_SECONDS 秒以内にもう一度ログインしたら、このワーカーでは繰り返さない
+"""
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import diskcache
+import flask
+
+import settings
+import task_queue
+from metrics import Counter
+from worker_state import on_post_fork
+
+ENABLED = os.environ.get("PREFETCH_ENABLED", "1").strip().lower() not in {"0", "false", "no"}
+WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+QUEUE_SIZE = int(os.environ.get("PREFETCH_QUEUE_SIZE", "100"))
+ARRIVAL_SECONDS = float(os.environ.get("PREFETCH_ARRIVAL_SECONDS", "10"))
+TIMEOUT_SECONDS = float(os.environ.get("PREFETCH_TIMEOUT", "30"))
+DEDUP_SECONDS = float(os.environ.get("PREFETCH_DEDUP_SECONDS", "60"))
+ARRIVALS_DIR = os.environ.get("PREFETCH_DIR", "/tmp/prefetch-arrivals")
+
+ARRIVAL_COOKIE = "sb-prefetch"
+
+JOBS = Counter(
+    "prefetch_jobs_total",
+    "Post-login prefetch jobs by result (started, deduplicated, skipped, arrived)",
+    ("result",),
+)
+TASKS = Counter(
+    "prefetch_tasks_total",
+    "Prefetch warm-ups by result (ok, failed, cancelled, dropped)",
+    ("task", "result"),
+)
+
+QUEUE = task_queue.TaskQueue("prefetch", maxsize=QUEUE_SIZE, workers=WORKERS, max_retries=0)
+# ジョブ ID → 到着時刻（全ワーカーで共有）
+ARRIVALS = diskcache.Cache(ARRIVALS_DIR)
+
+_Warmer = Tuple[str, Callable[[], object]]
+_warmers: List[_Warmer] = []
+_app: Optional[flask.Flask] = None
+
+
+class _Job:
+    def __init__(self, user_id: str):
+        self.id = secrets.token_urlsafe(16)
+        self.user_id = user_id
+        self.started = time.monotonic()
+        self.cancelled = False
+        self._arrived = False
+
+    def arrived(self) -> bool:
+        if not self._arrived:
+            self._arrived = ARRIVALS.get(self.id) is not None
+        return self._arrived
+
+    def stop_reason(self) -> Optional[str]:
+        """残りのウォームアップを実行しない理由（続けてよければ None）。"""
+        age = time.monotonic() - self.started
+        if self.cancelled:
+            return "cancelled"
+        if age > TIMEOUT_SECONDS:
+            return "timeout"
+        if age > ARRIVAL_SECONDS and not self.arrived():
+            return "not_arrived"
+        return None
+
+
+_lock = threading.Lock()
+_jobs: Dict[str, _Job] = {}
+
+
+@on_post_fork
+def _reset_prefetch() -> None:
+    QUEUE.reset()
+    _jobs.clear()
+    # master で開いた SQLite 接続を子で使わないよう閉じる（次の参照で開き直される）
+    ARRIVALS.close()
+
+
+def init_app(app: flask.Flask) -> None:
+    """ウォームアップの実行に使う app を登録し、到着を記録するフックを入れる。"""
+    global _app
+    _app = app
+
+    def _mark_arrival(resp):
+        job_id = flask.request.cookies.get(ARRIVAL_COOKIE)
+        if job_id and flask.g.get("user"):
+            arrived(job_id)
+            resp.set_cookie(ARRIVAL_COOKIE, "", max_age=0, **settings.SETTINGS.http_only_cookie)
+        return resp
+
+    app.after_request(_mark_arrival)
+
+
+def register(name: str):
+    """ログイン直後に実行するウォームアップ関数（引数なし）を登録するデコレータ。"""
+
+    def decorator(func: Callable[[], object]):
+        _warmers.append((name, func))
+        return func
+
+    return decorator
+
+
+def start(resp: flask.Response, access_token: str, user: dict) -> bool:
+    """ユーザーのウォームアップをキューに積み、到着の記録に使う Cookie を resp に付ける。"""
+    user_id = str(user.get("id") or "")
+    if not ENABLED or _app is None or not _warmers or not user_id:
+        JOBS.inc(result="skipped")
+        return False
+    now = time.monotonic()
+    with _lock:
+        for uid in [uid for uid, j in _jobs.items() if now - j.started >= DEDUP_SECONDS]:
+            del _jobs[uid]
+        if user_id in _jobs and not _jobs[user_id].cancelled:
+            JOBS.inc(result="deduplicated")
+            return False
+        job = _jobs[user_id] = _Job(user_id)
+    if not QUEUE.submit(_run, job, access_token, user, task_name="prefetch"):
+        for name, _ in _warmers:
+            TASKS.inc(task=name, result="dropped")
+        return False
+    JOBS.inc(result="started")
+    resp.set_cookie(
+        ARRIVAL_COOKIE, job.id, max_age=int(TIMEOUT_SECONDS), **settings.SETTINGS.http_only_cookie
+    )
+    return True
+
+
+def arrived(job_id: str) -> None:
+    """ログイン後のユーザーが最初のページに来たことを記録する（どのワーカーからでもよい）。"""
+    ARRIVALS.set(job_id, time.time(), expire=TIMEOUT_SECONDS * 2)
+    JOBS.inc(result="arrived")
+
+
+def cancel(user_id: Optional[str]) -> None:
+    """まだ始まっていないウォームアップを取り消す（ログアウト時）。"""
+    with _lock:
+        job = _jobs.pop(str(user_id or ""), None)
+    if job is not None:
+        job.cancelled = True
+
+
+def cancelled() -> bool:
+    """実行中のウォームアップを打ち切るべきか（ウォームアップ関数の長いループの中で見る）。"""
+    job = flask.g.get("prefetch_job") if flask.has_request_context() else None
+    return job is not None and job.stop_reason() is not None
+
+
+def _run(job: _Job, access_token: str, user: dict) -> None:
+    for i, (name, func) in enumerate(_warmers):
+        reason = job.stop_reason()
+        if reason is not None:
+            for rest, _ in _warmers[i:]:
+                TASKS.inc(task=rest, result="cancelled")
+            print(f"[PREFETCH] stopped user={job.user_id} reason={reason} remaining={len(_warmers) - i}")
+            return
+        try:
+            with _app.test_request_context("/"):
+                flask.g.user = user
+                flask.g.access_token = access_token
+                flask.g.prefetch_job = job
+                func()
+        except Exception as exc:
+            # 失敗してもページ側で通常どおり読み込まれるだけなので、再試行しない
+            TASKS.inc(task=name, result="failed")
+            print(f"[PREFETCH] {name} failed user={job.user_id}: {exc}")
+            continue
+        TASKS.inc(task=name, result="ok")
@@ -0,0 +1,211 @@
+"""トークンバケットによるレート制限（/auth/login, /auth/callback 用）。
+
+IP ごとと全体の 2 段で制限し、超過したら PKCE 生成やトークン交換の前に 429 を返す。
+バックエンドはプロセス内メモリ（既定）か、同一ホストの全ワーカーで共有する SQLite。
+
+レートは "回数/秒数" で指定する（例: "10/60" は 60 秒あたり 10 回、バースト 10）。
+"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import flask
+
+from metrics import Counter
+from worker_state import on_post_fork
+
+BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory").strip().lower()
+SQLITE_PATH = os.environ.get("RATE_LIMIT_SQLITE_PATH", "/tmp/rate-limit.sqlite3")
+PER_IP_RATE = os.environ.get("RATE_LIMIT_AUTH_PER_IP", "20/60")
+GLOBAL_RATE = os.environ.get("RATE_LIMIT_AUTH_GLOBAL", "600/60")
+# Render 等のリバースプロキシの段数（X-Forwarded-For の右から数えてクライアントを決める）
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+# SQLite バックエンドで、満タンまで回復したバケットの行を消す頻度（consume のおよそ N 回に 1 回）
+SQLITE_PRUNE_EVERY = int(os.environ.get("RATE_LIMIT_SQLITE_PRUNE_EVERY", "1000"))
+
+DECISIONS = Counter(
+    "rate_limit_decisions_total",
+    "Rate limit checks by route, scope (ip, global) and result (allowed, limited); "
+    "the global check runs only after the ip check allowed",
+    ("route", "scope", "result"),
+)
+BACKEND_ERRORS = Counter(
+    "rate_limit_backend_errors_total",
+    "SQLite errors that fell back to the per-worker in-memory bucket",
+)
+
+
+class Rate:
+    def __init__(self, spec: str):
+        count, _, seconds = spec.partition("/")
+        self.capacity = float(count)
+        self.per_second = float(count) / float(seconds or 1)
+
+    @property
+    def full_after(self) -> float:
+        """空のバケットが満タンに戻るまでの秒数（これより古いバケットは初期状態と同じ）。"""
+        return self.capacity / self.per_second
+
+    def refill(self, tokens: float, elapsed: float) -> float:
+        return min(self.capacity, tokens + max(elapsed, 0.0) * self.per_second)
+
+
+class MemoryBackend:
+    MAX_KEYS = 10000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def consume(self, key: str, rate: Rate) -> float:
+        """1 トークン消費できれば 0、できなければ次に取れるまでの秒数を返す。"""
+        now = time.time()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (rate.capacity, now))
+            tokens = rate.refill(tokens, now - ts)
+            if tokens >= 1.0:
+                self._buckets[key] = (tokens - 1.0, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1.0 - tokens) / rate.per_second
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now, rate)
+        return wait
+
+    def _prune(self, now: float, rate: Rate) -> None:
+        # 満タンまで回復したバケットは初期状態と同じなので捨ててよい
+        full_after = rate.full_after
+        self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < full_after}
+
+
+class SQLiteBackend:
+    """同一ホストのワーカー間で共有するバケット（BEGIN IMMEDIATE で読み書きを直列化）。
+
+    キーは IP ごとに増えるので、consume のおよそ SQLITE_PRUNE_EVERY 回に 1 回、満タンまで
+    回復した（初期状態と同じになった）行を消す。
+    ロック待ちのタイムアウト等で SQLite が使えないときは、止めずに（全て許可・全て拒否にせず）
+    ワーカーごとのメモリのバケットで判定する（制限はワーカー単位に緩むが、ログインは止まらない）。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._fallback = MemoryBackend()
+        # これまでに使われたレートのうち最も長い回復時間（短いレートの基準で消しすぎない）
+        self._full_after = 0.0
+
+    def reset(self) -> None:
+        self._local = threading.local()
+        self._fallback.reset()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, ts REAL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def consume(self, key: str, rate: Rate) -> float:
+        try:
+            return self._consume(key, rate)
+        except sqlite3.Error as exc:
+            BACKEND_ERRORS.inc()
+            print(f"[RATE_LIMIT] sqlite backend failed, using the in-memory bucket: {exc}")
+            return self._fallback.consume(key, rate)
+
+    def _consume(self, key: str, rate: Rate) -> float:
+        conn = self._conn()
+        now = time.time()
+        self._full_after = max(self._full_after, rate.full_after)
+        if SQLITE_PRUNE_EVERY > 0 and random.randrange(SQLITE_PRUNE_EVERY) == 0:
+            self._prune(conn, now)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = rate.refill(row[0], now - row[1]) if row else rate.capacity
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / rate.per_second
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        deleted = conn.execute("DELETE FROM buckets WHERE ts < ?", (now - self._full_after,)).rowcount
+        if deleted:
+            print(f"[RATE_LIMIT] pruned {deleted} refilled buckets")
+
+
+def _make_backend():
+    if BACKEND == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    return MemoryBackend()
+
+
+LIMITER = _make_backend()
+
+
+@on_post_fork
+def _reset_backend() -> None:
+    # SQLite の接続はプロセス間で共有できないため、fork 後に張り直す
+    LIMITER.reset()
+
+
+def client_ip() -> str:
+    if TRUSTED_PROXY_HOPS and flask.request.headers.get("X-Forwarded-For"):
+        # 左側はクライアントが詐称できるので、信頼するプロキシが付けた右側から数える
+        route = flask.request.access_route
+        return route[max(len(route) - TRUSTED_PROXY_HOPS, 0)]
+    return flask.request.remote_addr or "unknown"
+
+
+def check(route: str, per_ip: Rate, global_rate: Rate) -> Optional[float]:
+    """制限内なら None、超過なら Retry-After の秒数を返す。"""
+    for scope, key, rate in (
+        ("ip", f"{route}:ip:{client_ip()}", per_ip),
+        ("global", f"{route}:global", global_rate),
+    ):
+        wait = LIMITER.consume(key, rate)
+        DECISIONS.inc(route=route, scope=scope, result="limited" if wait else "allowed")
+        if wait:
+            return wait
+    return None
+
+
+def init_app(app: flask.Flask, paths: Iterable[str]) -> None:
+    limited = frozenset(paths)
+    per_ip = Rate(PER_IP_RATE)
+    global_rate = Rate(GLOBAL_RATE)
+
+    def _limit():
+        if flask.request.path not in limited:
+            return None
+        wait = check(flask.request.path, per_ip, global_rate)
+        if wait is None:
+            return None
+        resp = flask.make_response("Too many requests", 429)
+        resp.headers["Retry-After"] = str(int(wait) + 1)
+        return resp
+
+    app.before_request(_limit)
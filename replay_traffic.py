@@ -0,0 +1,164 @@
+"""traffic_recorder.py で記録した JSONL をローカルのアプリに再生する負荷試験ツール。
+
+    # 上流のスタブとアプリを起動（アプリは fake_supabase を向ける）
+    python fake_supabase.py --port 54321 --latency-ms 50 &
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_ANON_KEY=x gunicorn -c gunicorn.conf.py app:app &
+    # 記録時の 4 倍速で再生
+    python replay_traffic.py traffic.jsonl --base-url http://127.0.0.1:8000 --speed 4
+
+記録には値が無いため、Dash コールバックは入力値を null にして送る。記録上の匿名ユーザーごとに
+fake_supabase が受け付けるトークン（fake-<user>）を割り当てる。
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from fake_supabase import FAKE_TOKEN_PREFIX, serve
+
+
+def load_entries(path: str) -> List[dict]:
+    entries = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    entries.sort(key=lambda e: e.get("ts", 0.0))
+    return entries
+
+
+def _with_null_values(items):
+    out = []
+    for item in items or []:
+        if isinstance(item, list):
+            out.append(_with_null_values(item))
+        else:
+            out.append({**item, "value": None})
+    return out
+
+
+def dash_body(entry: dict) -> dict:
+    dash = entry.get("dash") or {}
+    return {
+        "output": dash.get("output"),
+        "outputs": dash.get("outputs"),
+        "inputs": _with_null_values(dash.get("inputs")),
+        "state": _with_null_values(dash.get("state")),
+        "changedPropIds": dash.get("changedPropIds", []),
+    }
+
+
+class Replayer:
+    def __init__(self, base_url: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.recorded: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Counter = Counter()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def send(self, entry: dict) -> None:
+        key = f"{entry.get('method', 'GET')} {entry.get('callback') or entry.get('route')}"
+        cookies = {}
+        if entry.get("user"):
+            cookies["sb-access-token"] = f"{FAKE_TOKEN_PREFIX}{entry['user']}"
+        started = time.perf_counter()
+        try:
+            resp = self._session().request(
+                entry.get("method", "GET"),
+                self.base_url + entry.get("path", "/"),
+                json=dash_body(entry) if entry.get("dash") else None,
+                cookies=cookies,
+                timeout=self.timeout,
+                allow_redirects=False,
+            )
+            status = str(resp.status_code)
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.statuses[status] += 1
+            self.latencies[key].append(elapsed * 1000)
+            if "duration_ms" in entry:
+                self.recorded[key].append(entry["duration_ms"])
+
+    def report(self) -> str:
+        lines = [f"statuses: {dict(self.statuses)}"]
+        lines.append(f"{'request':<60}{'n':>6}{'p50':>9}{'p95':>9}{'rec p50':>9}")
+        for key, values in sorted(self.latencies.items(), key=lambda kv: -len(kv[1])):
+            values = sorted(values)
+            rec = self.recorded.get(key) or [0.0]
+            lines.append(
+                f"{key[:59]:<60}{len(values):>6}{statistics.median(values):>9.1f}"
+                f"{values[max(int(len(values) * 0.95) - 1, 0)]:>9.1f}{statistics.median(rec):>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+def replay(entries: List[dict], replayer: Replayer, speed: float, concurrency: int) -> float:
+    """記録時刻の間隔を speed 倍に縮めて送る。経過秒を返す。"""
+    if not entries:
+        return 0.0
+    t0 = entries[0].get("ts", 0.0)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            due = (entry.get("ts", t0) - t0) / speed
+            delay = due - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(replayer.send, entry)
+    return time.monotonic() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="traffic_recorder が書いた JSONL")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="再生速度の倍率（2 で 2 倍の頻度）")
+    parser.add_argument("--repeat", type=int, default=1, help="記録を何周再生するか")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument(
+        "--fake-supabase-port",
+        type=int,
+        default=0,
+        help="指定するとこのポートで fake_supabase を同じプロセス内に起動する",
+    )
+    parser.add_argument("--fake-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.fake_supabase_port:
+        upstream = serve(port=args.fake_supabase_port, latency_ms=args.fake_latency_ms)
+        threading.Thread(target=upstream.serve_forever, daemon=True).start()
+
+    entries = load_entries(args.path)
+    replayer = Replayer(args.base_url, args.timeout)
+    total = 0.0
+    for _ in range(args.repeat):
+        total += replay(entries, replayer, args.speed, args.concurrency)
+    sent = sum(replayer.statuses.values())
+    print(f"replayed {sent} requests in {total:.1f}s ({sent / total if total else 0:.1f} req/s)")
+    print(replayer.report())
+
+
+if __name__ == "__main__":
+    main()
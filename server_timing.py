@@ -0,0 +1,75 @@
+"""リクエスト単位の処理時間を Server-Timing ヘッダで返す（ブラウザの devtools で確認できる）。
+
+SERVER_TIMING=off | admin（既定: 管理者のリクエストのみ）| all（settings.py で検証し、SIGHUP で読み直す）
+"""
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+import flask
+
+import settings
+
+DESCRIPTIONS = {
+    "auth": "auth verification",
+    "upstream": "Supabase HTTP",
+    "callback": "Dash callback",
+    "serialize": "JSON encode",
+    "total": "total",
+}
+
+
+def _store() -> Optional[Dict[str, float]]:
+    # 記録は常に行い（callback_profiler も参照する）、ヘッダに出すかは SERVER_TIMING で決める
+    if not flask.has_request_context():
+        return None
+    return flask.g.setdefault("server_timing", {})
+
+
+def add(name: str, seconds: float) -> None:
+    store = _store()
+    if store is not None:
+        store[name] = store.get(name, 0.0) + seconds
+
+
+def elapsed(name: str) -> float:
+    store = _store()
+    return store.get(name, 0.0) if store else 0.0
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(name, time.perf_counter() - started)
+
+
+def header_value(spans: Dict[str, float], total: float) -> str:
+    parts = []
+    for name, seconds in list(spans.items()) + [("total", total)]:
+        desc = DESCRIPTIONS.get(name)
+        part = f"{name};dur={seconds * 1000:.1f}"
+        parts.append(f'{part};desc="{desc}"' if desc else part)
+    return ", ".join(parts)
+
+
+def init_app(app: flask.Flask, is_admin: Callable[[object], bool]) -> None:
+    def _start():
+        flask.g.server_timing_started = time.perf_counter()
+
+    def _emit(resp):
+        started = flask.g.get("server_timing_started")
+        if started is None:
+            return resp
+        mode = settings.SETTINGS.server_timing
+        if mode == "off" or (mode != "all" and not is_admin(flask.g.get("user"))):
+            return resp
+        spans = flask.g.get("server_timing", {})
+        resp.headers["Server-Timing"] = header_value(spans, time.perf_counter() - started)
+        return resp
+
+    # 認証より前に計測を始めるため、before_request の先頭に入れる
+    app.before_request_funcs.setdefault(None, []).insert(0, _start)
+    app.after_request(_emit)
@@ -0,0 +1,193 @@
+"""アプリ設定（起動時に一度だけ読み込んで検証する、変更不可のオブジェクト）。
+
+リクエスト処理中は `settings.SETTINGS.<属性>` を読むだけで、環境変数を引き直さない。
+SIGHUP を受けると .env と環境変数を読み直し、検証を通ったときだけ SETTINGS を
+新しいオブジェクトに差し替える（ワーカーは再起動しない。失敗時は古い設定のまま）。
+
+SECRET_KEY はセッションや検証済み Cookie の署名に使うため、ここには含めず再起動で変更する。
+未設定（または既定値のまま）なら検証済み Cookie は使えない（AUTH_VERIFIED_TTL > 0 は検証エラー）。
+"""
+import os
+import signal
+import threading
+import urllib.parse
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, FrozenSet, Mapping, Optional
+
+from dotenv import dotenv_values, load_dotenv
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DOTENV_PATH = os.path.join(PROJECT_ROOT, ".env")
+
+_SAMESITE_VALUES = {"lax": "Lax", "strict": "Strict", "none": "None"}
+_TRUE_VALUES = {"1", "true", "yes"}
+_SERVER_TIMING_MODES = {"off", "admin", "all"}
+# SECRET_KEY 未設定時のフォールバック（Flask セッション用）。誰でも知っている値なので署名には使わない
+DEFAULT_SECRET_KEY = "change-me"
+
+
+class SettingsError(ValueError):
+    """設定値が不正（起動時は例外、リロード時は古い設定を維持する）。"""
+
+
+@dataclass(frozen=True)
+class Settings:
+    supabase_url: str
+    supabase_key: str = field(repr=False)
+    app_base_url: str
+    cookie_secure: bool
+    cookie_samesite: str
+    cookie_domain: Optional[str]
+    auth_debug: bool
+    auth_verified_ttl: int
+    audit_table: str
+    # 認可・診断まわり（authz.py / metrics.py / server_timing.py / debug_profiler.py が参照する）
+    admin_emails: FrozenSet[str]
+    authz_policy_file: str
+    metrics_token: str = field(repr=False)
+    server_timing: str
+    debug_profiling: bool
+    # set_cookie に渡す引数のひな形（max_age 以外）。毎回 dict を組み立てない
+    http_only_cookie: Mapping[str, Any] = field(init=False, repr=False)
+    script_cookie: Mapping[str, Any] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        base = {
+            "secure": self.cookie_secure,
+            "samesite": self.cookie_samesite,
+            "domain": self.cookie_domain,
+            "path": "/",
+        }
+        object.__setattr__(self, "http_only_cookie", MappingProxyType({**base, "httponly": True}))
+        object.__setattr__(self, "script_cookie", MappingProxyType({**base, "httponly": False}))
+
+
+def _bool(env: Mapping[str, str], name: str, default: str = "false") -> bool:
+    return env.get(name, default).strip().lower() in _TRUE_VALUES
+
+
+def _int(env: Mapping[str, str], name: str, default: str) -> int:
+    raw = env.get(name) or default
+    try:
+        return int(raw)
+    except ValueError:
+        raise SettingsError(f"{name} must be an integer: {raw!r}") from None
+
+
+def secret_key_configured(value: Optional[str]) -> bool:
+    """SECRET_KEY が設定されていて、既定値のままでないか。"""
+    return bool(value and value.strip()) and value.strip() != DEFAULT_SECRET_KEY
+
+
+def _http_url(name: str, value: str) -> str:
+    parsed = urllib.parse.urlparse(value)
+    if parsed.scheme not in {"http", "https"} or not parsed.netloc:
+        raise SettingsError(f"{name} must be an http(s) URL: {value!r}")
+    return value.rstrip("/")
+
+
+def load(env: Optional[Mapping[str, str]] = None) -> Settings:
+    """環境変数から Settings を作る。不正な値は SettingsError。"""
+    env = os.environ if env is None else env
+
+    supabase_url = env.get("SUPABASE_URL", "")
+    if supabase_url:
+        supabase_url = _http_url("SUPABASE_URL", supabase_url)
+
+    samesite_raw = env.get("COOKIE_SAMESITE", "Lax")
+    samesite = _SAMESITE_VALUES.get(samesite_raw.strip().lower())
+    if samesite is None:
+        raise SettingsError(f"COOKIE_SAMESITE must be Lax, Strict or None: {samesite_raw!r}")
+    secure = _bool(env, "COOKIE_SECURE")
+    if samesite == "None" and not secure:
+        raise SettingsError("COOKIE_SAMESITE=None requires COOKIE_SECURE=true")
+
+    # 検証済み Cookie は SECRET_KEY で署名するので、鍵が無ければ既定で無効にする
+    secret_ok = secret_key_configured(env.get("SECRET_KEY"))
+    verified_ttl = _int(env, "AUTH_VERIFIED_TTL", "60" if secret_ok else "0")
+    if verified_ttl < 0:
+        raise SettingsError(f"AUTH_VERIFIED_TTL must be >= 0: {verified_ttl}")
+    if verified_ttl > 0 and not secret_ok:
+        raise SettingsError("AUTH_VERIFIED_TTL > 0 requires SECRET_KEY to be set to a non-default value")
+
+    server_timing = env.get("SERVER_TIMING", "admin").strip().lower()
+    if server_timing not in _SERVER_TIMING_MODES:
+        raise SettingsError(f"SERVER_TIMING must be off, admin or all: {server_timing!r}")
+    policy_file = env.get("AUTHZ_POLICY_FILE", "")
+    if policy_file and not os.path.isfile(policy_file):
+        raise SettingsError(f"AUTHZ_POLICY_FILE does not exist: {policy_file!r}")
+
+    return Settings(
+        supabase_url=supabase_url,
+        supabase_key=env.get("SUPABASE_ANON_KEY") or env.get("SUPABASE_KEY", ""),
+        app_base_url=_http_url("APP_BASE_URL", env.get("APP_BASE_URL") or "http://127.0.0.1:8000"),
+        cookie_secure=secure,
+        cookie_samesite=samesite,
+        cookie_domain=env.get("COOKIE_DOMAIN") or None,
+        auth_debug=_bool(env, "AUTH_DEBUG"),
+        auth_verified_ttl=verified_ttl,
+        audit_table=env.get("AUDIT_TABLE", ""),
+        admin_emails=frozenset(
+            e.strip().lower() for e in env.get("ADMIN_EMAILS", "").split(",") if e.strip()
+        ),
+        authz_policy_file=policy_file,
+        metrics_token=env.get("METRICS_TOKEN", ""),
+        server_timing=server_timing,
+        debug_profiling=_bool(env, "DEBUG_PROFILING"),
+    )
+
+
+# プラットフォーム（Render のダッシュボード等）が渡した環境変数。.env より常に優先する
+_PROCESS_ENV_KEYS = frozenset(os.environ)
+load_dotenv(dotenv_path=DOTENV_PATH, override=False)
+SETTINGS = load()
+if not SETTINGS.supabase_url or not SETTINGS.supabase_key:
+    print("[SETTINGS] SUPABASE_URL / SUPABASE_ANON_KEY is not set; login will fail")
+if not secret_key_configured(os.environ.get("SECRET_KEY")):
+    print("[SETTINGS] SECRET_KEY is not set; verified cookies are disabled")
+
+_reload_lock = threading.Lock()
+
+
+def _reload_dotenv() -> None:
+    """.env を読み直して os.environ に反映する（起動時と同じく、環境変数で渡された値は上書きしない）。"""
+    values = {k: v for k, v in dotenv_values(DOTENV_PATH).items() if v is not None}
+    shadowed = sorted(k for k, v in values.items() if k in _PROCESS_ENV_KEYS and os.environ.get(k) != v)
+    for key, value in values.items():
+        if key not in _PROCESS_ENV_KEYS:
+            os.environ[key] = value
+    if shadowed:
+        print(f"[SETTINGS] .env values ignored (set in the environment): {','.join(shadowed)}")
+
+
+def reload() -> bool:
+    """.env を読み直して SETTINGS を差し替える。検証に失敗したら古い設定のまま False。"""
+    global SETTINGS
+    with _reload_lock:
+        _reload_dotenv()
+        try:
+            new = load()
+        except SettingsError as exc:
+            print(f"[SETTINGS] reload rejected, keeping previous settings: {exc}")
+            return False
+        changed = [
+            name
+            for name, f in Settings.__dataclass_fields__.items()
+            if f.init and getattr(new, name) != getattr(SETTINGS, name)
+        ]
+        SETTINGS = new
+    print(f"[SETTINGS] reloaded pid={os.getpid()} changed={','.join(changed) or '-'}")
+    return True
+
+
+def install_sighup_handler() -> None:
+    """SIGHUP で reload() する（gunicorn ワーカー・単体起動のメインスレッドから呼ぶ）。
+
+    シグナルハンドラ内でファイル I/O やロック待ちをしないよう、別スレッドで読み直す。
+    """
+
+    def _handle(signum, frame):
+        threading.Thread(target=reload, name="settings-reload", daemon=True).start()
+
+    signal.signal(signal.SIGHUP, _handle)
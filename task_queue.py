@@ -0,0 +1,152 @@
+"""プロセス内のバックグラウンドタスクキュー（上流への fire-and-forget 処理用）。
+
+キューは上限付きで、溢れた分は捨ててメトリクスに数える。失敗したタスクは
+指数バックオフ（ジッター付き）で再試行する。ワーカースレッドは最初の submit で起動し、
+fork 後のワーカーでは作り直す。
+"""
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+from metrics import Counter, Gauge, Histogram
+from worker_state import on_post_fork
+
+QUEUE_SIZE = int(os.environ.get("TASK_QUEUE_SIZE", "1000"))
+QUEUE_WORKERS = int(os.environ.get("TASK_QUEUE_WORKERS", "2"))
+MAX_RETRIES = int(os.environ.get("TASK_QUEUE_RETRIES", "3"))
+RETRY_BACKOFF = float(os.environ.get("TASK_QUEUE_BACKOFF", "0.5"))
+
+TASKS = Counter(
+    "background_tasks_total",
+    "Background tasks by result (succeeded, failed, retried, dropped)",
+    ("task", "result"),
+)
+TASK_SECONDS = Histogram("background_task_seconds", "Background task run time", ("task",))
+
+
+class RetryableError(Exception):
+    """再試行すべき失敗（上流の 5xx・接続エラー等）。それ以外の例外は再試行しない。"""
+
+
+_Item = Tuple[str, Callable[..., Any], tuple, dict, int]
+
+
+class TaskQueue:
+    def __init__(
+        self,
+        name: str,
+        maxsize: int = QUEUE_SIZE,
+        workers: int = QUEUE_WORKERS,
+        max_retries: int = MAX_RETRIES,
+        backoff: float = RETRY_BACKOFF,
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[_Item]]" = queue.Queue(maxsize)
+        self._threads: list = []
+        self._running = 0
+        Gauge(f"{name}_queue_depth", "Tasks waiting in the background queue", func=self.depth)
+        Gauge(f"{name}_queue_running", "Tasks currently running", func=lambda: self._running)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def reset(self) -> None:
+        """fork 後に呼ぶ。親のスレッドは子に引き継がれないため、キューごと作り直す。"""
+        self._queue = queue.Queue(self.maxsize)
+        self._threads = []
+        self._running = 0
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, func: Callable[..., Any], *args, task_name: str = "", **kwargs) -> bool:
+        """タスクを積む。キューが満杯なら捨てて False を返す（呼び出し側は待たない）。"""
+        name = task_name or getattr(func, "__name__", "task")
+        self._ensure_started()
+        return self._put((name, func, args, kwargs, 0))
+
+    def _put(self, item: _Item) -> bool:
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            TASKS.inc(task=item[0], result="dropped")
+            return False
+
+    def _retry_later(self, item: _Item) -> None:
+        name, func, args, kwargs, attempt = item
+        delay = self.backoff * (2**attempt) * random.uniform(0.5, 1.5)
+        timer = threading.Timer(delay, self._put, args=((name, func, args, kwargs, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            item = q.get()
+            if item is None:
+                q.task_done()
+                return
+            name, func, args, kwargs, attempt = item
+            with self._lock:
+                self._running += 1
+            started = time.perf_counter()
+            try:
+                func(*args, **kwargs)
+                TASKS.inc(task=name, result="succeeded")
+            except RetryableError as exc:
+                if attempt < self.max_retries:
+                    TASKS.inc(task=name, result="retried")
+                    self._retry_later(item)
+                else:
+                    TASKS.inc(task=name, result="failed")
+                    print(f"[TASK] {name} failed after {attempt + 1} attempts: {exc}")
+            except Exception as exc:
+                TASKS.inc(task=name, result="failed")
+                print(f"[TASK] {name} failed: {exc}")
+            finally:
+                with self._lock:
+                    self._running -= 1
+                TASK_SECONDS.observe(time.perf_counter() - started, task=name)
+                q.task_done()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """積まれているタスクを timeout 秒まで処理してから止める（ワーカー終了時用）。"""
+        if not self._threads:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+
+BACKGROUND = TaskQueue("background")
+
+
+@on_post_fork
+def _reset_background_queue() -> None:
+    BACKGROUND.reset()
+
+
+def submit(func: Callable[..., Any], *args, task_name: str = "", **kwargs) -> bool:
+    return BACKGROUND.submit(func, *args, task_name=task_name, **kwargs)
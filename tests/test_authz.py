@@ -0,0 +1,86 @@
+import dataclasses
+import json
+
+import flask
+import pytest
+from werkzeug.exceptions import Forbidden
+
+import authz
+import settings
+
+POLICY = authz.Policy(
+    [
+        {"path": "/", "roles": ["*"]},
+        {"path": "/reports", "roles": ["analyst", "admin"]},
+        {"path": "/reports/upload", "methods": ["POST"], "roles": ["admin"]},
+        {"path": "/reports/public", "roles": ["*"]},
+    ]
+)
+
+
+@pytest.mark.parametrize(
+    "path, method, roles, allowed",
+    [
+        ("/", "GET", set(), True),
+        ("/dashboard", "GET", {"authenticated"}, True),
+        ("/reports", "GET", {"authenticated"}, False),
+        ("/reports", "GET", {"analyst"}, True),
+        ("/reports/2024/q1", "GET", {"analyst"}, True),  # 最も長く一致した /reports が効く
+        ("/reports/public/x", "GET", set(), True),
+        ("/reports/upload", "POST", {"analyst"}, False),
+        ("/reports/upload", "POST", {"admin"}, True),
+        ("/reports/upload", "GET", {"analyst"}, True),  # POST 以外は /reports に委ねる
+        ("/reportsx", "GET", set(), True),  # セグメント単位なので /reports には一致しない
+        ("//reports//", "GET", {"authenticated"}, False),
+    ],
+)
+def test_longest_segment_match(path, method, roles, allowed):
+    assert POLICY.allows(path, method, frozenset(roles)) is allowed
+
+
+def test_unmatched_path_is_denied():
+    policy = authz.Policy([{"path": "/app", "roles": ["*"]}])
+    assert policy.roles_for_path("/other") == frozenset()
+    assert not policy.allows("/other", "GET", frozenset({"admin"}))
+
+
+def test_default_policy_protects_diagnostics():
+    policy = authz.load_policy("")
+    assert policy.allows("/", "GET", frozenset())
+    assert not policy.allows("/_diagnostics/callbacks", "GET", frozenset({"authenticated"}))
+    assert policy.allows("/debug/profile", "GET", frozenset({"admin"}))
+
+
+def test_load_policy_from_file(tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text(json.dumps([{"path": "/ops", "methods": ["delete"], "roles": ["ops"]}]))
+    policy = authz.load_policy(str(path))
+    assert policy.allows("/ops", "DELETE", frozenset({"ops"}))
+    assert not policy.allows("/ops", "GET", frozenset({"ops"}))
+
+
+def test_roles_from_claims_and_admin_emails(monkeypatch):
+    monkeypatch.setattr(
+        settings, "SETTINGS", dataclasses.replace(settings.SETTINGS, admin_emails=frozenset({"boss@example.com"}))
+    )
+    user = {"role": "authenticated", "email": "Boss@Example.com", "app_metadata": {"role": "analyst", "roles": ["ops"]}}
+    assert authz.roles_for(user) == {"authenticated", "analyst", "ops", "admin"}
+    assert authz.roles_for({"email": "someone@example.com"}) == frozenset()
+    assert authz.roles_for(None) == frozenset()
+
+
+def test_requires_raises_forbidden(monkeypatch):
+    monkeypatch.setattr(authz, "POLICY", POLICY)
+
+    @authz.requires("/reports")
+    def run_report():
+        return "ok"
+
+    app = flask.Flask(__name__)
+    with app.test_request_context("/"):
+        flask.g.user = {"role": "authenticated"}
+        with pytest.raises(Forbidden):
+            run_report()
+    with app.test_request_context("/"):
+        flask.g.user = {"role": "authenticated", "app_metadata": {"role": "analyst"}}
+        assert run_report() == "ok"
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+from werkzeug.exceptions import Forbidden
+
+import callback_coalescer
+from callback_coalescer import Coalescer, request_key
+
+BODY = {
+    "output": "out.children",
+    "inputs": [{"id": "btn", "property": "n_clicks", "value": 1}],
+    "state": [],
+    "changedPropIds": ["btn.n_clicks"],
+}
+
+
+def _run_concurrently(coalescer, execute, n):
+    """同じキーで n 本同時に run し、(種類 or 例外) のリストを返す。先頭の 1 本が実行中になってから残りを投げる。"""
+    results = [None] * n
+    started = threading.Event()
+
+    def leader_execute():
+        started.set()
+        return execute()
+
+    def call(i, fn):
+        try:
+            results[i] = coalescer.run("key", fn)
+        except Exception as exc:
+            results[i] = exc
+
+    leader = threading.Thread(target=call, args=(0, leader_execute))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=call, args=(i, execute)) for i in range(1, n)]
+    for t in followers:
+        t.start()
+    time.sleep(0.05)  # 合流する側が待ちに入るまで
+    return leader, followers, results
+
+
+def test_request_key_normalizes_changed_props_and_separates_users():
+    reordered = dict(BODY, changedPropIds=list(reversed(BODY["changedPropIds"] + ["x.value"])))
+    assert request_key("u", dict(BODY, changedPropIds=["btn.n_clicks", "x.value"])) == request_key("u", reordered)
+    assert request_key("u", BODY) != request_key("v", BODY)
+    assert request_key("u", BODY) != request_key("u", dict(BODY, inputs=[{"id": "btn", "value": 2}]))
+    assert request_key("u", BODY, b"job=1") != request_key("u", BODY, b"job=2")
+
+
+def test_identical_requests_execute_once():
+    coalescer = Coalescer(memo_seconds=0)
+    calls = []
+    release = threading.Event()
+
+    def execute():
+        calls.append(1)
+        release.wait(2)
+        return 200, [], b"result"
+
+    leader, followers, results = _run_concurrently(coalescer, execute, 4)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(2)
+    assert len(calls) == 1
+    assert results[0] == ("executed", (200, [], b"result"))
+    assert results[1:] == [("joined", (200, [], b"result"))] * 3
+    # 終わった後の同じ要求は（メモ無しなら）もう一度実行する
+    assert coalescer.run("key", lambda: (200, [], b"again")) == ("executed", (200, [], b"again"))
+
+
+def test_failure_is_raised_as_a_separate_exception_per_joiner():
+    coalescer = Coalescer(memo_seconds=0)
+    release = threading.Event()
+
+    def execute():
+        release.wait(2)
+        raise Forbidden("nope")
+
+    leader, followers, results = _run_concurrently(coalescer, execute, 3)
+    release.set()
+    for t in [leader, *followers]:
+        t.join(2)
+    assert all(isinstance(r, Forbidden) for r in results)
+    assert len({id(r) for r in results}) == 3
+    assert results[1].__cause__ is results[0] and results[2].__cause__ is results[0]
+
+
+def test_memo_serves_recent_successes_only():
+    coalescer = Coalescer(memo_seconds=60, memo_max_entries=2)
+    assert coalescer.run("a", lambda: (200, [], b"a"))[0] == "executed"
+    assert coalescer.run("a", lambda: pytest.fail("should be memoized")) == ("memo", (200, [], b"a"))
+    assert coalescer.run("e", lambda: (204, [], b""))[0] == "executed"
+    assert coalescer.run("e", lambda: (204, [], b""))[0] == "executed"  # 200 以外は覚えない
+    coalescer.run("b", lambda: (200, [], b"b"))
+    coalescer.run("c", lambda: (200, [], b"c"))
+    assert coalescer.run("a", lambda: (200, [], b"a2")) == ("executed", (200, [], b"a2"))  # LRU で溢れた
+
+
+def test_memo_expires(monkeypatch):
+    coalescer = Coalescer(memo_seconds=5)
+    now = [100.0]
+    monkeypatch.setattr(callback_coalescer.time, "monotonic", lambda: now[0])
+    coalescer.run("a", lambda: (200, [], b"a"))
+    now[0] += 6
+    assert coalescer.run("a", lambda: (200, [], b"new")) == ("executed", (200, [], b"new"))
+
+
+def _dash_app(coalescer, fail=False):
+    from dash import Dash, Input, Output, html
+
+    dash_app = Dash(__name__)
+    dash_app.layout = html.Div([html.Button(id="btn"), html.Div(id="out")])
+
+    @dash_app.callback(Output("out", "children"), Input("btn", "n_clicks"))
+    def update(n):
+        if fail:
+            raise ValueError("boom")
+        return str(n)
+
+    callback_coalescer.install(dash_app, coalescer)
+    return dash_app
+
+
+def _post(dash_app):
+    body = dict(BODY, outputs={"id": "out", "property": "children"})
+    return dash_app.server.test_client().post("/_dash-update-component", json=body)
+
+
+def test_installed_dispatch_counts_executed_and_failed_requests():
+    ok = _dash_app(Coalescer(memo_seconds=0))
+    before = callback_coalescer.COALESCED.value(callback="out.children", result="executed")
+    assert _post(ok).status_code == 200
+    assert callback_coalescer.COALESCED.value(callback="out.children", result="executed") == before + 1
+
+    failing = _dash_app(Coalescer(memo_seconds=0), fail=True)
+    before = callback_coalescer.COALESCED.value(callback="out.children", result="error")
+    assert _post(failing).status_code == 500
+    assert callback_coalescer.COALESCED.value(callback="out.children", result="error") == before + 1
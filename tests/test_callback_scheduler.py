@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+import callback_scheduler
+from callback_scheduler import BACKGROUND, INTERACTIVE, CallbackRejected, FairScheduler
+
+
+def _acquire_in_thread(scheduler, user, priority=INTERACTIVE, granted=None):
+    """別スレッドで acquire し、枠を取れたら granted に user を追加する（待ち行列に並んだら戻る）。"""
+    granted = granted if granted is not None else []
+    before = scheduler.queued
+
+    def run():
+        try:
+            scheduler.acquire(user, priority)
+        except CallbackRejected as exc:
+            granted.append(("rejected", user, exc.reason))
+            return
+        granted.append(user)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 2
+    while scheduler.queued == before and thread.is_alive() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return thread, granted
+
+
+def test_per_user_cap_leaves_slots_for_other_users():
+    scheduler = FairScheduler(max_concurrency=4, max_per_user=2, wait_seconds=5)
+    assert scheduler.acquire("heavy") == 0.0
+    assert scheduler.acquire("heavy") == 0.0
+    # heavy の 3 本目は全体に空きがあっても待たされる
+    thread, granted = _acquire_in_thread(scheduler, "heavy")
+    assert scheduler.queued == 1 and granted == []
+    # 別ユーザーは待たずに実行できる
+    assert scheduler.acquire("light") == 0.0
+    assert scheduler.total_running == 3
+    scheduler.release("heavy")
+    thread.join(2)
+    assert granted == ["heavy"]
+
+
+def test_second_user_is_not_starved_by_a_queue_of_first_user_callbacks():
+    scheduler = FairScheduler(max_concurrency=1, max_per_user=1, max_queued_per_user=8, wait_seconds=5)
+    scheduler.acquire("a")
+    granted = []
+    threads = [_acquire_in_thread(scheduler, "a", granted=granted)[0] for _ in range(3)]
+    threads.append(_acquire_in_thread(scheduler, "b", granted=granted)[0])
+    assert scheduler.queued == 4
+    # a が 1 本終わると、先に並んだ a の残りではなく実行中 0 本の b に枠が渡る
+    scheduler.release("a")
+    deadline = time.monotonic() + 2
+    while not granted and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert granted == ["b"]
+    for user in ["b", "a", "a", "a"]:
+        scheduler.release(user)
+    for thread in threads:
+        thread.join(2)
+    assert granted == ["b", "a", "a", "a"]
+    assert scheduler.total_running == 0 and scheduler.queued == 0
+    assert scheduler._last_grant == {}  # 実行中・待機中でないユーザーの記録は残さない
+
+
+def test_interactive_callbacks_go_before_interval_callbacks():
+    scheduler = FairScheduler(max_concurrency=1, max_per_user=4, wait_seconds=5)
+    scheduler.acquire("holder")
+    granted = []
+    background, _ = _acquire_in_thread(scheduler, "poller", BACKGROUND, granted)
+    interactive, _ = _acquire_in_thread(scheduler, "clicker", INTERACTIVE, granted)
+    scheduler.release("holder")
+    interactive.join(2)
+    assert granted == ["clicker"]
+    scheduler.release("clicker")
+    background.join(2)
+    assert granted == ["clicker", "poller"]
+
+
+def test_rejections():
+    scheduler = FairScheduler(max_concurrency=1, max_per_user=1, max_queued=2, max_queued_per_user=1, wait_seconds=0.05)
+    scheduler.acquire("a")
+    with pytest.raises(CallbackRejected) as timeout:
+        scheduler.acquire("a")
+    assert timeout.value.reason == "timeout"
+    assert scheduler.queued == 0  # 時間切れの待機者は待ち行列から外れる
+
+    scheduler.wait_seconds = 5
+    t1, _ = _acquire_in_thread(scheduler, "b")
+    with pytest.raises(CallbackRejected) as user_full:
+        scheduler.acquire("b")
+    assert user_full.value.reason == "user_queue_full"
+    t2, _ = _acquire_in_thread(scheduler, "c")
+    with pytest.raises(CallbackRejected) as full:
+        scheduler.acquire("d")
+    assert full.value.reason == "queue_full"
+    for user in ["a", "b", "c"]:
+        scheduler.release(user)
+    t1.join(2)
+    t2.join(2)
+
+
+@pytest.mark.parametrize(
+    "changed, expected",
+    [
+        (["clock.n_intervals"], BACKGROUND),
+        (["clock.n_intervals", "other-clock.n_intervals"], BACKGROUND),
+        (["clock.n_intervals", "button.n_clicks"], INTERACTIVE),
+        ([], INTERACTIVE),
+    ],
+)
+def test_classify(changed, expected):
+    assert callback_scheduler.classify({"changedPropIds": changed}) == expected
+
+
+def test_install_returns_503_when_rejected(monkeypatch):
+    from dash import Dash, Input, Output, html
+
+    dash_app = Dash(__name__)
+    dash_app.layout = html.Div([html.Button(id="btn"), html.Div(id="out")])
+
+    @dash_app.callback(Output("out", "children"), Input("btn", "n_clicks"))
+    def update(n):
+        return str(n)
+
+    scheduler = FairScheduler(max_concurrency=1, max_per_user=1, max_queued=0)
+    callback_scheduler.install(dash_app, scheduler)
+    client = dash_app.server.test_client()
+    body = {
+        "output": "out.children",
+        "outputs": {"id": "out", "property": "children"},
+        "inputs": [{"id": "btn", "property": "n_clicks", "value": 1}],
+        "changedPropIds": ["btn.n_clicks"],
+    }
+    assert client.post("/_dash-update-component", json=body).status_code == 200
+    assert scheduler.total_running == 0  # 実行後に枠を返す
+    scheduler.acquire("anon:127.0.0.1")
+    resp = client.post("/_dash-update-component", json=body)
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(callback_scheduler.RETRY_AFTER_SECONDS)
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import dataset_store
+from dataset_store import DatasetStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(root=str(tmp_path / "datasets"), max_bytes=1 << 30)
+
+
+def _columns(n=5, offset=0):
+    return {"id": np.arange(n) + offset, "value": np.linspace(0, 1, n) + offset}
+
+
+def test_build_once_then_open_read_only_mmap(store):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return _columns()
+
+    first = store.get("readings", build, user_id="u1")
+    second = store.get("readings", build, user_id="u1")
+    assert len(builds) == 1
+    assert second is first
+    assert isinstance(first["value"], np.memmap)
+    with pytest.raises(ValueError):
+        first["value"][0] = 9  # 読み取り専用
+    # 別のワーカー（別インスタンス）は作り直さずにファイルを開く
+    other = DatasetStore(root=store.root).get("readings", build, user_id="u1")
+    assert len(builds) == 1
+    np.testing.assert_array_equal(other["id"], first["id"])
+
+
+def test_keys_separate_users_and_params(store):
+    a = store.get("readings", lambda: _columns(offset=0), user_id="u1")
+    b = store.get("readings", lambda: _columns(offset=100), user_id="u2")
+    c = store.get("readings", lambda: _columns(offset=200), user_id="u1", params={"device": 3})
+    assert len({a.key, b.key, c.key}) == 3
+    assert b["id"][0] == 100 and c["id"][0] == 200
+
+
+def test_refresh_swaps_atomically_and_old_readers_keep_their_version(store):
+    old = store.get("readings", lambda: _columns(offset=0))
+    old_values = np.array(old["id"])
+    new = store.refresh("readings", lambda: _columns(n=7, offset=10))
+    assert new.version != old.version
+    # 古い版のディレクトリは消えているが、開いている mmap はそのまま読める
+    assert not os.path.exists(os.path.join(store.root, old.key, old.version))
+    np.testing.assert_array_equal(old["id"], old_values)
+    assert store.current("readings")["id"].tolist() == list(range(10, 17))
+    entries = sorted(e for e in os.listdir(os.path.join(store.root, new.key)) if not e.startswith("."))
+    assert entries == sorted(["CURRENT", new.version])
+
+
+def test_failed_build_keeps_the_current_version(store):
+    good = store.get("readings", lambda: _columns())
+    with pytest.raises(ValueError):
+        store.refresh("readings", lambda: {"id": np.arange(3), "value": np.arange(4)})
+    assert store.current("readings").version == good.version
+    assert not [e for e in os.listdir(os.path.join(store.root, good.key)) if e.startswith(".tmp-")]
+
+
+def test_max_age_rebuilds_stale_versions(store, monkeypatch):
+    first = store.get("readings", lambda: _columns(offset=0))
+    monkeypatch.setattr(dataset_store.time, "time", lambda: first.created + 100)
+    assert store.get("readings", lambda: _columns(offset=1), max_age=200) is first
+    rebuilt = store.get("readings", lambda: _columns(offset=1), max_age=50)
+    assert rebuilt["id"][0] == 1
+
+
+def test_concurrent_builds_run_once(tmp_path):
+    root = str(tmp_path / "datasets")
+    builds = []
+    results = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.2)
+        return _columns()
+
+    def worker():
+        # ワーカーごとに別のストア（プロセス間は flock で排他される）
+        results.append(DatasetStore(root=root).get("readings", build))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(builds) == 1
+    assert len({ds.version for ds in results}) == 1
+
+
+def test_busy_lock_raises_dataset_busy(store, monkeypatch):
+    monkeypatch.setattr(dataset_store, "BUILD_WAIT_SECONDS", 0.1)
+    key = dataset_store.dataset_key("readings", None, None)
+    with store._locked(key):
+        with pytest.raises(dataset_store.DatasetBusy) as busy:
+            DatasetStore(root=store.root).get("readings", _columns)
+    assert busy.value.code == 503
+
+
+def test_update_writes_a_new_version_or_keeps_the_current(store):
+    assert store.update("readings", lambda current: None) is None
+    first = store.update("readings", lambda current: (_columns(), {"cursor": [1, 2]}))
+    assert first.extra == {"cursor": [1, 2]}
+    assert store.update("readings", lambda current: None).version == first.version
+    seen = []
+
+    def append(current):
+        seen.append(current.version)
+        return {c: np.append(current[c], current[c][-1] + 1) for c in current.columns}, current.extra
+
+    second = store.update("readings", append)
+    assert seen == [first.version] and second.rows == first.rows + 1
+
+
+def test_evict_removes_least_recently_used_keys(tmp_path):
+    store = DatasetStore(root=str(tmp_path / "datasets"), max_bytes=1 << 30)
+    a = store.get("a", lambda: _columns(1000))
+    b = store.get("b", lambda: _columns(1000))
+    os.utime(os.path.join(store.root, a.key, "CURRENT"), (1, 1))
+    store.max_bytes = a.nbytes + b.nbytes - 1
+    assert store.evict() == 1
+    assert store.current("a") is None
+    assert store.current("b") is not None
+
+
+def test_from_records_converts_postgrest_json():
+    rows = [
+        {"id": 1, "ts": "2024-01-01T00:00:00Z", "value": 1.5, "label": "x"},
+        {"id": 2, "ts": "2024-01-01T00:00:01+00:00", "value": None, "label": None},
+    ]
+    cols = dataset_store.from_records(rows, dtypes={"ts": "datetime64[ms]"})
+    assert cols["id"].tolist() == [1, 2]
+    assert cols["ts"].dtype == np.dtype("datetime64[ms]")
+    assert cols["ts"][1] - cols["ts"][0] == np.timedelta64(1000, "ms")
+    assert np.isnan(cols["value"][1])
+    assert cols["label"].tolist() == ["x", ""]
+    assert dataset_store.from_records([], columns=["id"])["id"].tolist() == []
+
+
+def test_empty_dataset_round_trips(store):
+    ds = store.get("empty", lambda: {"id": np.array([], dtype=np.int64)})
+    assert ds.rows == 0 and ds["id"].dtype == np.int64
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+import dataset_store
+import dataset_sync
+import fake_supabase
+
+
+def _row(i, updated_at, value=None):
+    return {"id": i, "ts": f"2024-01-01T00:00:{i:02d}Z", "value": float(i) if value is None else value, "updated_at": updated_at}
+
+
+class _Table:
+    """PostgREST の代わりに fake_supabase の問い合わせ解釈で行を返し、受け取ったパラメータを記録する。"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def fetch(self, access_token, params):
+        self.requests.append(dict(params))
+        return fake_supabase._query(self.rows, list(params.items()))
+
+
+@pytest.fixture
+def table():
+    return _Table([_row(i, "2024-01-01T00:00:00Z") for i in range(1, 8)])
+
+
+@pytest.fixture
+def sync(table, tmp_path, monkeypatch):
+    store = dataset_store.DatasetStore(root=str(tmp_path / "datasets"))
+    sync = dataset_sync.TableSync(
+        "readings", "readings", columns=["id", "ts", "value"], key="id", cursor="updated_at",
+        order="ts", dtypes={"ts": "datetime64[ms]"}, interval=0, page_size=3, store=store,
+    )
+    monkeypatch.setattr(sync, "_fetch", table.fetch)
+    return sync
+
+
+def test_merge_upserts_by_key_and_keeps_order():
+    old = {"id": np.array([1, 2, 3]), "t": np.array([10, 20, 30]), "v": np.array([1.0, 2.0, 3.0])}
+    new = {"id": np.array([2, 4, 2]), "t": np.array([25, 15, 35]), "v": np.array([9.0, 4.0, 8.0])}
+    merged = dataset_sync.merge(old, new, key="id", order="t")
+    # id=2 は後に来た方（t=35）で上書きされ、t の位置に移る
+    assert merged["id"].tolist() == [1, 4, 3, 2]
+    assert merged["t"].tolist() == [10, 15, 30, 35]
+    assert merged["v"].tolist() == [1.0, 4.0, 3.0, 8.0]
+
+
+def test_merge_promotes_string_widths():
+    old = {"id": np.array([1]), "s": np.array(["a"])}
+    merged = dataset_sync.merge(old, {"id": np.array([2]), "s": np.array(["longer"])}, key="id")
+    assert merged["s"].tolist() == ["a", "longer"]
+
+
+def test_full_sync_pages_by_key_and_records_the_cursor(sync, table):
+    ds = sync.sync("token")
+    assert ds["id"].tolist() == list(range(1, 8))
+    assert ds.extra["cursor"] == ["2024-01-01T00:00:00Z", 7]
+    pages = [r for r in table.requests if r.get("order") == "id.asc"]
+    assert [p.get("id") for p in pages] == [None, "gt.3", "gt.6"]
+
+
+def test_incremental_keyset_resumes_after_the_last_key(sync, table):
+    sync.sync("token")
+    table.requests.clear()
+    # 同じ更新時刻の行が 1 ページを超えても取りこぼさない（ページは 1,8,9 / 10,11,12 / 空）
+    same = "2024-01-01T00:01:00.5Z"
+    table.rows += [_row(i, same) for i in range(8, 13)]
+    table.rows[0] = _row(1, same, value=100.0)
+    ds = sync.get("token")
+    assert ds["id"].tolist() == list(range(1, 13))
+    assert ds["value"][0] == 100.0
+    assert [r["or"] for r in table.requests] == [
+        '(updated_at.gt."2024-01-01T00:00:00Z",and(updated_at.eq."2024-01-01T00:00:00Z",id.gt."7"))',
+        f'(updated_at.gt."{same}",and(updated_at.eq."{same}",id.gt."9"))',
+        f'(updated_at.gt."{same}",and(updated_at.eq."{same}",id.gt."12"))',
+    ]
+    assert ds.extra["cursor"] == [same, 12]
+
+
+def test_incremental_without_changes_keeps_the_version(sync, table):
+    first = sync.sync("token")
+    table.requests.clear()
+    assert sync.sync("token").version == first.version
+    assert len(table.requests) == 1
+
+
+def test_get_within_interval_does_not_query(sync, table):
+    sync.interval = 60
+    sync.get("token")
+    table.requests.clear()
+    sync.get("token")
+    assert table.requests == []
+
+
+def test_full_interval_picks_up_deleted_rows(sync, table):
+    sync.sync("token")
+    del table.rows[2]
+    assert 3 in sync.sync("token")["id"].tolist()  # 差分では削除は分からない
+    sync.full_interval = -1
+    assert 3 not in sync.sync("token")["id"].tolist()
+
+
+def test_columns_must_include_key_and_order():
+    with pytest.raises(ValueError):
+        dataset_sync.TableSync("x", "t", columns=["value"], key="id")
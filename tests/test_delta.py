@@ -0,0 +1,131 @@
+import copy
+
+import flask
+import numpy as np
+import pytest
+from dash import Patch, no_update
+
+import delta
+
+
+def _apply(value, patch: Patch):
+    """ブラウザ（dash-renderer）と同じ順に Patch の操作を適用する。"""
+    value = copy.deepcopy(value)
+    for op in patch._operations:
+        *path, last = op["location"]
+        target = value
+        for key in path:
+            target = target[key]
+        if op["operation"] == "Assign":
+            target[last] = op["params"]["value"]
+        elif op["operation"] == "Delete":
+            del target[last]
+        elif op["operation"] == "Extend":
+            target[last].extend(op["params"]["value"])
+        else:
+            raise AssertionError(f"unexpected operation {op}")
+    return value
+
+
+def _ops(patch: Patch):
+    return [(op["operation"], op["location"]) for op in patch._operations]
+
+
+FIGURE = {
+    "data": [{"x": [1, 2, 3], "y": [10, 20, 30], "name": "a"}],
+    "layout": {"title": "t", "xaxis": {"range": [0, 3]}},
+}
+
+
+@pytest.mark.parametrize(
+    "new",
+    [
+        # 末尾への追加
+        {**FIGURE, "data": [{"x": [1, 2, 3, 4], "y": [10, 20, 30, 40], "name": "a"}]},
+        # 先頭を捨てて末尾に追加（表示点数が固定の系列）
+        {**FIGURE, "data": [{"x": [2, 3, 4], "y": [20, 30, 40], "name": "a"}]},
+        # キーの追加・削除・値の変更
+        {"data": FIGURE["data"], "layout": {"title": "u", "yaxis": {"type": "log"}}},
+        # 同じ長さのリストの要素の変更
+        {**FIGURE, "data": [{"x": [1, 2, 3], "y": [10, 25, 30], "name": "a"}]},
+        # 長さの違うリストは丸ごと置き換え
+        {**FIGURE, "data": [{"x": [9], "y": [1], "name": "a"}]},
+    ],
+)
+def test_patch_reproduces_the_new_value(new):
+    patch = delta.diff(FIGURE, new)
+    assert patch is not None
+    assert _apply(FIGURE, patch) == new
+
+
+def test_append_and_shift_are_single_operations():
+    appended = delta.diff({"y": list(range(1000))}, {"y": list(range(1005))})
+    assert _ops(appended) == [("Extend", ["y"])]
+    shifted = delta.diff({"y": list(range(1000))}, {"y": list(range(2, 1002))})
+    assert _ops(shifted) == [("Delete", ["y", 0]), ("Delete", ["y", 0]), ("Extend", ["y"])]
+
+
+def test_unchanged_value_has_no_operations():
+    patch = delta.diff(FIGURE, copy.deepcopy(FIGURE))
+    assert patch is not None and patch._operations == []
+
+
+def test_root_replacement_or_too_many_operations_returns_none():
+    assert delta.diff([1, 2], {"a": 1}) is None
+    many = {"y": list(range(100))}
+    assert delta.diff(many, {"y": [v * 2 for v in range(100)]}, max_operations=50) is None
+
+
+def test_plain_converts_numpy_and_tuples():
+    size = [0]
+    plain = delta._plain({"x": np.arange(3), "t": (1, (2, 3))}, size)
+    assert plain == {"x": [0, 1, 2], "t": [1, [2, 3]]}
+    assert type(plain["x"][0]) is int
+
+
+@pytest.fixture
+def request_ctx():
+    app = flask.Flask(__name__)
+    with app.test_request_context("/"):
+        flask.g.user = {"id": "u1"}
+        yield
+
+
+def test_send_full_then_patch_then_unchanged(request_ctx):
+    store = delta.DeltaStore()
+    first, token = delta.send("graph.figure", FIGURE, None, store)
+    assert first == FIGURE and set(token) == {"session", "version"}
+
+    grown = {**FIGURE, "data": [{"x": [1, 2, 3, 4], "y": [10, 20, 30, 40], "name": "a"}]}
+    patch, token2 = delta.send("graph.figure", grown, token, store)
+    assert isinstance(patch, Patch) and _apply(first, patch) == grown
+    assert token2["session"] == token["session"] and token2["version"] != token["version"]
+
+    assert delta.send("graph.figure", grown, token2, store) == (no_update, no_update)
+
+
+def test_send_falls_back_to_full_for_a_stale_version(request_ctx):
+    store = delta.DeltaStore()
+    _, token = delta.send("graph.figure", FIGURE, None, store)
+    _, newer = delta.send("graph.figure", {**FIGURE, "layout": {}}, token, store)
+    # 古い版を持ったタブ（応答の取りこぼし等）には全体を送る
+    value, _ = delta.send("graph.figure", FIGURE, token, store)
+    assert value == FIGURE and not isinstance(value, Patch)
+    # 別ユーザーは同じトークンを持っていても差分を受け取らない
+    flask.g.user = {"id": "u2"}
+    value, _ = delta.send("graph.figure", {**FIGURE, "layout": {"x": 1}}, newer, store)
+    assert not isinstance(value, Patch)
+
+
+def test_store_evicts_least_recently_used_within_the_byte_budget():
+    store = delta.DeltaStore(max_bytes=100)
+    store.put(("u", "s1", "k"), "v1", 1, 60)
+    store.put(("u", "s2", "k"), "v1", 2, 30)
+    store.get(("u", "s1", "k"))
+    store.put(("u", "s3", "k"), "v1", 3, 30)
+    assert store.get(("u", "s2", "k")) is None
+    assert store.get(("u", "s1", "k")) == ("v1", 1)
+    assert store.stats() == {"bytes": 90, "entries": 2}
+    # 覚えている版が base と違えば保存しない（同時更新の検出）
+    assert store.put(("u", "s1", "k"), "v2", 4, 10, base="other") is False
+    assert store.get(("u", "s1", "k")) == ("v1", 1)
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+import downsample
+
+
+@pytest.fixture
+def series():
+    rng = np.random.default_rng(0)
+    x = np.arange(100_000, dtype=np.float64)
+    y = rng.normal(size=len(x)).cumsum()
+    y[12_345] = 1e6  # スパイク
+    y[67_890] = -1e6
+    return x, y
+
+
+def test_minmax_keeps_bucket_extremes_and_spikes(series):
+    x, y = series
+    idx = downsample.minmax(x, y, 200)
+    assert len(idx) <= 200 + 2
+    assert (np.diff(idx) > 0).all()
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert {12_345, 67_890} <= set(idx.tolist())
+    # 各バケツの最小・最大は必ず残る
+    edges = np.linspace(x[0], x[-1], 101)
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        bucket = np.flatnonzero((x >= lo) & (x < hi))
+        assert bucket[np.argmin(y[bucket])] in idx and bucket[np.argmax(y[bucket])] in idx
+
+
+def test_minmax_vectorized_and_loop_paths_agree(series, monkeypatch):
+    x, y = series
+    y = y.copy()
+    y[500:700] = np.nan
+    vectorized = downsample.minmax(x, y, 2000)  # バケツあたり 100 点: reduceat の経路
+    monkeypatch.setattr(downsample, "LOOP_BUCKET_SIZE", 1)
+    looped = downsample.minmax(x, y, 2000)
+    np.testing.assert_array_equal(vectorized, looped)
+    assert not np.isnan(y[vectorized][(vectorized < 500) | (vectorized >= 700)]).any()
+
+
+def test_minmax_skips_empty_buckets():
+    x = np.concatenate([np.arange(0, 1000), np.arange(9000, 10000)]).astype(np.float64)
+    y = np.sin(x)
+    idx = downsample.minmax(x, y, 100)
+    assert len(idx) <= 102
+    assert (np.diff(idx) > 0).all()
+
+
+def test_lttb_returns_exactly_n_points_with_endpoints(series):
+    x, y = series
+    idx = downsample.lttb(x, y, 500)
+    assert len(idx) == 500
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert (np.diff(idx) > 0).all()
+    assert {12_345, 67_890} <= set(idx.tolist())
+
+
+@pytest.mark.parametrize("method", ["minmax", "lttb"])
+def test_small_inputs_are_returned_unchanged(method):
+    x = np.arange(10.0)
+    assert downsample.METHODS[method](x, x * 2, 100).tolist() == list(range(10))
+
+
+def test_downsample_range_includes_one_point_outside_on_each_side():
+    x = np.arange(1000.0)
+    xs, ys = downsample.downsample(x, x * 10, n_out=2000, method="minmax", x_range=(100.5, 200.5))
+    assert xs[0] == 100 and xs[-1] == 201
+    np.testing.assert_array_equal(ys, xs * 10)
+
+
+def test_downsample_datetime_range_from_relayout_strings():
+    x = np.arange("2024-01-01", "2024-01-11", dtype="datetime64[h]").astype("datetime64[ms]")
+    y = np.arange(len(x), dtype=np.float64)
+    xs, _ = downsample.downsample(x, y, n_out=1000, x_range=("2024-01-03 00:00:00", "2024-01-04 12:30:00.5"))
+    assert xs[0] == np.datetime64("2024-01-02T23:00")
+    assert xs[-1] == np.datetime64("2024-01-04T13:00")
+
+
+def test_unsorted_x_is_rejected():
+    with pytest.raises(ValueError):
+        downsample.downsample([3, 1, 2], [1, 2, 3])
+
+
+@pytest.mark.parametrize(
+    "relayout, expected",
+    [
+        (None, None),
+        ({"xaxis.autorange": True}, None),
+        ({"xaxis.range": [1, 2]}, (1, 2)),
+        ({"xaxis.range[0]": 1, "xaxis.range[1]": 2}, (1, 2)),
+        ({"yaxis.range[0]": 1, "yaxis.range[1]": 2}, None),
+    ],
+)
+def test_visible_range(relayout, expected):
+    assert downsample.visible_range(relayout) == expected
+
+
+def test_changes_range_ignores_y_zoom_and_autosize():
+    assert downsample.changes_range(None)
+    assert downsample.changes_range({"xaxis.range[0]": 1, "xaxis.range[1]": 2})
+    assert downsample.changes_range({"xaxis.autorange": True})
+    assert not downsample.changes_range({"yaxis.range[0]": 1, "yaxis.range[1]": 2})
+    assert not downsample.changes_range({"autosize": True})
+
+
+def test_resampled_figure_keeps_trace_attributes_and_uirevision():
+    x = np.arange(10_000.0)
+    fig = downsample.resampled_figure(
+        [{"x": x, "y": np.sin(x), "name": "s", "mode": "markers"}], {"xaxis.range": [0, 5000]}, n_out=100,
+        layout={"title": "t"}, uirevision="g",
+    )
+    trace = fig["data"][0]
+    assert trace["name"] == "s" and trace["mode"] == "markers" and trace["type"] == "scattergl"
+    assert len(trace["x"]) <= 102 and trace["x"][-1] <= 5001
+    assert fig["layout"] == {"uirevision": "g", "title": "t"}
+
+
+def test_register_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        downsample.register(object(), "g", lambda: [], method="mean")
@@ -0,0 +1,139 @@
+import sqlite3
+
+import flask
+import pytest
+
+import rate_limit
+
+
+class _Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return rate_limit.MemoryBackend()
+    return rate_limit.SQLiteBackend(str(tmp_path / "buckets.sqlite3"))
+
+
+def test_rate_spec():
+    rate = rate_limit.Rate("10/60")
+    assert rate.capacity == 10
+    assert rate.per_second == pytest.approx(10 / 60)
+    assert rate.full_after == pytest.approx(60)
+
+
+def test_bucket_allows_burst_then_refills(backend, clock):
+    rate = rate_limit.Rate("3/3")  # 1 秒に 1 トークン、バースト 3
+    assert [backend.consume("k", rate) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.consume("k", rate) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert backend.consume("k", rate) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert backend.consume("k", rate) == 0.0
+
+
+def test_keys_are_independent(backend, clock):
+    rate = rate_limit.Rate("1/60")
+    assert backend.consume("a", rate) == 0.0
+    assert backend.consume("a", rate) > 0
+    assert backend.consume("b", rate) == 0.0
+
+
+def test_sqlite_buckets_are_shared_between_connections(tmp_path, clock):
+    path = str(tmp_path / "buckets.sqlite3")
+    rate = rate_limit.Rate("2/60")
+    first, second = rate_limit.SQLiteBackend(path), rate_limit.SQLiteBackend(path)
+    assert first.consume("k", rate) == 0.0
+    assert second.consume("k", rate) == 0.0
+    assert first.consume("k", rate) > 0
+
+
+def test_sqlite_prunes_refilled_buckets(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / "buckets.sqlite3")
+    backend = rate_limit.SQLiteBackend(path)
+    rate = rate_limit.Rate("2/1")
+    monkeypatch.setattr(rate_limit, "SQLITE_PRUNE_EVERY", 0)
+    for i in range(20):
+        backend.consume(f"ip:{i}", rate)
+    monkeypatch.setattr(rate_limit, "SQLITE_PRUNE_EVERY", 1)
+    clock.now += 0.5
+    backend.consume("ip:0", rate)  # 回復しきっていない行は残す
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM buckets").fetchone()[0] == 20
+    clock.now += 1.0
+    backend.consume("ip:new", rate)
+    keys = [row[0] for row in sqlite3.connect(path).execute("SELECT key FROM buckets")]
+    assert sorted(keys) == ["ip:0", "ip:new"]
+
+
+def test_sqlite_errors_fall_back_to_memory(tmp_path, clock, monkeypatch):
+    backend = rate_limit.SQLiteBackend(str(tmp_path / "buckets.sqlite3"))
+
+    def broken(key, rate):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(backend, "_consume", broken)
+    rate = rate_limit.Rate("1/60")
+    before = rate_limit.BACKEND_ERRORS.value()
+    assert backend.consume("k", rate) == 0.0
+    assert backend.consume("k", rate) > 0  # 全て許可にはしない
+    assert rate_limit.BACKEND_ERRORS.value() == before + 2
+
+
+def _app():
+    app = flask.Flask(__name__)
+
+    @app.route("/auth/login")
+    def login():
+        return "ok"
+
+    @app.route("/other")
+    def other():
+        return "ok"
+
+    return app
+
+
+def test_init_app_returns_429_per_client_ip(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit, "LIMITER", rate_limit.MemoryBackend())
+    monkeypatch.setattr(rate_limit, "PER_IP_RATE", "2/60")
+    monkeypatch.setattr(rate_limit, "GLOBAL_RATE", "100/60")
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXY_HOPS", 1)
+    app = _app()
+    rate_limit.init_app(app, ["/auth/login"])
+    client = app.test_client()
+
+    def login(ip: str):
+        # 左側はクライアントが詐称できる値。右端（プロキシが付けた値）でクライアントを決める
+        return client.get("/auth/login", headers={"X-Forwarded-For": f"6.6.6.6, {ip}"})
+
+    assert [login("1.1.1.1").status_code for _ in range(2)] == [200, 200]
+    limited = login("1.1.1.1")
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert login("2.2.2.2").status_code == 200
+    assert all(client.get("/other").status_code == 200 for _ in range(5))
+
+
+def test_decisions_use_ip_and_global_scopes(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit, "LIMITER", rate_limit.MemoryBackend())
+    app = _app()
+    with app.test_request_context("/auth/login", environ_base={"REMOTE_ADDR": "3.3.3.3"}):
+        per_ip, global_rate = rate_limit.Rate("5/60"), rate_limit.Rate("1/60")
+        assert rate_limit.check("/t", per_ip, global_rate) is None
+        assert rate_limit.check("/t", per_ip, global_rate) > 0
+    assert rate_limit.DECISIONS.value(route="/t", scope="ip", result="allowed") == 2
+    assert rate_limit.DECISIONS.value(route="/t", scope="global", result="allowed") == 1
+    assert rate_limit.DECISIONS.value(route="/t", scope="global", result="limited") == 1
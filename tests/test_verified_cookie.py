@@ -0,0 +1,85 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+import verified_cookie
+
+SECRET = "s" * 32
+USER = {"id": "u1", "email": "u1@example.com", "role": "authenticated", "user_metadata": {"avatar": "x" * 100}}
+
+
+def _jwt(exp: int) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"sub": "u1", "exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def _payload(cookie: str) -> dict:
+    return json.loads(verified_cookie._b64decode(cookie.partition(".")[0]))
+
+
+def test_round_trip_returns_only_the_user_fields():
+    token = _jwt(int(time.time()) + 3600)
+    cookie = verified_cookie.sign(SECRET, token, USER, ttl=60)
+    assert verified_cookie.verify(SECRET, cookie, token) == {
+        "id": "u1",
+        "email": "u1@example.com",
+        "role": "authenticated",
+    }
+
+
+def test_tampered_payload_is_rejected():
+    token = _jwt(int(time.time()) + 3600)
+    body, _, mac = verified_cookie.sign(SECRET, token, USER, ttl=60).partition(".")
+    payload = json.loads(verified_cookie._b64decode(body))
+    payload["u"]["app_metadata"] = {"role": "admin"}
+    forged = verified_cookie._b64encode(json.dumps(payload).encode()) + "." + mac
+    assert verified_cookie.verify(SECRET, forged, token) is None
+
+
+def test_other_key_or_other_token_is_rejected():
+    token = _jwt(int(time.time()) + 3600)
+    cookie = verified_cookie.sign(SECRET, token, USER, ttl=60)
+    assert verified_cookie.verify("t" * 32, cookie, token) is None
+    assert verified_cookie.verify(SECRET, cookie, _jwt(int(time.time()) + 7200)) is None
+
+
+@pytest.mark.parametrize("cookie", [None, "", "no-dot", "a.b", "!!!.???"])
+def test_malformed_cookie_is_rejected(cookie):
+    assert verified_cookie.verify(SECRET, cookie, _jwt(int(time.time()) + 3600)) is None
+
+
+def test_expiry_is_clamped_to_the_token_exp():
+    exp = int(time.time()) + 10
+    cookie = verified_cookie.sign(SECRET, _jwt(exp), USER, ttl=3600)
+    assert _payload(cookie)["exp"] == exp
+
+
+def test_expired_cookie_is_rejected(monkeypatch):
+    token = _jwt(int(time.time()) + 3600)
+    cookie = verified_cookie.sign(SECRET, token, USER, ttl=60)
+    later = time.time() + 61
+    monkeypatch.setattr(verified_cookie.time, "time", lambda: later)
+    assert verified_cookie.verify(SECRET, cookie, token) is None
+
+
+def test_opaque_token_uses_the_ttl():
+    before = int(time.time())
+    cookie = verified_cookie.sign(SECRET, "not-a-jwt", USER, ttl=60)
+    assert before + 60 <= _payload(cookie)["exp"] <= int(time.time()) + 60
+
+
+@pytest.mark.parametrize("secret", ["", "change-me", "  "])
+def test_weak_secret_neither_signs_nor_verifies(secret):
+    token = _jwt(int(time.time()) + 3600)
+    with pytest.raises(ValueError):
+        verified_cookie.sign(secret, token, USER, ttl=60)
+    # 既定値の鍵で誰かが署名した Cookie も受け入れない
+    forged_body = verified_cookie._b64encode(
+        json.dumps({"h": verified_cookie.token_hash(token), "exp": time.time() + 60, "u": {"id": "x"}}).encode()
+    )
+    mac = hmac.new(verified_cookie._key(secret), forged_body.encode(), hashlib.sha256).digest()
+    assert verified_cookie.verify(secret, f"{forged_body}.{verified_cookie._b64encode(mac)}", token) is None
@@ -0,0 +1,50 @@
+import gc
+import sys
+
+import pytest
+
+import worker_state
+
+
+@pytest.fixture
+def hooks(monkeypatch):
+    registered = []
+    monkeypatch.setattr(worker_state, "_post_fork_hooks", registered)
+    return registered
+
+
+def test_post_fork_hooks_run_in_registration_order(hooks):
+    calls = []
+
+    @worker_state.on_post_fork
+    def first():
+        calls.append("first")
+
+    @worker_state.on_post_fork
+    def second():
+        calls.append("second")
+
+    assert first is hooks[0]  # デコレータは関数をそのまま返す
+    worker_state.run_post_fork_hooks()
+    worker_state.run_post_fork_hooks()
+    assert calls == ["first", "second", "first", "second"]
+
+
+def test_freeze_for_fork_moves_objects_to_the_permanent_generation():
+    try:
+        worker_state.freeze_for_fork()
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="smaps_rollup is Linux only")
+def test_memory_usage_reports_rss_pss_uss():
+    usage = worker_state.memory_usage()
+    assert set(usage) == {"rss", "pss", "uss"}
+    assert usage["rss"] >= usage["pss"] >= usage["uss"] > 0
+
+
+def test_format_memory():
+    assert worker_state.format_memory({}) == "n/a"
+    assert worker_state.format_memory({"rss": 3 * 1024 * 1024, "uss": 512 * 1024}) == "rss=3.0MiB uss=0.5MiB"
@@ -0,0 +1,98 @@
+"""本番トラフィックのメタデータを JSONL に記録する（replay_traffic.py で再生する）。
+
+TRAFFIC_RECORD_PATH を設定したときだけ有効。トークン・Cookie・クエリ文字列・
+コールバックの入力値は記録せず、ユーザーはソルト付きハッシュで匿名化する。
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import List, Optional
+
+import flask
+
+RECORD_PATH = os.environ.get("TRAFFIC_RECORD_PATH", "")
+SAMPLE_RATE = float(os.environ.get("TRAFFIC_RECORD_SAMPLE", "1.0"))
+# ユーザー ID の匿名化用（再起動をまたいで同じユーザーを同じ値にしたい場合は固定する）
+_SALT = os.environ.get("TRAFFIC_RECORD_SALT") or os.urandom(16).hex()
+
+_lock = threading.Lock()
+_fd: Optional[int] = None
+
+
+def _write(line: str) -> None:
+    global _fd
+    data = (line + "\n").encode("utf-8")
+    with _lock:
+        if _fd is None:
+            # O_APPEND の 1 回の write で 1 行を書くので、複数ワーカーが同じファイルに追記できる
+            _fd = os.open(RECORD_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        os.write(_fd, data)
+
+
+def _shape(items) -> List:
+    """Dash の inputs/state から値を落とし、id と property だけ残す。"""
+    out: List = []
+    for item in items or []:
+        if isinstance(item, list):
+            out.append(_shape(item))
+        elif isinstance(item, dict):
+            out.append({"id": item.get("id"), "property": item.get("property")})
+    return out
+
+
+def anonymize_user(user) -> Optional[str]:
+    if not user or not user.get("id"):
+        return None
+    return hashlib.sha256(f"{_SALT}:{user['id']}".encode("utf-8")).hexdigest()[:16]
+
+
+def build_entry(resp, duration: float) -> dict:
+    req = flask.request
+    rule = req.url_rule.rule if req.url_rule is not None else None
+    entry = {
+        "ts": time.time(),
+        "method": req.method,
+        # パスに ID 等を含むルートはルール名だけを残す
+        "route": rule or req.path,
+        "path": req.path if not req.view_args else (rule or req.path),
+        "status": resp.status_code,
+        "duration_ms": round(duration * 1000, 2),
+        "request_bytes": req.content_length or 0,
+        "response_bytes": resp.content_length or 0,
+        "user": anonymize_user(flask.g.get("user")),
+    }
+    if req.path.endswith("/_dash-update-component"):
+        body = req.get_json(silent=True) or {}
+        entry["callback"] = body.get("output")
+        entry["dash"] = {
+            "output": body.get("output"),
+            "outputs": body.get("outputs"),
+            "inputs": _shape(body.get("inputs")),
+            "state": _shape(body.get("state")),
+            "changedPropIds": body.get("changedPropIds", []),
+        }
+    return entry
+
+
+def init_app(app: flask.Flask) -> None:
+    if not RECORD_PATH:
+        return
+
+    def _start():
+        flask.g.traffic_started = time.perf_counter()
+
+    def _record(resp):
+        started = flask.g.get("traffic_started")
+        if started is None or random.random() >= SAMPLE_RATE:
+            return resp
+        try:
+            _write(json.dumps(build_entry(resp, time.perf_counter() - started)))
+        except Exception as exc:  # 記録の失敗でリクエストを落とさない
+            print(f"[TRAFFIC] record failed: {exc}")
+        return resp
+
+    app.before_request_funcs.setdefault(None, []).insert(0, _start)
+    app.after_request(_record)
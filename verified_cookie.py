@@ -0,0 +1,82 @@
+"""アクセストークン検証済みであることを示す HMAC 署名付き Cookie（sidecar）。
+
+/auth/v1/user で検証できたら「トークンのハッシュ・有効期限・最小限のユーザー情報」を
+app.secret_key で署名して返す。以降のリクエストは HMAC を 1 回確認するだけで、
+どのワーカーでも上流に問い合わせずに通せる。トークンが変わるか期限が切れると無効になる。
+
+鍵が未設定・既定値（settings.DEFAULT_SECRET_KEY）のときは誰でも署名できてしまうので、
+発行も受け入れもしない。
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+
+import settings
+
+# Cookie に載せるユーザー情報（サイズを抑えるため user_metadata 等は載せない）
+USER_FIELDS = ("id", "aud", "role", "email", "app_metadata")
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _key(secret: str) -> bytes:
+    # Flask セッションとは別用途の鍵にする
+    return hashlib.sha256(b"verified-cookie:" + secret.encode("utf-8")).digest()
+
+
+def token_hash(access_token: str) -> str:
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()[:32]
+
+
+def token_expiry(access_token: str) -> Optional[int]:
+    """JWT の exp を読む（署名の検証は上流で済んでいる前提）。"""
+    try:
+        payload = json.loads(_b64decode(access_token.split(".")[1]))
+        return int(payload["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+def sign(secret: str, access_token: str, user: dict, ttl: int) -> str:
+    if not settings.secret_key_configured(secret):
+        raise ValueError("refusing to sign a verified cookie without a configured SECRET_KEY")
+    verified_until = int(time.time()) + ttl
+    exp = token_expiry(access_token)
+    if exp is not None:
+        verified_until = min(verified_until, exp)
+    payload = {
+        "h": token_hash(access_token),
+        "exp": verified_until,
+        "u": {k: user[k] for k in USER_FIELDS if k in user},
+    }
+    body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+    mac = hmac.new(_key(secret), body.encode("ascii"), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(mac)}"
+
+
+def verify(secret: str, cookie: Optional[str], access_token: str) -> Optional[dict]:
+    """署名・期限・トークンの一致を確認し、ユーザー情報を返す。不一致なら None。"""
+    if not cookie or "." not in cookie or not settings.secret_key_configured(secret):
+        return None
+    body, _, mac = cookie.partition(".")
+    try:
+        expected = hmac.new(_key(secret), body.encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(_b64decode(mac), expected):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        return None
+    if payload.get("exp", 0) <= time.time():
+        return None
+    if not hmac.compare_digest(str(payload.get("h", "")), token_hash(access_token)):
+        return None
+    return payload.get("u") or None
@@ -0,0 +1,58 @@
+"""gunicorn の fork 前後で扱うプロセス単位の状態（post_fork フック・メモリ計測）。"""
+import gc
+import random
+from typing import Callable, Dict, List
+
+_post_fork_hooks: List[Callable[[], None]] = []
+
+
+def on_post_fork(func: Callable[[], None]) -> Callable[[], None]:
+    """fork 後のワーカーで作り直す状態（HTTP プール、キャッシュ等）のリセット関数を登録する。"""
+    _post_fork_hooks.append(func)
+    return func
+
+
+def run_post_fork_hooks() -> None:
+    for hook in _post_fork_hooks:
+        hook()
+
+
+def freeze_for_fork() -> None:
+    """master で構築済みのオブジェクトを GC 対象外にし、fork 後も CoW でページを共有させる。
+
+    GC が参照カウント以外のヘッダを書き換えるとページがコピーされてしまうため、
+    fork 直前に gc.freeze() で permanent generation に移しておく。
+    """
+    gc.collect()
+    gc.freeze()
+
+
+def memory_usage() -> Dict[str, int]:
+    """/proc/self/smaps_rollup から RSS / PSS / USS(固有メモリ) をバイト単位で返す。"""
+    fields = {"Rss": 0, "Pss": 0, "Private_Clean": 0, "Private_Dirty": 0}
+    try:
+        with open("/proc/self/smaps_rollup", encoding="ascii") as fh:
+            for line in fh:
+                key, _, rest = line.partition(":")
+                if key in fields:
+                    fields[key] = int(rest.split()[0]) * 1024
+    except OSError:
+        # Linux 以外（ローカルの macOS / Windows 等）では計測しない
+        return {}
+    return {
+        "rss": fields["Rss"],
+        "pss": fields["Pss"],
+        "uss": fields["Private_Clean"] + fields["Private_Dirty"],
+    }
+
+
+def format_memory(usage: Dict[str, int]) -> str:
+    if not usage:
+        return "n/a"
+    return " ".join(f"{k}={v / (1024 * 1024):.1f}MiB" for k, v in usage.items())
+
+
+@on_post_fork
+def _reseed_random() -> None:
+    # master の乱数状態を全ワーカーが引き継がないように再シードする
+    random.seed()